@@ -0,0 +1,68 @@
+"""
+Sequential vs concurrent per-file AI review against the local stub server.
+
+    python -m Benchmarks.bench_ai_fanout --files 40 --latency 0.3 --error-rate 0.1
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from Benchmarks.stub_openai_server import start_stub_server
+
+
+def _file_input(index: int) -> dict:
+    return {
+        "title": "Bench PR",
+        "source_branch": "feature",
+        "target_branch": "main",
+        "files_changed": 1,
+        "files": [{"file_name": f"/src/Component{index}.jsx",
+                   "new_code": f"0001: export const value{index} = {index};"}]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(latency=args.latency, error_rate=args.error_rate)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    os.environ.setdefault("AI_RETRY_BASE_DELAY", "0.05")
+    # both passes send identical inputs – measure the model path, not the cache
+    os.environ["REVIEW_CACHE_ENABLED"] = "false"
+
+    # Import after the env is set so the module-level clients pick it up
+    from Services.ai_review_service import analyze_pr_with_ai_async, review_files_concurrently, AI_REVIEW_CONCURRENCY
+
+    async def _review_sequentially(ai_inputs: list) -> list:
+        return [await analyze_pr_with_ai_async(ai_input) for ai_input in ai_inputs]
+
+    inputs = [_file_input(i) for i in range(args.files)]
+
+    start = time.perf_counter()
+    sequential = asyncio.run(_review_sequentially(inputs))
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    concurrent = asyncio.run(review_files_concurrently(inputs))
+    concurrent_time = time.perf_counter() - start
+    server.shutdown()
+
+    in_order = [r.get("filePath") for r in concurrent] == [i["files"][0]["file_name"] for i in inputs]
+    failed = sum(1 for r in concurrent if "error" in r)
+
+    print(f"files={args.files} latency={args.latency}s error-rate={args.error_rate} "
+          f"concurrency={AI_REVIEW_CONCURRENCY}")
+    print(f"  sequential : {sequential_time:7.2f} s ({sum(1 for r in sequential if 'error' in r)} failed)")
+    print(f"  concurrent : {concurrent_time:7.2f} s ({failed} failed, in order: {in_order})")
+    print(f"  stub saw {server.RequestHandlerClass.stats['requests']} requests, "
+          f"{server.RequestHandlerClass.stats['errors']} injected errors")
+
+
+if __name__ == "__main__":
+    main()
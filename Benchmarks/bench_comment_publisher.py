@@ -0,0 +1,66 @@
+"""
+Publish a PR's review comments twice against the mock Azure DevOps server.
+The second run must post nothing (dedup), and injected 429s must be absorbed.
+
+    python -m Benchmarks.bench_comment_publisher --files 20 --comments 5 --throttle-every 7
+"""
+import argparse
+import os
+import sys
+import time
+
+from Benchmarks.mock_azure_server import start_mock_azure_server
+
+
+def _review(file_index: int, comments: int) -> dict:
+    return {
+        "filePath": f"/src/Component{file_index}.jsx",
+        "comments": [
+            {"line_number": n + 1, "line_hint": f"value{n}", "comment": f"Comment {n} on file {file_index}"}
+            for n in range(comments)
+        ]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--comments", type=int, default=5)
+    parser.add_argument("--throttle-every", type=int, default=7)
+    args = parser.parse_args()
+
+    server, state, base_url = start_mock_azure_server(throttle_every=args.throttle_every)
+    os.environ.update({"AZURE_BASE_URL": base_url, "AZURE_ORG": "org", "AZURE_PROJECT": "proj",
+                       "AZURE_REPO_ID": "repo", "AZURE_PAT": "pat"})
+
+    # Import after the env is set so module-level settings pick it up
+    from Services.azure_pr_comment_service import post_review_comments
+
+    reviews = [_review(i, args.comments) for i in range(args.files)]
+    expected = args.files * args.comments
+
+    start = time.perf_counter()
+    first = post_review_comments(1, reviews)
+    first_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    second = post_review_comments(1, reviews)
+    second_time = time.perf_counter() - start
+    server.shutdown()
+
+    posted_first = sum(1 for r in first for c in r["results"] if c["status"].startswith("✅"))
+    skipped_second = sum(r["skipped_duplicates"] for r in second)
+
+    print(f"comments={expected} throttle-every={args.throttle_every}")
+    print(f"  first run : {posted_first}/{expected} posted in {first_time:.2f}s")
+    print(f"  second run: {skipped_second}/{expected} skipped as duplicates in {second_time:.2f}s")
+    print(f"  mock saw {state.stats['requests']} requests, {state.stats['throttled']} throttled, "
+          f"{state.stats['threads_posted']} threads stored")
+
+    ok = posted_first == expected and skipped_second == expected and state.stats["threads_posted"] == expected
+    print("✅ OK" if ok else "❌ Mismatch")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Model-layer degradation benchmark against the stub server: per-PR AI review
+latency and outcome when requests stall or the primary model is down, with
+and without hedging, fallback models and the review budget.
+
+    python -m Benchmarks.bench_degradation --prs 200 --concurrency 16 --latency 0.3 \\
+        --stall-rate 0.05 --stall-seconds 8 --output bench_degradation.json
+
+Each scenario runs in a fresh interpreter, configured through the same
+environment variables as the service.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from Benchmarks.bench_review_pipeline import _distribution
+from Benchmarks.stub_openai_server import start_stub_server
+
+PRIMARY, FALLBACK = "gpt-4o-mini", "gpt-4.1-nano"
+
+# name → (stub faults, service env)
+SCENARIOS = {
+    "healthy": ({}, {"AI_HEDGE_AFTER": "0"}),
+    "stalls": ({"stall": True}, {"AI_HEDGE_AFTER": "0"}),
+    "stalls+hedge": ({"stall": True}, {"AI_HEDGE_AFTER": "{hedge_after}"}),
+    "outage": ({"failing": [PRIMARY]}, {"AI_HEDGE_AFTER": "0"}),
+    "outage+fallback": ({"failing": [PRIMARY]}, {"AI_HEDGE_AFTER": "0", "AI_FALLBACK_MODELS": FALLBACK}),
+    "stalls+budget": ({"stall": True}, {"AI_HEDGE_AFTER": "0", "AI_REVIEW_BUDGET_SECONDS": "{budget}"}),
+}
+
+
+def _pr_input(index: int) -> dict:
+    return {
+        "title": f"Bench PR {index}",
+        "source_branch": f"pr-{index}",
+        "target_branch": "main",
+        "files_changed": 1,
+        "files": [{"file_name": f"/src/Component{index}.jsx",
+                   "new_code": f"0001: export const value{index} = props.items.map((item) => item.id);"}]
+    }
+
+
+async def _review_prs(prs: int, concurrency: int) -> dict:
+    from Services.ai_review_service import review_files_packed
+    from Services.model_router_service import model_health
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, outcomes = [], {"reviewed": 0, "fallback": 0, "failed": 0, "budget_exhausted": 0}
+
+    async def _one(index: int):
+        async with semaphore:
+            started = time.perf_counter()
+            review = (await review_files_packed(_pr_input(index)))[0]
+            latencies.append(time.perf_counter() - started)
+        if review.get("budget_exhausted"):
+            outcomes["budget_exhausted"] += 1
+        elif "error" in review:
+            outcomes["failed"] += 1
+        elif review.get("fallback_model"):
+            outcomes["fallback"] += 1
+        else:
+            outcomes["reviewed"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_one(index) for index in range(prs)))
+    return {"wall_seconds": round(time.perf_counter() - started, 4), "latency_seconds": _distribution(latencies),
+            **outcomes, "circuits": model_health(PRIMARY)}
+
+
+def _run_scenario(args):
+    """Child process: stub + service configured for one scenario; prints the result as JSON."""
+    faults, _ = SCENARIOS[args.run_scenario]
+    server, base_url = start_stub_server(
+        latency=args.latency, jitter=args.jitter,
+        stall_rate=args.stall_rate if faults.get("stall") else 0.0, stall_seconds=args.stall_seconds,
+        failing_models=faults.get("failing", ())
+    )
+    os.environ.update({"OPENAI_BASE_URL": base_url, "OPENAI_API_KEY": "stub", "OPENAI_MODEL": PRIMARY})
+    result = asyncio.run(_review_prs(args.prs, args.concurrency))
+    stats = server.RequestHandlerClass.stats
+    result["stub_requests"] = stats.get("models", {})
+    result["stub_stalls"] = stats.get("stalls", 0)
+    server.shutdown()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prs", type=int, default=200, help="single-file PRs reviewed per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="PRs reviewed at once")
+    parser.add_argument("--latency", type=float, default=0.3, help="stub model latency (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--stall-rate", type=float, default=0.05, help="fraction of requests that stall")
+    parser.add_argument("--stall-seconds", type=float, default=8.0)
+    parser.add_argument("--hedge-after", type=float, default=1.0, help="AI_HEDGE_AFTER for the hedged scenario")
+    parser.add_argument("--budget", type=float, default=3.0, help="AI_REVIEW_BUDGET_SECONDS for the budget scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--run-scenario", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        _run_scenario(args)
+        return
+
+    results = {}
+    for name in [s for s in args.scenarios.split(",") if s]:
+        _, env = SCENARIOS[name]
+        env = {key: value.format(hedge_after=args.hedge_after, budget=args.budget) for key, value in env.items()}
+        child_env = {**os.environ, "REVIEW_CACHE_ENABLED": "false", "AI_RETRY_BASE_DELAY": "0.05",
+                     "AI_REQUESTS_PER_MINUTE": "100000", "AI_TOKENS_PER_MINUTE": "100000000",
+                     "AI_REVIEW_CONCURRENCY": str(args.concurrency), **env}
+        child_args = [f"--{key.replace('_', '-')}={value}" for key, value in vars(args).items()
+                      if key not in ("scenarios", "output", "run_scenario")]
+        completed = subprocess.run([sys.executable, "-m", "Benchmarks.bench_degradation", *child_args,
+                                    "--run-scenario", name], env=child_env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"❌ {name} failed -->\n{completed.stderr[-2000:]}")
+            continue
+        results[name] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    print(f"prs={args.prs} concurrency={args.concurrency} latency={args.latency}s "
+          f"stalls={args.stall_rate:.0%}×{args.stall_seconds}s")
+    print(f"{'':<17}{'p50':>8}{'p95':>8}{'max':>8}{'ok':>6}{'fallbk':>8}{'failed':>8}{'budget':>8}{'stalls':>8}  requests")
+    for name, r in results.items():
+        latency = r["latency_seconds"]
+        print(f"{name:<17}{latency['p50']:>7.2f}s{latency['p95']:>7.2f}s{latency['max']:>7.2f}s{r['reviewed']:>6}"
+              f"{r['fallback']:>8}{r['failed']:>8}{r['budget_exhausted']:>8}{r['stub_stalls']:>8}  {r['stub_requests']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "degradation", "config": {k: v for k, v in vars(args).items()
+                                                              if k not in ("output", "run_scenario")},
+                       "scenarios": results}, f, indent=2)
+        print(f"📝 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Fetch-stage benchmark: the "full" mirror fetch (every branch, whole history)
+against the "partial" strategy (blobless, depth-limited fetch of the PR's two
+branches + one batched blob fetch for the changed files), on a synthetic
+repository with deep history and many branches.
+
+    python -m Benchmarks.bench_fetch --files 200 --history 400 --branches 1000 --pr-files 10 --behind 20
+
+For each strategy: cold fetch (empty mirror) → ready-to-diff, the diff
+itself, a warm fetch after one more push to the PR branch, and the mirror's
+size on disk. Both strategies must produce the same diff.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from Benchmarks.synthetic_repo import create_synthetic_repo, add_feature_branch, add_history, _git
+from Services.repo_cache_service import sync_mirror, sync_pr_refs, hydrate_paths, run_git, _dir_size_bytes
+from Services.diff_parser_service import diff_files
+
+REPO_ID = "bench"
+
+
+def _build_origin(args, origin: str) -> dict:
+    repo = create_synthetic_repo(origin, file_count=args.files, lines_per_file=args.lines, changes_per_file=3)
+    add_history(origin, repo["files"], commits=args.history, branches=args.branches, seed=1)
+    add_feature_branch(origin, "pr", repo["files"][:args.pr_files], changes_per_file=args.changes, seed=2)
+    # main moves on after the PR branched off, so the merge base is `behind` commits below its tip
+    if args.behind:
+        add_history(origin, repo["files"][args.pr_files:], commits=args.behind, branches=0, seed=3)
+    # what partial clone needs from the server (Azure Repos serves both)
+    _git(origin, "config", "uploadpack.allowFilter", "true")
+    _git(origin, "config", "uploadpack.allowAnySHA1InWant", "true")
+    return repo
+
+
+def _push_to_pr(origin: str, rel_path: str, round_no: str):
+    _git(origin, "checkout", "--quiet", "pr")
+    with open(os.path.join(origin, rel_path), "a", encoding="utf-8") as f:
+        f.write(f"// follow-up push {round_no}\n")
+    _git(origin, "commit", "--quiet", "-am", f"follow-up {round_no}")
+    _git(origin, "checkout", "--quiet", "main")
+
+
+def _fetch(strategy: str, url: str) -> str:
+    if strategy == "partial":
+        return sync_pr_refs(url, REPO_ID, "pr", "main")
+    return sync_mirror(url, REPO_ID)
+
+
+def _cold_run(strategy: str, url: str, work_dir: str) -> dict:
+    """Empty mirror → fetched, blobs hydrated and diffed."""
+    os.makedirs(work_dir)
+    os.chdir(work_dir)   # the mirror lives under ./local_repo
+
+    started = time.perf_counter()
+    mirror = _fetch(strategy, url)
+    fetched = time.perf_counter()
+    changed = run_git(["-C", mirror, "diff", "--name-only", "origin/main", "origin/pr"]).stdout.split()
+    blobs = hydrate_paths(mirror, "origin/main", "origin/pr", changed)
+    ready = time.perf_counter()
+    diffs = diff_files(mirror, "origin/main", "origin/pr", changed)
+    diffed = time.perf_counter()
+
+    return {
+        "strategy": strategy,
+        "cold_fetch_seconds": round(fetched - started, 4),
+        "cold_ready_seconds": round(ready - started, 4),
+        "diff_seconds": round(diffed - ready, 4),
+        "blobs_hydrated": blobs,
+        "changed_files": len(changed),
+        "mirror_mb": round(_dir_size_bytes(mirror) / (1024 * 1024), 2),
+        "refs": len(run_git(["-C", mirror, "for-each-ref", "refs/remotes"]).stdout.splitlines()),
+        "shallow": os.path.exists(os.path.join(mirror, "shallow")),
+        # compared across strategies, then dropped
+        "diff": {path: diff.numbered_new_code() for path, diff in diffs.items()},
+        "_mirror": mirror,
+        "_changed": changed
+    }
+
+
+def _warm_runs(result: dict, url: str, origin: str, rel_path: str, runs: int):
+    """One more push to the PR branch, then fetch + hydrate again; best of `runs`."""
+    os.chdir(os.path.dirname(os.path.dirname(os.path.dirname(result["_mirror"]))))
+    timings = []
+    for round_no in range(runs):
+        _push_to_pr(origin, rel_path, f"{result['strategy']}-{round_no}")
+        started = time.perf_counter()
+        _fetch(result["strategy"], url)
+        hydrate_paths(result["_mirror"], "origin/main", "origin/pr", result["_changed"])
+        timings.append(time.perf_counter() - started)
+    result["warm_fetch_seconds"] = round(min(timings), 4) if timings else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=200, help="files in the repository")
+    parser.add_argument("--lines", type=int, default=200, help="lines per file")
+    parser.add_argument("--history", type=int, default=400, help="commits on main before the PR")
+    parser.add_argument("--branches", type=int, default=1000, help="stale branches in the repository")
+    parser.add_argument("--pr-files", type=int, default=10, help="files changed by the PR")
+    parser.add_argument("--changes", type=int, default=5, help="edited lines per PR file")
+    parser.add_argument("--behind", type=int, default=20, help="commits main gained after the PR branched")
+    parser.add_argument("--warm-runs", type=int, default=3)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    work_dir = tempfile.mkdtemp(prefix="bench_fetch_")
+    origin = os.path.join(work_dir, "origin")
+    print(f"Building origin: {args.files} files, {args.history}+{args.behind} commits, {args.branches} branches...")
+    repo = _build_origin(args, origin)
+    url = "file://" + origin
+
+    # both cold runs see the same origin; the warm pushes come after
+    results = [_cold_run(strategy, url, os.path.join(work_dir, strategy)) for strategy in ("full", "partial")]
+    same_diff = results[0].pop("diff") == results[1].pop("diff")
+    for result in results:
+        _warm_runs(result, url, origin, repo["files"][0], args.warm_runs)
+        del result["_mirror"], result["_changed"]
+
+    print(f"{'':<9}{'cold fetch':>12}{'ready':>10}{'diff':>9}{'warm':>9}{'blobs':>7}{'refs':>7}{'mirror':>11}")
+    for r in results:
+        print(f"{r['strategy']:<9}{r['cold_fetch_seconds']:>11.3f}s{r['cold_ready_seconds']:>9.3f}s"
+              f"{r['diff_seconds']:>8.3f}s{r['warm_fetch_seconds'] or 0:>8.3f}s{r['blobs_hydrated']:>7}{r['refs']:>7}"
+              f"{r['mirror_mb']:>8.2f} MB")
+    full, partial = results
+    print(f"  partial: {full['cold_ready_seconds'] / max(partial['cold_ready_seconds'], 1e-9):.1f}x faster cold, "
+          f"{full['mirror_mb'] / max(partial['mirror_mb'], 1e-9):.1f}x smaller mirror")
+    print("✅ Identical diffs" if same_diff else "❌ Diffs differ between strategies")
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "fetch", "config": vars(args), "results": results, "identical_diffs": same_diff},
+                      f, indent=2)
+        print(f"📝 Results written to {output}")
+    sys.exit(0 if same_diff else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Memory bound of the diff stage on oversized diffs: a PR that adds a
+generated data file of `--huge-lines` lines and a minified bundle on a
+single `--long-line-mb` MB line, next to ordinary edits.
+
+    python -m Benchmarks.bench_large_diff --huge-lines 400000 --long-line-mb 20 --max-peak-mb 32
+
+Streams the PR diff through the parser and builds the AI input under
+tracemalloc, with the configured REVIEW_DIFF_MAX_* caps, and exits non-zero
+when the Python heap peak exceeds `--max-peak-mb`. `--uncapped` repeats the
+run with every cap off, for comparison.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from Benchmarks.synthetic_repo import create_synthetic_repo, add_feature_branch, _git
+from Services.diff_parser_service import (
+    diff_files,
+    REVIEW_DIFF_MAX_FILE_LINES,
+    REVIEW_DIFF_MAX_FILE_BYTES,
+    REVIEW_DIFF_MAX_LINE_BYTES
+)
+from Services.ai_input_service import build_ai_input
+
+HUGE_PATH = "src/generated/fixtures.js"
+MINIFIED_PATH = "src/static/app.bundle.js"
+
+
+def _build_repo(args, repo_dir: str) -> list:
+    repo = create_synthetic_repo(repo_dir, file_count=args.files, lines_per_file=200, changes_per_file=3)
+    add_feature_branch(repo_dir, "pr", repo["files"], changes_per_file=5, seed=1)
+    rng = random.Random(2)
+
+    _git(repo_dir, "checkout", "--quiet", "pr")
+    os.makedirs(os.path.join(repo_dir, os.path.dirname(HUGE_PATH)), exist_ok=True)
+    with open(os.path.join(repo_dir, HUGE_PATH), "w", encoding="utf-8") as f:
+        f.write("export const fixtures = [\n")
+        for n in range(args.huge_lines):
+            f.write(f"  {{ id: {n}, key: '{rng.getrandbits(64):016x}', weight: {rng.random():.6f} }},\n")
+        f.write("];\n")
+    os.makedirs(os.path.join(repo_dir, os.path.dirname(MINIFIED_PATH)), exist_ok=True)
+    with open(os.path.join(repo_dir, MINIFIED_PATH), "w", encoding="utf-8") as f:
+        statement = "var a{0}=function(b){{return b*{0}}};"
+        written, n = 0, 0
+        while written < args.long_line_mb * 1024 * 1024:
+            chunk = statement.format(n)
+            f.write(chunk)
+            written += len(chunk)
+            n += 1
+        f.write("\n")
+    _git(repo_dir, "add", "-A")
+    _git(repo_dir, "commit", "--quiet", "-m", "add generated files")
+    _git(repo_dir, "checkout", "--quiet", "main")
+    return repo["files"] + [HUGE_PATH, MINIFIED_PATH]
+
+
+def _measure(repo_dir: str, paths: list, caps: dict) -> dict:
+    """Diff + AI input for the PR under tracemalloc; returns peak heap and what was kept."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    file_diffs = diff_files(repo_dir, "main", "pr", paths, **caps)
+    ai_input = build_ai_input({"pr_id": 1, "title": "Large diff"}, list(file_diffs.values()))
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "caps": caps,
+        "seconds": round(seconds, 3),
+        "peak_mb": round(peak / (1024 * 1024), 2),
+        "ai_input_mb": round(sum(len(f["new_code"]) for f in ai_input["files"]) / (1024 * 1024), 2),
+        "files": {path: {"kept_lines": sum(len(h.lines) for h in diff.hunks), "omitted_lines": diff.omitted_lines,
+                         "truncated": diff.truncated}
+                  for path, diff in file_diffs.items() if path in (HUGE_PATH, MINIFIED_PATH)}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=20, help="ordinary edited files in the PR")
+    parser.add_argument("--huge-lines", type=int, default=400000, help="lines of the generated file")
+    parser.add_argument("--long-line-mb", type=float, default=20, help="size of the one-line minified bundle")
+    parser.add_argument("--max-peak-mb", type=float, default=32, help="allowed Python heap peak with caps on")
+    parser.add_argument("--uncapped", action="store_true", help="also measure with every cap disabled")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    repo_dir = os.path.join(tempfile.mkdtemp(prefix="bench_large_diff_"), "repo")
+    print(f"Building repo: {args.files} edited files, {args.huge_lines}-line generated file, "
+          f"{args.long_line_mb} MB minified line...")
+    paths = _build_repo(args, repo_dir)
+
+    runs = [_measure(repo_dir, paths, {"max_file_lines": REVIEW_DIFF_MAX_FILE_LINES,
+                                       "max_file_bytes": REVIEW_DIFF_MAX_FILE_BYTES,
+                                       "max_line_bytes": REVIEW_DIFF_MAX_LINE_BYTES})]
+    if args.uncapped:
+        runs.append(_measure(repo_dir, paths, {"max_file_lines": 0, "max_file_bytes": 0, "max_line_bytes": 0}))
+
+    for run in runs:
+        label = "capped" if any(run["caps"].values()) else "uncapped"
+        print(f"  {label:<9} peak {run['peak_mb']:8.2f} MB  AI input {run['ai_input_mb']:7.2f} MB  "
+              f"{run['seconds']:6.2f}s")
+        for path, entry in run["files"].items():
+            print(f"      {path:<28} kept {entry['kept_lines']:>7} lines  omitted {entry['omitted_lines']:>7}"
+                  f"  {entry['truncated'] or ''}")
+
+    bounded = runs[0]["peak_mb"] <= args.max_peak_mb
+    print(f"✅ Peak {runs[0]['peak_mb']} MB within {args.max_peak_mb} MB" if bounded else
+          f"❌ Peak {runs[0]['peak_mb']} MB exceeds {args.max_peak_mb} MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "large_diff", "config": vars(args), "runs": runs, "bounded": bounded}, f,
+                      indent=2)
+        print(f"📝 Results written to {args.output}")
+    sys.exit(0 if bounded else 1)
+
+
+if __name__ == "__main__":
+    main()
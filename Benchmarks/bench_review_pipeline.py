@@ -0,0 +1,231 @@
+"""
+End-to-end `review_pr` benchmark, fully offline: a synthetic git repo, the
+stub OpenAI server and the mock Azure DevOps server. Each PR runs the real
+endpoint handler (details → fetch → diff → pre-filter → model → comments).
+
+    python -m Benchmarks.bench_review_pipeline --prs 16 --files 10 --lines 200 --latency 0.3 \\
+        --concurrency 1,4,8 --output bench_results.json
+
+Reports p50/p95 end-to-end latency, per-stage time, reviews/second at each
+concurrency level and peak RSS, and writes them to JSON. `--compare` checks
+the run against an earlier result file and exits non-zero on a regression.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from Benchmarks.synthetic_repo import create_synthetic_repo, add_feature_branch
+from Benchmarks.mock_azure_server import start_mock_azure_server
+from Benchmarks.stub_openai_server import start_stub_server
+
+
+def _percentile(values: list, percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 4)
+
+
+def _distribution(values: list) -> dict:
+    return {
+        "p50": _percentile(values, 50),
+        "p95": _percentile(values, 95),
+        "max": round(max(values), 4) if values else 0.0,
+        "mean": round(sum(values) / len(values), 4) if values else 0.0
+    }
+
+
+def _peak_rss_mb(who: int) -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _code_version() -> str:
+    result = subprocess.run(["git", "-C", os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+    return result.stdout.strip() or "unknown"
+
+
+def _setup(args, work_dir: str):
+    """Synthetic repo with one branch per PR, registered with both servers. Returns (mock, stub, pr_ids)."""
+    origin = os.path.join(work_dir, "origin")
+    repo = create_synthetic_repo(origin, file_count=max(args.files * 2, 10), lines_per_file=args.lines,
+                                 changes_per_file=args.changes)
+
+    mock_server, mock_state, azure_url = start_mock_azure_server()
+    stub_server, openai_url = start_stub_server(latency=args.latency, jitter=args.jitter)
+
+    pr_ids = list(range(1, args.prs + args.warmup + 1))
+    for pr_id in pr_ids:
+        # a different slice of files (and different edits) per PR, so nothing is shared across PRs
+        offset = (pr_id * args.files) % len(repo["files"])
+        paths = (repo["files"] * 2)[offset:offset + args.files]
+        branch = add_feature_branch(origin, f"pr-{pr_id}", paths, args.changes, seed=pr_id)
+        mock_state.add_pull_request(pr_id, branch, "main", title=f"Benchmark PR {pr_id}")
+        if args.engine == "api":
+            mock_state.load_changes_from_repo(pr_id, origin, branch, "main")
+
+    os.environ.update({
+        "AZURE_BASE_URL": azure_url, "AZURE_ORG": "org", "AZURE_PROJECT": "proj", "AZURE_REPO_ID": "repo",
+        "AZURE_PAT": "pat", "AZURE_GIT_URL": origin, "REVIEW_DIFF_ENGINE": args.engine,
+        "OPENAI_BASE_URL": openai_url, "OPENAI_API_KEY": "stub",
+        # every run must reach the model; cached reviews would measure the cache
+        "REVIEW_CACHE_ENABLED": "false",
+        "REVIEW_STATE_PATH": os.path.join(work_dir, "review_state.sqlite3"),
+        "AI_REQUESTS_PER_MINUTE": "100000", "AI_TOKENS_PER_MINUTE": "100000000"
+    })
+    return (mock_server, mock_state), (stub_server, stub_server.RequestHandlerClass.stats), pr_ids
+
+
+async def _run_level(review_pr, request_type, pr_ids: list, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, stages, failed = [], {}, 0
+
+    async def _one(pr_id: int):
+        nonlocal failed
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await review_pr(request_type(pr_id=pr_id, include_timings=True))
+            except Exception as e:
+                failed += 1
+                print(f"❌ PR {pr_id} failed -->", getattr(e, "detail", e))
+                return
+            latencies.append(time.perf_counter() - started)
+            for stage, entry in response["data"]["timings"]["stages"].items():
+                stages.setdefault(stage, []).append(entry["seconds"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_one(pr_id) for pr_id in pr_ids))
+    wall = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "prs": len(pr_ids),
+        "failed": failed,
+        "wall_seconds": round(wall, 4),
+        "reviews_per_second": round(len(latencies) / wall, 3) if wall else 0.0,
+        "latency_seconds": _distribution(latencies),
+        "stage_seconds": {stage: {**_distribution(values), "total": round(sum(values), 4)}
+                          for stage, values in stages.items()}
+    }
+
+
+def _compare(current: dict, baseline_path: str, tolerance: float) -> list:
+    """Regressions beyond `tolerance` (fraction) against a previous result file, per concurrency level."""
+    with open(baseline_path, encoding="utf-8") as f:
+        previous = json.load(f)
+    if previous.get("config") != current["config"]:
+        print(f"⚠️ Baseline config differs: {previous.get('config')}")
+    baseline = {level["concurrency"]: level for level in previous.get("levels", [])}
+
+    regressions = []
+    for level in current["levels"]:
+        before = baseline.get(level["concurrency"])
+        if not before:
+            continue
+        checks = [
+            ("p95 latency", before["latency_seconds"]["p95"], level["latency_seconds"]["p95"], True),
+            ("p50 latency", before["latency_seconds"]["p50"], level["latency_seconds"]["p50"], True),
+            ("reviews/s", before["reviews_per_second"], level["reviews_per_second"], False),
+        ]
+        for name, old, new, lower_is_better in checks:
+            if not old:
+                continue
+            change = (new - old) / old
+            print(f"  c={level['concurrency']:<3} {name:<12} {old:>9.3f} → {new:>9.3f} ({change:+.1%})")
+            if (change > tolerance) if lower_is_better else (change < -tolerance):
+                regressions.append(f"c={level['concurrency']} {name} {change:+.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prs", type=int, default=8, help="PRs reviewed per concurrency level")
+    parser.add_argument("--files", type=int, default=10, help="changed files per PR")
+    parser.add_argument("--lines", type=int, default=200, help="lines per file")
+    parser.add_argument("--changes", type=int, default=5, help="edited lines per file")
+    parser.add_argument("--latency", type=float, default=0.3, help="stub model latency (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--concurrency", default="1,4", help="comma-separated concurrent PR counts")
+    parser.add_argument("--engine", choices=("git", "api"), default="git")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed PRs run first (mirror creation, imports)")
+    parser.add_argument("--output", default="bench_review_pipeline.json")
+    parser.add_argument("--compare", help="earlier result file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression as a fraction")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    work_dir = tempfile.mkdtemp(prefix="bench_review_")
+    os.chdir(work_dir)   # local_repo/ (mirror, caches) lives in the scratch dir
+    (mock_server, mock_state), (stub_server, stub_stats), pr_ids = _setup(args, work_dir)
+
+    # Import after the env is set so module-level settings pick it up
+    from Route.pr_review import review_pr, PRRequest
+
+    async def _run() -> list:
+        if args.warmup:
+            await _run_level(review_pr, PRRequest, pr_ids[:args.warmup], 1)
+        results = []
+        for concurrency in levels:
+            with mock_state.lock:
+                mock_state.threads.clear()   # comments are posted again on every level
+            model_before, azure_before = stub_stats["requests"], mock_state.stats["requests"]
+            level = await _run_level(review_pr, PRRequest, pr_ids[args.warmup:], concurrency)
+            level["model_requests"] = stub_stats["requests"] - model_before
+            level["azure_requests"] = mock_state.stats["requests"] - azure_before
+            results.append(level)
+        return results
+
+    result = {
+        "benchmark": "review_pipeline",
+        "code_version": _code_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {key: getattr(args, key) for key in
+                   ("prs", "files", "lines", "changes", "latency", "jitter", "engine", "warmup")},
+        "levels": asyncio.run(_run())
+    }
+    # Stub and mock servers run in-process, so the process peak includes them; git runs as children
+    result["peak_rss_mb"] = _peak_rss_mb(resource.RUSAGE_SELF)
+    result["peak_rss_children_mb"] = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+    mock_server.shutdown()
+    stub_server.shutdown()
+
+    print(f"prs={args.prs} files/pr={args.files} lines={args.lines} latency={args.latency}s engine={args.engine}")
+    for level in result["levels"]:
+        latency = level["latency_seconds"]
+        print(f"  c={level['concurrency']:<3} {level['reviews_per_second']:7.2f} reviews/s  "
+              f"p50 {latency['p50']:6.2f}s  p95 {latency['p95']:6.2f}s  "
+              f"model calls {level['model_requests']}  azure calls {level['azure_requests']}  "
+              f"failed {level['failed']}")
+        for stage, entry in level["stage_seconds"].items():
+            print(f"        {stage:<14} p50 {entry['p50']:7.3f}s  p95 {entry['p95']:7.3f}s")
+    print(f"  peak RSS {result['peak_rss_mb']} MB (git children {result['peak_rss_children_mb']} MB)")
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"📝 Results written to {output}")
+
+    if baseline:
+        regressions = _compare(result, baseline, args.tolerance)
+        if regressions:
+            print("❌ Regressions: " + ", ".join(regressions))
+            sys.exit(1)
+        print("✅ No regressions beyond tolerance")
+    sys.exit(0 if all(level["failed"] == 0 for level in result["levels"]) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+In-memory mock of the Azure DevOps REST endpoints the service uses
+(PR list/details, threads, iterations/changes, blobs and items).
+
+    python -m Benchmarks.mock_azure_server --port 8200 --throttle-every 10
+
+then point the app at it:
+    AZURE_BASE_URL=http://127.0.0.1:8200 AZURE_ORG=org AZURE_PROJECT=proj AZURE_REPO_ID=repo ...
+"""
+import argparse
+import hashlib
+import json
+import re
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from Benchmarks.stub_openai_server import BenchHTTPServer
+
+_REPO_PREFIX = r"^/[^/]+/[^/]+/_apis/git/repositories/[^/]+"
+_PR_RE = re.compile(_REPO_PREFIX + r"/pullRequests/(\d+)(/threads)?/?$")
+_PR_LIST_RE = re.compile(_REPO_PREFIX + r"/pullrequests/?$", re.IGNORECASE)
+_ITERATIONS_RE = re.compile(_REPO_PREFIX + r"/pullRequests/(\d+)/iterations/?$")
+_CHANGES_RE = re.compile(_REPO_PREFIX + r"/pullRequests/(\d+)/iterations/(\d+)/changes/?$")
+_BLOB_RE = re.compile(_REPO_PREFIX + r"/blobs/([0-9a-f]+)/?$")
+_ITEMS_RE = re.compile(_REPO_PREFIX + r"/items/?$")
+
+
+class MockAzureState:
+    def __init__(self, throttle_every: int = 0):
+        self.lock = threading.Lock()
+        self.throttle_every = throttle_every
+        self.pull_requests = {}      # pr_id -> PR JSON
+        self.threads = {}            # pr_id -> [thread JSON]
+        self.iterations = {}         # pr_id -> [iteration JSON]
+        self.changes = {}            # (pr_id, iteration_id) -> [change entry JSON]
+        self.blobs = {}              # object id -> bytes
+        self.items = {}              # (commit id, "/path") -> bytes
+        self.stats = {"requests": 0, "throttled": 0, "threads_posted": 0, "not_modified": 0, "blobs_served": 0}
+
+    def add_pull_request(self, pr_id: int, source_branch: str, target_branch: str, title: str = "Mock PR"):
+        self.pull_requests[pr_id] = {
+            "pullRequestId": pr_id,
+            "title": title,
+            "status": "active",
+            "sourceRefName": f"refs/heads/{source_branch}",
+            "targetRefName": f"refs/heads/{target_branch}"
+        }
+
+    def load_changes_from_repo(self, pr_id: int, repo_dir: str, source_branch: str, target_branch: str):
+        """Publish the git diff between two branches of a local repo as the PR's single iteration."""
+        def git(*args) -> str:
+            return subprocess.run(["git", "-C", repo_dir, *args], capture_output=True, text=True, check=True).stdout
+
+        head = git("rev-parse", source_branch).strip()
+        base = git("merge-base", target_branch, source_branch).strip()
+        entries = []
+        for line in git("diff", "--raw", "--no-renames", "--abbrev=40", base, head).splitlines():
+            meta, path = line.split("\t", 1)
+            _, _, old_id, new_id, status = meta.split()
+            change_type = {"A": "add", "D": "delete"}.get(status, "edit")
+            item = {"path": "/" + path, "gitObjectType": "blob"}
+            if change_type != "delete":
+                item["objectId"] = new_id
+                self.blobs[new_id] = subprocess.run(["git", "-C", repo_dir, "cat-file", "blob", new_id],
+                                                    capture_output=True, check=True).stdout
+            if change_type != "add":
+                item["originalObjectId"] = old_id
+                self.blobs[old_id] = subprocess.run(["git", "-C", repo_dir, "cat-file", "blob", old_id],
+                                                    capture_output=True, check=True).stdout
+            entries.append({"changeTrackingId": len(entries) + 1, "changeType": change_type, "item": item})
+
+        attributes = subprocess.run(["git", "-C", repo_dir, "show", f"{head}:.gitattributes"], capture_output=True)
+        if attributes.returncode == 0:
+            self.items[(head, "/.gitattributes")] = attributes.stdout
+
+        self.iterations[pr_id] = [{
+            "id": 1,
+            "sourceRefCommit": {"commitId": head},
+            "targetRefCommit": {"commitId": git("rev-parse", target_branch).strip()},
+            "commonRefCommit": {"commitId": base}
+        }]
+        self.changes[(pr_id, 1)] = entries
+
+
+class MockAzureHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_cacheable(self, body: dict):
+        """GET responses carry an ETag and honour If-None-Match like Azure DevOps does."""
+        etag = '"' + hashlib.sha1(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.state.stats["not_modified"] += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send_json(200, body, {"ETag": etag})
+
+    def _throttled(self) -> bool:
+        with self.state.lock:
+            self.state.stats["requests"] += 1
+            every = self.state.throttle_every
+            if every and self.state.stats["requests"] % every == 0:
+                self.state.stats["throttled"] += 1
+                return True
+        return False
+
+    def do_GET(self):
+        if self._throttled():
+            self._send_json(429, {"message": "throttled"}, {"Retry-After": "0"})
+            return
+
+        url = urlparse(self.path)
+        if self._serve_iteration_api(url):
+            return
+
+        match = _PR_RE.match(url.path)
+        if not match:
+            self._send_json(404, {"message": f"no mock for {self.path}"})
+            return
+
+        pr_id = int(match.group(1))
+        with self.state.lock:
+            if match.group(2):
+                threads = list(self.state.threads.get(pr_id, []))
+                self._send_cacheable({"value": threads, "count": len(threads)})
+            elif pr_id in self.state.pull_requests:
+                self._send_cacheable(self.state.pull_requests[pr_id])
+            else:
+                self._send_json(404, {"message": f"PR {pr_id} not found"})
+
+    def _serve_iteration_api(self, url) -> bool:
+        """Iterations, paged iteration changes, raw blobs and file items. Returns False if the path is not one of them."""
+        query = parse_qs(url.query)
+        if _PR_LIST_RE.match(url.path):
+            status = query.get("searchCriteria.status", ["active"])[0]
+            top = int(query.get("$top", ["100"])[0])
+            skip = int(query.get("$skip", ["0"])[0])
+            with self.state.lock:
+                prs = [pr for pr in self.state.pull_requests.values() if status == "all" or pr["status"] == status]
+            self._send_cacheable({"value": prs[skip:skip + top], "count": len(prs[skip:skip + top])})
+            return True
+
+        match = _ITERATIONS_RE.match(url.path)
+        if match:
+            iterations = self.state.iterations.get(int(match.group(1)), [])
+            self._send_cacheable({"value": iterations, "count": len(iterations)})
+            return True
+
+        match = _CHANGES_RE.match(url.path)
+        if match:
+            entries = self.state.changes.get((int(match.group(1)), int(match.group(2))), [])
+            top = int(query.get("$top", ["100"])[0])
+            skip = int(query.get("$skip", ["0"])[0])
+            page = {"changeEntries": entries[skip:skip + top]}
+            if skip + top < len(entries):
+                page["nextSkip"], page["nextTop"] = skip + top, top
+            self._send_cacheable(page)
+            return True
+
+        match = _BLOB_RE.match(url.path)
+        items = _ITEMS_RE.match(url.path)
+        if match or items:
+            if match:
+                content = self.state.blobs.get(match.group(1))
+            else:
+                key = (query.get("versionDescriptor.version", [""])[0], query.get("path", [""])[0])
+                content = self.state.items.get(key)
+            if content is None:
+                self._send_json(404, {"message": f"no content for {self.path}"})
+                return True
+            with self.state.lock:
+                self.state.stats["blobs_served"] += 1
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            return True
+        return False
+
+    def do_POST(self):
+        if self._throttled():
+            self._send_json(429, {"message": "throttled"}, {"Retry-After": "0"})
+            return
+
+        match = _PR_RE.match(urlparse(self.path).path)
+        if not match or not match.group(2):
+            self._send_json(404, {"message": f"no mock for {self.path}"})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        thread = json.loads(self.rfile.read(length) or b"{}")
+        pr_id = int(match.group(1))
+        with self.state.lock:
+            threads = self.state.threads.setdefault(pr_id, [])
+            thread["id"] = len(threads) + 1
+            # Azure echoes file paths with a leading slash
+            context = thread.get("threadContext") or {}
+            if context.get("filePath") and not context["filePath"].startswith("/"):
+                context["filePath"] = "/" + context["filePath"]
+            threads.append(thread)
+            self.state.stats["threads_posted"] += 1
+        self._send_json(200, thread)
+
+
+def start_mock_azure_server(port: int = 0, throttle_every: int = 0):
+    """Start the mock in a daemon thread. Returns (server, state, base_url)."""
+    state = MockAzureState(throttle_every)
+    handler = type("ConfiguredMockAzureHandler", (MockAzureHandler,), {"state": state})
+    server = BenchHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--throttle-every", type=int, default=0, help="answer every Nth request with 429")
+    args = parser.parse_args()
+
+    server, state, base_url = start_mock_azure_server(args.port, args.throttle_every)
+    state.add_pull_request(1, "feature", "main")
+    print(f"🧪 Mock Azure DevOps on {base_url} (PR 1: feature → main)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
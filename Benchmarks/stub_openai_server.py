@@ -0,0 +1,240 @@
+"""
+Minimal OpenAI-compatible chat completions server for offline runs
+(plain and `stream=True` responses, truncated at max_tokens).
+
+    python -m Benchmarks.stub_openai_server --port 8100 --latency 0.5 --error-rate 0.1
+
+Faults for degradation runs: `--stall-rate` holds that fraction of requests
+for `--stall-seconds` before the first byte, `--failing-models` answers 503
+to every request for those models.
+
+then point the app at it:
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=stub uvicorn main:app
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_FILE_RE = re.compile(r"^### (\S+)", re.MULTILINE)
+_LINE_RE = re.compile(r"^(\d{4}): (.*)$", re.MULTILINE)
+
+
+def build_review(user_content: str, wrap_files: bool = False) -> dict:
+    """
+    A deterministic, well-formed review for whatever file(s) the prompt
+    contains; `wrap_files` always answers {"files": [...]}.
+    """
+    headings = list(_FILE_RE.finditer(user_content))
+    if not headings:
+        review = _file_review("", user_content)
+        return {"files": [review]} if wrap_files else review
+
+    sections = []
+    for index, heading in enumerate(headings):
+        end = headings[index + 1].start() if index + 1 < len(headings) else len(user_content)
+        sections.append(_file_review(heading.group(1), user_content[heading.end():end]))
+
+    # Packed requests ask for {"files": [...]}
+    if wrap_files or '{"files"' in user_content:
+        return {"files": sections}
+    return sections[0]
+
+
+def _file_review(file_path: str, code: str) -> dict:
+    lines = _LINE_RE.findall(code)
+    comments = [
+        {
+            "line_number": int(number),
+            "line_hint": text.strip()[:40],
+            "comment": "Consider extracting this into a named helper."
+        }
+        for number, text in lines[:2]
+    ]
+    return {
+        "filePath": file_path,
+        "summary": "Stub review",
+        "issues": ["Stub issue"],
+        "recommendations": ["Stub recommendation"],
+        "comments": comments,
+        "code_quality_score": 7
+    }
+
+
+class BenchHTTPServer(ThreadingHTTPServer):
+    # the default listen backlog (5) overflows under concurrent PR load and
+    # the dropped SYNs come back as ~1s connect stalls in the results
+    request_queue_size = 256
+    daemon_threads = True
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    stall_rate = 0.0
+    stall_seconds = 0.0
+    failing_models = frozenset()
+    stream_chunk_chars = 24
+    stats = {"requests": 0, "errors": 0}
+    seen_prefixes = set()
+    stats_lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        model = request.get("model", "stub")
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            self.stats.setdefault("models", {})
+            self.stats["models"][model] = self.stats["models"].get(model, 0) + 1
+
+        latency = max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        if random.random() < self.stall_rate:
+            with self.stats_lock:
+                self.stats["stalls"] = self.stats.get("stalls", 0) + 1
+            time.sleep(self.stall_seconds)
+        if not request.get("stream"):
+            time.sleep(latency)
+
+        if model in self.failing_models:
+            with self.stats_lock:
+                self.stats["errors"] += 1
+            self._send_json(503, {"error": {"message": f"stub outage of {model}", "type": "server_error"}})
+            return
+
+        if random.random() < self.error_rate:
+            with self.stats_lock:
+                self.stats["errors"] += 1
+            status = random.choice([429, 500, 503])
+            self._send_json(status, {"error": {"message": "stub failure", "type": "server_error"}},
+                            {"retry-after": "0"} if status == 429 else None)
+            return
+
+        messages = request.get("messages", [])
+        user_content = "\n".join(m.get("content", "") for m in messages if m.get("role") == "user")
+        system_content = "\n".join(m.get("content", "") for m in messages if m.get("role") == "system")
+        wrap_files = bool(request.get("response_format")) or '"files"' in system_content
+        content = json.dumps(build_review(user_content, wrap_files))
+        finish_reason = "stop"
+        # Like the real API, stop mid-answer at max_tokens (~4 chars per token)
+        max_tokens = request.get("max_tokens")
+        if max_tokens and len(content) > max_tokens * 4:
+            content, finish_reason = content[:max_tokens * 4], "length"
+        # the response_format schema is sent ahead of the messages, so it is part of the cacheable prefix
+        static_prefix = json.dumps(request.get("response_format") or "") + system_content
+        prompt_tokens = (len(static_prefix) + len(user_content)) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                 "total_tokens": prompt_tokens + len(content) // 4,
+                 "prompt_tokens_details": {"cached_tokens": self._cached_prefix_tokens(static_prefix)}}
+
+        if request.get("stream"):
+            try:
+                self._stream(request, content, finish_reason, usage, latency)
+            except (BrokenPipeError, ConnectionResetError):
+                pass   # the client gave up (e.g. a hedged copy won the race)
+            return
+
+        self._send_json(200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": finish_reason,
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": usage
+        })
+
+    def _cached_prefix_tokens(self, prefix: str) -> int:
+        """Like the real API: a repeated prefix of >= 1024 tokens is cached in 128-token steps."""
+        tokens = len(prefix) // 4
+        with self.stats_lock:
+            seen = prefix in self.seen_prefixes
+            self.seen_prefixes.add(prefix)
+        return tokens // 128 * 128 if seen and tokens >= 1024 else 0
+
+    def _stream(self, request: dict, content: str, finish_reason: str, usage: dict, latency: float):
+        """Server-sent events: ~20% of the latency before the first token, the rest spread over the chunks."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        def send(payload: dict):
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def chunk(delta: dict, reason=None) -> dict:
+            return {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": request.get("model", "stub"),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": reason}]}
+
+        pieces = [content[i:i + self.stream_chunk_chars] for i in range(0, len(content), self.stream_chunk_chars)]
+        time.sleep(latency * 0.2)
+        send(chunk({"role": "assistant", "content": ""}))
+        for piece in pieces:
+            send(chunk({"content": piece}))
+            time.sleep(latency * 0.8 / max(len(pieces), 1))
+        send(chunk({}, finish_reason))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send({"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                  "model": request.get("model", "stub"), "choices": [], "usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_stub_server(port: int = 0, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                      stall_rate: float = 0.0, stall_seconds: float = 0.0, failing_models=()):
+    """Start the stub in a daemon thread. Returns (server, base_url)."""
+    handler = type("ConfiguredStubHandler", (StubOpenAIHandler,), {
+        "latency": latency, "jitter": jitter, "error_rate": error_rate,
+        "stall_rate": stall_rate, "stall_seconds": stall_seconds, "failing_models": frozenset(failing_models),
+        "stats": {"requests": 0, "errors": 0}, "stats_lock": threading.Lock(), "seen_prefixes": set()
+    })
+    server = BenchHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 429/5xx responses")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="fraction of requests held before answering")
+    parser.add_argument("--stall-seconds", type=float, default=30.0)
+    parser.add_argument("--failing-models", default="", help="comma-separated models that always get 503")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.port, args.latency, args.jitter, args.error_rate, args.stall_rate,
+                                         args.stall_seconds, [m for m in args.failing_models.split(",") if m])
+    print(f"🧪 Stub OpenAI server on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
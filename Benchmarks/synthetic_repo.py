@@ -0,0 +1,130 @@
+import os
+import random
+import subprocess
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "bench",
+    "GIT_AUTHOR_EMAIL": "bench@example.com",
+    "GIT_COMMITTER_NAME": "bench",
+    "GIT_COMMITTER_EMAIL": "bench@example.com",
+}
+
+
+def _git(repo_dir: str, *args):
+    env = {**os.environ, **GIT_ENV}
+    subprocess.run(["git", "-C", repo_dir, *args], check=True, env=env,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _component(index: int, lines: int, rng: random.Random) -> list:
+    body = ["import React from 'react';", "", f"export function Component{index}(props) {{"]
+    for n in range(lines):
+        body.append(f"  const value{n} = props.items.map((item) => item.id * {rng.randint(1, 99)});")
+    body += ["  return null;", "}"]
+    return body
+
+
+def create_synthetic_repo(repo_dir: str, file_count: int = 50, lines_per_file: int = 200,
+                          changes_per_file: int = 10, seed: int = 42) -> dict:
+    """
+    Build a git repo with a `main` branch and a `feature` branch that edits
+    `changes_per_file` scattered lines in each of `file_count` React files.
+    """
+    rng = random.Random(seed)
+    os.makedirs(repo_dir, exist_ok=True)
+    subprocess.run(["git", "init", "--quiet", "-b", "main", repo_dir], check=True)
+
+    files = {}
+    for i in range(file_count):
+        # every tenth path has a space, which git marks with a tab after the ---/+++ path
+        rel_path = f"src/components/group{i % 10}/" + (f"Component {i}.jsx" if i % 10 == 9 else f"Component{i}.jsx")
+        files[rel_path] = _component(i, lines_per_file, rng)
+        abs_path = os.path.join(repo_dir, rel_path)
+        os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+        with open(abs_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(files[rel_path]) + "\n")
+
+    _git(repo_dir, "add", "-A")
+    _git(repo_dir, "commit", "--quiet", "-m", "base")
+    _edit_files_on_branch(repo_dir, "feature", files, changes_per_file, rng)
+    return {"repo_dir": repo_dir, "files": sorted(files)}
+
+
+def _edit_files_on_branch(repo_dir: str, branch: str, files: dict, changes_per_file: int, rng: random.Random):
+    _git(repo_dir, "checkout", "--quiet", "-b", branch, "main")
+    for rel_path, lines in files.items():
+        for _ in range(changes_per_file):
+            n = rng.randrange(3, len(lines) - 2)
+            lines[n] = lines[n].replace("item.id", "item.key") + "  // changed"
+        with open(os.path.join(repo_dir, rel_path), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    _git(repo_dir, "commit", "--quiet", "-am", branch)
+    _git(repo_dir, "checkout", "--quiet", "main")
+
+
+def add_feature_branch(repo_dir: str, branch: str, rel_paths: list, changes_per_file: int = 10,
+                       seed: int = 0) -> str:
+    """Branch off `main` and edit `changes_per_file` lines of each of `rel_paths` (one commit)."""
+    files = {}
+    for rel_path in rel_paths:
+        with open(os.path.join(repo_dir, rel_path), encoding="utf-8") as f:
+            files[rel_path] = f.read().splitlines()
+    _edit_files_on_branch(repo_dir, branch, files, changes_per_file, random.Random(seed))
+    return branch
+
+
+def _fast_import_blob(lines: list) -> bytes:
+    data = ("\n".join(lines) + "\n").encode("utf-8")
+    return b"data %d\n%s\n" % (len(data), data)
+
+
+def add_history(repo_dir: str, rel_paths: list, commits: int = 200, branches: int = 500,
+                branch_depth: int = 3, seed: int = 7) -> dict:
+    """
+    Grow `main` by `commits` single-file commits and add `branches` stale
+    branches (each `branch_depth` commits off a random point of that history),
+    in one `git fast-import` run. Models a long-lived repository with deep
+    history and many branches. Returns {"main_commits", "branches"}.
+    """
+    rng = random.Random(seed)
+    contents = {}
+    for rel_path in rel_paths:
+        with open(os.path.join(repo_dir, rel_path), encoding="utf-8") as f:
+            contents[rel_path] = f.read().splitlines()
+
+    def _commit(ref: str, mark: int, parent: str, message: str) -> bytes:
+        rel_path = rng.choice(rel_paths)
+        lines = list(contents[rel_path])
+        for _ in range(5):
+            n = rng.randrange(3, len(lines) - 2)
+            lines[n] = lines[n].replace(str(rng.randint(1, 99)), str(rng.randint(100, 999)))
+        lines.append(f"// {message} {rng.getrandbits(64):x}")
+        msg = message.encode("utf-8")
+        header = (b"commit %s\nmark :%d\ncommitter bench <bench@example.com> %d +0000\ndata %d\n%s\n"
+                  % (ref.encode(), mark, 1700000000 + mark, len(msg), msg))
+        if parent:
+            header += b"from %s\n" % parent.encode()
+        return header + b"M 100644 inline %s\n" % rel_path.encode() + _fast_import_blob(lines), rel_path, lines
+
+    stream, mark = [], 0
+    for index in range(commits):
+        mark += 1
+        chunk, rel_path, lines = _commit("refs/heads/main", mark, "refs/heads/main^0" if index == 0 else None,
+                                         f"history {index}")
+        contents[rel_path] = lines
+        stream.append(chunk)
+    main_marks = list(range(1, mark + 1))
+
+    for index in range(branches):
+        parent = f":{rng.choice(main_marks)}" if main_marks else "refs/heads/main^0"
+        for depth in range(branch_depth):
+            mark += 1
+            chunk, _, _ = _commit(f"refs/heads/stale/branch-{index}", mark, parent if depth == 0 else None,
+                                  f"branch {index}.{depth}")
+            stream.append(chunk)
+
+    subprocess.run(["git", "-C", repo_dir, "fast-import", "--quiet"], input=b"".join(stream), check=True,
+                   env={**os.environ, **GIT_ENV})
+    subprocess.run(["git", "-C", repo_dir, "reset", "--quiet", "--hard", "main"], check=True)
+    return {"main_commits": commits, "branches": branches}
@@ -1,15 +1,18 @@
-import os
-from fastapi import APIRouter, HTTPException
+import json
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Body, Header, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from Services.diff_service import (
-    get_pr_details,
-    get_pr_diff_summary,
-    get_file_diff,
-    create_sdiff_files
-)
-from Services.ai_input_service import build_ai_input
-from Services.ai_review_service import analyze_pr_with_ai
-from Services.azure_pr_comment_service import post_comments_to_azure
+from Services.review_pipeline_service import run_pr_review, ReviewStageError
+from Services.job_service import submit_review_job, get_job
+from Services.bulk_review_service import review_prs_bulk
+from Services.review_cache_service import get_cache_stats
+from Services.webhook_service import verify_webhook_secret, parse_pr_event, AZURE_WEBHOOK_SECRET
+from Services.repo_registry_service import get_repo, list_repos, UnknownRepositoryError
+from Services.review_store_service import get_review_run, get_latest_review, list_review_runs, get_score_trend
+from Services.model_router_service import model_health
+from Services.ai_review_service import OPENAI_MODEL
 
 
 
@@ -19,93 +22,170 @@ router = APIRouter(prefix="/pr", tags=["PR Review"])
 
 class PRRequest(BaseModel):
     pr_id: int
+    repo: Optional[str] = None      # registered repository name; omit for the default repository
+    async_mode: bool = False    # True → return a job id immediately, poll /pr/jobs/{id}
+    include_timings: bool = False   # True → add the per-stage latency/token breakdown to the result
+    incremental: bool = False       # True → only review commits pushed since the last review
 
 
 @router.post("/review-pr")
 async def review_pr(request: PRRequest):
     try:
-        # Step 1️⃣: Get PR details
-        pr_details = get_pr_details(request.pr_id)
-        source_branch = pr_details.get("source_branch")
-        target_branch = pr_details.get("target_branch")
-
-        # Step 2️⃣: Get diff summary (list of files)
-        diff_summary = get_pr_diff_summary(source_branch, target_branch, request.pr_id)
-        files = diff_summary.get("files", [])
-
-        # Step 3️⃣: Save all diffs into local_repo/pr_<id>/diffs/
-        repo_dir = os.path.join(os.getcwd(), "local_repo", f"pr_{request.pr_id}")
-        diffs_dir = os.path.join(repo_dir, "diffs")
-        os.makedirs(diffs_dir, exist_ok=True)
-
-        saved_files = []
-        for f in files:
-            file_path = f["filePath"]
-            safe_name = file_path.replace("/", "_#").replace("\\", "_#")
-            diff_file_path = os.path.join(diffs_dir, f"{safe_name}.diff")
-
-            # Avoid duplicate write
-            if os.path.exists(diff_file_path):
-                os.remove(diff_file_path)
-
-            diff_data = get_file_diff(target_branch, source_branch, file_path, request.pr_id)
-            diff_text = diff_data.get("diffText", "")
-
-            # Write diff to file
-            with open(diff_file_path, "w", encoding="utf-8") as df:
-                df.write(diff_text or "No diff available.")
-
-            saved_files.append({
-                "filePath": file_path,
-                "diffFile": diff_file_path,
-                "status": "saved" if diff_text else "empty"
+        if request.async_mode:
+            job = await submit_review_job(request.pr_id, request.incremental, request.repo)
+            return JSONResponse(status_code=202, content={
+                "message": "Review already in progress" if job["coalesced"] else "Review job queued",
+                "data": {
+                    "job_id": job["job_id"],
+                    "status": job["status"],
+                    "coalesced": job["coalesced"],
+                    "status_url": f"/pr/jobs/{job['job_id']}"
+                }
             })
 
-        # Step 4️⃣: Create sdiff folder and copy diffs
-        sdiff_result = create_sdiff_files(request.pr_id)
-
-        # Step 5️⃣: Build AI Input JSON
-        ai_input = build_ai_input(pr_details)
-        # print("ai_input-->", ai_input)
-        ai_review = {}
- 
-        for file in ai_input.get("files", []):
-            Ai_inpputData = {
-                "title": ai_input['title'],
-                "source_branch": ai_input['source_branch'],
-                "target_branch": ai_input['target_branch'],
-                "files_changed": ai_input['files_changed'],
-                "files": [
-                    {
-                        "file_name": file['file_name'],   
-                        "new_code": file['new_code']       
-                    }
-                ]
-            }
-                
-            # as of now we are only analysis only 1 file for testing
-            ai_review = analyze_pr_with_ai(Ai_inpputData)
-            # Step 5️⃣ (continued): Post AI comments to Azure PR
-            azure_result = post_comments_to_azure(request.pr_id, ai_review, ai_review.get("filePath"))
-            # break
-
-            
-        # Step 6️⃣: Return full response
+        data = await run_pr_review(
+            request.pr_id, include_timings=request.include_timings, incremental=request.incremental,
+            repo=get_repo(request.repo)
+        )
+
+        # Step 6️⃣: Return full response (a partial review still returns what was reviewed)
+        partial = (data.get("review_status") or {}).get("partial")
         return {
-            "message": "PR diff summary, sdiff, and AI input generated successfully",
-            "data": {
-                "pr_id": pr_details.get("pr_id"),
-                "title": pr_details.get("title"),
-                "source_branch": source_branch,
-                "target_branch": target_branch,
-                # "diff_summary": diff_summary,
-                # "saved_diffs": saved_files,
-                # "sdiff": sdiff_result,
-                # "ai_input": ai_input,       
-                # "ai_review": ai_review,
-                "azure_result": azure_result 
-            }
+            "message": "PR reviewed partially; see review_status" if partial else
+                       "PR diff summary, AI review and Azure comments generated successfully",
+            "data": data
         }
 
+    except UnknownRepositoryError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ReviewStageError as e:
+        # Azure DevOps / git could not provide the PR: an upstream failure, not ours
+        raise HTTPException(status_code=502, detail={"stage": e.stage, "error": str(e)})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class BulkPRRequest(BaseModel):
+    repo: Optional[str] = None
+    pr_ids: Optional[List[int]] = None   # omit (or set all_active) to sweep every active PR
+    all_active: bool = False
+    include_timings: bool = False
+    incremental: bool = False
+
+
+@router.post("/review-prs")
+async def review_prs(request: BulkPRRequest):
+    """
+    Review several PRs in one call. Streams NDJSON: a "scheduled" line, one
+    "result" line per PR as it finishes, then a "summary" line.
+    """
+    if not request.pr_ids and not request.all_active:
+        raise HTTPException(status_code=422, detail="Provide pr_ids or set all_active")
+    try:
+        repo = get_repo(request.repo)
+    except UnknownRepositoryError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    async def ndjson():
+        async for entry in review_prs_bulk(
+            None if request.all_active else request.pr_ids,
+            incremental=request.incremental, include_timings=request.include_timings, repo=repo
+        ):
+            yield json.dumps(entry, default=str) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@router.post("/webhook/azure")
+async def azure_pr_webhook(payload: dict = Body(...), x_webhook_secret: str = Header(None)):
+    """
+    Azure DevOps service hook for "Pull request created/updated". Queues an
+    incremental review covering only the commits pushed since the last one.
+    """
+    if not verify_webhook_secret(x_webhook_secret):
+        raise HTTPException(status_code=401, detail="Invalid webhook secret" if AZURE_WEBHOOK_SECRET else
+                            "Webhook disabled: AZURE_WEBHOOK_SECRET is not set")
+
+    event = await asyncio.to_thread(parse_pr_event, payload)
+    if event["ignored"]:
+        return {"message": f"Ignored: {event['reason']}", "data": event}
+
+    job = await submit_review_job(event["pr_id"], incremental=True, repo=event["repo"])
+    return JSONResponse(status_code=202, content={
+        "message": "Review already queued" if job["coalesced"] else "Incremental review queued",
+        "data": {
+            "job_id": job["job_id"],
+            "repo": event["repo"],
+            "pr_id": event["pr_id"],
+            "head_commit": event["head_commit"],
+            "coalesced": job["coalesced"],
+            "status_url": f"/pr/jobs/{job['job_id']}"
+        }
+    })
+
+
+@router.get("/jobs/{job_id}")
+def review_job_status(job_id: str):
+    """Per-stage progress and, once finished, the review result of a queued job."""
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+def _repo_name(repo: Optional[str]) -> str:
+    try:
+        return get_repo(repo).name
+    except UnknownRepositoryError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/reviews/trends")
+def review_score_trends(repo: Optional[str] = None, pr_id: Optional[int] = None, file_path: Optional[str] = None,
+                        limit: int = Query(100, ge=1, le=1000)):
+    """Code-quality score per stored run (or per review of `file_path`), oldest first."""
+    return get_score_trend(_repo_name(repo), pr_id, file_path, limit)
+
+
+@router.get("/reviews/{review_id}")
+def stored_review(review_id: str, file_path: Optional[str] = None):
+    """A past review run (response + every file's model review), read from the results store."""
+    run = get_review_run(review_id, file_path)
+    if not run:
+        raise HTTPException(status_code=404, detail=f"Review {review_id} not found")
+    return run
+
+
+@router.get("/{pr_id}/reviews")
+def pr_review_history(pr_id: int, repo: Optional[str] = None, limit: int = Query(50, ge=1, le=500)):
+    """Stored review runs of a PR, newest first (summaries only)."""
+    return list_review_runs(_repo_name(repo), pr_id, limit)
+
+
+@router.get("/{pr_id}/reviews/latest")
+def latest_pr_review(pr_id: int, repo: Optional[str] = None, commit: Optional[str] = None,
+                     file_path: Optional[str] = None):
+    """Newest stored review of a PR, or the one of source commit `commit` (SHA or prefix)."""
+    run = get_latest_review(_repo_name(repo), pr_id, commit, file_path)
+    if not run:
+        raise HTTPException(status_code=404, detail=f"No stored review for PR {pr_id}"
+                                                    + (f" at {commit}" if commit else ""))
+    return run
+
+
+@router.get("/repos")
+def registered_repos():
+    """Repositories this deployment reviews (credentials omitted)."""
+    return [repo.describe() for repo in list_repos()]
+
+
+@router.get("/models")
+def model_circuits():
+    """Circuit breaker state of the primary model and each fallback model."""
+    return model_health(OPENAI_MODEL)
+
+
+@router.get("/cache/stats")
+def review_cache_stats():
+    """Review cache hit/miss counters and estimated savings."""
+    return get_cache_stats()
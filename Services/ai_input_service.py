@@ -1,36 +1,21 @@
-import os
-import json
-
-def build_ai_input(pr_details: dict):
+def build_ai_input(pr_details: dict, file_diffs: list):
     """
-    Build structured AI input JSON from cleaned diff files in /local_repo/sdiff/.
-    Extracts correct original file names from encoded pattern (_# => /)
+    Build structured AI input JSON from the in-memory FileDiff objects of
+    the diff stage. File names get a leading "/" to match Azure's paths.
     """
-    base_dir = os.path.join(os.getcwd(), "local_repo", "sdiff")
     pr_id = pr_details.get("pr_id")
     ai_files = []
 
-    for filename in sorted(os.listdir(base_dir)):
-        # Example: pr_15_src_#features_#RecommendedMenus_#index.jsx.diff
-        if filename.startswith(f"pr_{pr_id}_") and filename.endswith(".diff"):
-            file_path = os.path.join(base_dir, filename)
-            with open(file_path, "r", encoding="utf-8") as f:
-                new_code = f.read().strip()
-
-            # Clean filename for AI readability & mapping
-            clean_name = (
-                filename
-                .replace(f"pr_{pr_id}_", "")   # remove PR prefix
-                .replace(".diff", "")           # remove extension
-                .replace("_#", "/")             # restore folder structure
-            )
+    for file_diff in file_diffs:
+        new_code = file_diff.numbered_new_code()
+        if not new_code:
+            # nothing on the new side (deletions, binary or mode-only changes)
+            continue
 
-            ai_files.append({
-                "file_name": "/" + clean_name,        # e.g., src/features/RecommendedMenus/index.jsx ✅
-                "new_code": new_code
-            })
-            result = []
-            result.append(ai_files[0])
+        ai_files.append({
+            "file_name": "/" + file_diff.file_path,        # e.g., /src/features/RecommendedMenus/index.jsx ✅
+            "new_code": new_code
+        })
 
     ai_input = {
         "pr_id": pr_id,
@@ -1,111 +1,645 @@
 import os
+import copy
 import json
-from openai import OpenAI
+import time
+import random
+import asyncio
+from openai import AsyncOpenAI, APIStatusError, APIConnectionError
+from Services.metrics_service import stage_span, inc_counter
+from Services.model_router_service import get_breaker, model_chain, hedged
+from Services.review_cache_service import make_cache_key, get_cached_review, store_review
+from Services.json_stream_service import ReviewStreamParser, repair_json
+from Services.prompt_service import REVIEW_PROMPT
+from Services.token_packing_service import (
+    AI_REQUEST_TOKEN_BUDGET,
+    count_tokens,
+    pack_files,
+    split_batch_review,
+    merge_file_reviews
+)
 
-# ✅ Initialize client once (no openai.api_key needed here)
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# ✅ Model settings (override via .env)
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")  # ⚡ fast and cheaper than gpt-4
+OPENAI_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.3"))
+OPENAI_MAX_TOKENS = int(os.getenv("OPENAI_MAX_TOKENS", "700"))   # per file section
+AI_MAX_OUTPUT_TOKENS = int(os.getenv("AI_MAX_OUTPUT_TOKENS", "4000"))  # cap for packed requests
+# Stream completions so comments can be parsed (and posted) while the model is still writing
+AI_STREAM_RESPONSES = os.getenv("AI_STREAM_RESPONSES", "true").lower() == "true"
 
-def analyze_pr_with_ai(ai_input: dict):
+# ✅ Async fan-out limits
+AI_REVIEW_CONCURRENCY = int(os.getenv("AI_REVIEW_CONCURRENCY", "8"))
+AI_REQUESTS_PER_MINUTE = int(os.getenv("AI_REQUESTS_PER_MINUTE", "500"))
+AI_TOKENS_PER_MINUTE = int(os.getenv("AI_TOKENS_PER_MINUTE", "200000"))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "4"))
+AI_RETRY_BASE_DELAY = float(os.getenv("AI_RETRY_BASE_DELAY", "1.0"))
+AI_RETRY_MAX_DELAY = float(os.getenv("AI_RETRY_MAX_DELAY", "30"))
+# Retries on one model before moving to the next fallback model (the last model uses AI_MAX_RETRIES)
+AI_FALLBACK_AFTER_RETRIES = int(os.getenv("AI_FALLBACK_AFTER_RETRIES", "1"))
+# Seconds a single model request may take (per read while streaming) before it counts as failed
+AI_REQUEST_TIMEOUT = float(os.getenv("AI_REQUEST_TIMEOUT", "120"))
+# Seconds the whole AI review of one PR may take; files not reviewed by then are reported as such (0 = no limit)
+AI_REVIEW_BUDGET_SECONDS = float(os.getenv("AI_REVIEW_BUDGET_SECONDS", "300"))
+
+# ✅ Initialize the client once (no openai.api_key needed here)
+# OPENAI_BASE_URL is honoured by the SDK, e.g. to point at a local stub server.
+# Retries are handled below with jitter + rate limiting, so the SDK's own are disabled
+async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0, timeout=AI_REQUEST_TIMEOUT)
+
+
+# 🧠 The AI prompt is a versioned template loaded once at import (see Prompts/ and prompt_service);
+# its fingerprint is the prompt version used in cache keys.
+
+# Send the prompt fingerprint as `prompt_cache_key` so requests sharing the prefix hit the same cache
+AI_PROMPT_CACHE_KEY = os.getenv("AI_PROMPT_CACHE_KEY", "false").lower() == "true"
+# OpenAI only caches a prompt prefix once it is at least this long
+PROVIDER_PROMPT_CACHE_MIN_TOKENS = 1024
+
+
+def _file_section(file_name: str, new_code: str, part: int = 1, parts: int = 1) -> str:
+    heading = f"### {file_name}"
+    if parts > 1:
+        heading += f" (part {part} of {parts})"
+    return f"{heading}\n{new_code}"
+
+
+def build_review_messages(ai_input: dict):
+    """Build the chat messages for a single-file ai_input, or None if it has no file."""
+    files = ai_input.get("files", [])
+    first_file = files[0] if files else None
+
+    if not first_file:
+        print("⚠️ No file found in ai_input")
+        return None
+
+    return REVIEW_PROMPT.messages(ai_input, [_file_section(first_file["file_name"], first_file["new_code"])])
+
+
+def build_batch_messages(ai_input: dict, batch: list):
+    """Messages for a packed request holding several file sections (or parts of one file)."""
+    sections = [_file_section(s["file_name"], s["new_code"], s["part"], s["parts"]) for s in batch]
+    return REVIEW_PROMPT.messages(ai_input, sections)
+
+
+def prompt_overhead_tokens(ai_input: dict) -> int:
+    """Tokens of a request for this PR before any file section is added."""
+    return sum(count_tokens(m["content"], OPENAI_MODEL) for m in REVIEW_PROMPT.messages(ai_input, []))
+
+
+def completion_options(max_tokens: int, model: str = OPENAI_MODEL) -> dict:
+    """Keyword arguments shared by every chat completion call."""
+    options = {"model": model, "temperature": OPENAI_TEMPERATURE, "max_tokens": max_tokens}
+    response_format = REVIEW_PROMPT.response_format()
+    if response_format:
+        options["response_format"] = response_format
+    if AI_PROMPT_CACHE_KEY:
+        # not a named argument in the pinned SDK yet
+        options["extra_body"] = {"prompt_cache_key": f"pr-review-{REVIEW_PROMPT.fingerprint[:16]}"}
+    return options
+
+
+def static_prefix_tokens() -> int:
+    """Tokens every request shares before anything PR-specific: the response schema and the system message."""
+    response_format = REVIEW_PROMPT.response_format()
+    schema = json.dumps(response_format) if response_format else ""
+    return count_tokens(schema, OPENAI_MODEL) + count_tokens(REVIEW_PROMPT.system, OPENAI_MODEL)
+
+
+if AI_PROMPT_CACHE_KEY:
+    _prefix_tokens = static_prefix_tokens()
+    if _prefix_tokens < PROVIDER_PROMPT_CACHE_MIN_TOKENS:
+        print(f"⚠️ Static prompt prefix of {REVIEW_PROMPT.name}/{REVIEW_PROMPT.version} is ~{_prefix_tokens} tokens, "
+              f"below the {PROVIDER_PROMPT_CACHE_MIN_TOKENS}-token minimum for provider prompt caching; "
+              f"expect no cached prompt tokens")
+
+
+def file_cache_key(file: dict) -> str:
+    """Review cache key of one file: its diff, the model settings and the prompt version."""
+    return make_cache_key(file["file_name"], file["new_code"], OPENAI_MODEL, OPENAI_TEMPERATURE,
+                          REVIEW_PROMPT.fingerprint)
+
+
+def single_file_review(review: dict) -> dict:
+    """The prompt always answers {"files": [...]}; a one-file request returns that file's object."""
+    if "error" in review or not isinstance(review.get("files"), list):
+        return review
+    entries = [entry for entry in review["files"] if isinstance(entry, dict)]
+    if not entries:
+        return {"error": "Model response had no section for this file"}
+    single = dict(entries[0])
+    for flag in ("json_repaired", "max_tokens_reached", "stream_interrupted", "fallback_model"):
+        if review.get(flag):
+            single[flag] = review[flag]
+    return single
+
+
+def _drop_incomplete_comments(review: dict, content: str) -> dict:
     """
-    Analyze PR changes using OpenAI GPT model.
-    Returns a structured summary, score, and suggestions.
+    A repaired (truncated) review can end in a half-written comment whose
+    text was cut off; keep only comments whose JSON object was closed.
     """
-    try:
-        files = ai_input.get("files", [])
-        first_file = files[0] if files else None
-        files_text = ""
+    complete = [comment for _, comment in ReviewStreamParser().feed(content)]
+    for entry in [review] + [f for f in review.get("files", []) if isinstance(f, dict)]:
+        if "comments" in entry:
+            entry["comments"] = [c for c in entry["comments"] if c in complete and c.get("comment")]
+    return review
 
-        if first_file:
-            files_text = f"### {first_file['file_name']}\n{first_file['new_code']}"
-        else:
-            print("⚠️ No file found in ai_input")
 
-    except Exception as e:
-        print("❌ Error reading files -->", e)
-        return {"error": f"Error reading files: {e}"}
-
-    print("analyze_pr_with_ai: File content loaded successfully")
-
-    # 🧠 Build the AI prompt
-    SYSTEM_PROMPT = f"""
-    You are a **senior front-end software engineer and expert React code reviewer**. 
-Your job is to perform a detailed technical review of the provided code changes.
-
-Focus your review on:
-1. **Code Readability** – clarity, naming, formatting, indentation.
-2. **Maintainability** – modularity, structure, reusability.
-3. **Code Duplication** – repeated patterns or redundant logic.
-4. **Best Practices** – React, JS/TS, and general software design principles.
-5. **Potential Bugs or Anti-patterns** – logic errors, unsafe assumptions, or missing validations.
-6. **Performance Considerations** – unnecessary re-renders, API inefficiencies, large computations.
-
-Your task:
-- Identify issues and provide specific recommendations.
-- Additionally, write short PR-style comments for specific code snippets or identifiers related to each issue.
-
-You must respond **ONLY** in valid JSON format like this:
-
-    {{
-  "filePath": "/src/features/RecommendedMenus/index.jsx",    
-  "summary": "Brief overall summary of the code review",
-  "issues": [
-    
-    "Issue 1 with explanation and suggested fix",
-    "Issue 2 with explanation and suggested fix",
-    "Issue 3 ..."
-  ],
-  "recommendations": [
-    "Recommendation 1 to improve code",
-    "Recommendation 2 to enhance maintainability"
-  ],
-  "comments": [
-    {{
-      "line_number": 45,
-      "line_hint": "Relevant code identifier or variable name (e.g., 'localStorage.getItem', 'split(...)', 'apiLink')",
-      "comment": "A short, professional PR comment that could be added directly on that line."
-    }}
-  ],
-  "code_quality_score": 1-10
-}}
-
-PR Title: {ai_input['title']}
-Source Branch: {ai_input['source_branch']}
-Target Branch: {ai_input['target_branch']}
-Files Changed: {ai_input['files_changed']}
-
-Return ONLY valid JSON. No extra text or explanation.
-    
-    """
-
-    print("🧠 Sending prompt to OpenAI model...")
-
-    code = f"""Code Changes:    {files_text}"""
+# Marks of a file review that is incomplete or not the primary model's
+_UNCACHEABLE_FLAGS = ("error", "partial_error", "budget_exhausted", "json_repaired", "max_tokens_reached",
+                      "stream_interrupted", "fallback_model")
+
 
+def _cacheable(review: dict) -> bool:
+    """
+    A file review cut off at max_tokens or mid-stream, recovered by
+    repair_json or only partly finished may be missing comments; caching it would replay the
+    gaps on every rerun for REVIEW_CACHE_TTL_HOURS, so only complete
+    answers are stored (and fallback answers stay out of the primary
+    model's cache).
+    """
+    return not any(review.get(flag) for flag in _UNCACHEABLE_FLAGS)
+
+
+def parse_review_content(content: str) -> dict:
+    # ✅ Try parsing the model's response into JSON
     try:
-        # ✅ Correct call for openai>=1.x
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # ⚡ fast and cheaper than gpt-4
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},       
-                {"role": "user", "content": code}
-                ],
-            temperature=0.3,
-            max_tokens=700
-        )
-
-        # ✅ Access message content correctly for new SDK
-        content = response.choices[0].message.content.strip()
-
-        # ✅ Try parsing the model's response into JSON
+        parsed = json.loads(content)
+        print("✅ AI response parsed successfully")
+        return parsed
+    except json.JSONDecodeError:
+        pass
+
+    # Truncated or slightly malformed output: keep whatever is recoverable
+    repaired = repair_json(content)
+    if repaired is not None:
+        print("🩹 AI response repaired from invalid JSON")
+        inc_counter("pr_review_json_repairs_total", help_text="Model responses recovered from invalid JSON")
+        repaired["json_repaired"] = True
+        return _drop_incomplete_comments(repaired, content)
+
+    print("⚠️ AI did not return valid JSON")
+    return {"raw_output": content, "error": "Model response not in JSON format"}
+
+
+# =========================================================
+# 🔹 Async fan-out: rate limiting + jittered retries
+# =========================================================
+class RateLimiter:
+    """Token-bucket limiter for requests/minute and tokens/minute."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.request_allowance = float(requests_per_minute)
+        self.token_allowance = float(tokens_per_minute)
+        self.updated_at = time.monotonic()
+        self._lock = None
+        self._loop = None
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.request_allowance = min(self.rpm, self.request_allowance + elapsed * self.rpm / 60)
+        self.token_allowance = min(self.tpm, self.token_allowance + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens: int):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock, self._loop = asyncio.Lock(), loop
+
+        # A single oversized request may exceed the bucket; cap it so it can still run
+        tokens = min(tokens, self.tpm)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.request_allowance >= 1 and self.token_allowance >= tokens:
+                    self.request_allowance -= 1
+                    self.token_allowance -= tokens
+                    return
+                wait = max(
+                    (1 - self.request_allowance) * 60 / self.rpm,
+                    (tokens - self.token_allowance) * 60 / self.tpm,
+                )
+                await asyncio.sleep(max(wait, 0.01))
+
+
+rate_limiter = RateLimiter(AI_REQUESTS_PER_MINUTE, AI_TOKENS_PER_MINUTE)
+_semaphores = {}
+
+
+def _review_semaphore() -> asyncio.Semaphore:
+    """One concurrency gate per event loop, shared by every review running on it."""
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores.clear()
+        _semaphores[loop] = asyncio.Semaphore(AI_REVIEW_CONCURRENCY)
+    return _semaphores[loop]
+
+
+def _total_tokens(usage) -> int:
+    return getattr(usage, "total_tokens", 0) or 0
+
+
+def record_usage(span: dict, usage, model: str = OPENAI_MODEL):
+    """Copy a completion's token usage onto the span and the token counters."""
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    # prompt tokens the provider served from its prefix cache (billed at a discount)
+    cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", 0) or 0
+    span.update(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cached_prompt_tokens=cached_tokens)
+    inc_counter("pr_review_model_tokens_total", prompt_tokens, "Tokens used by model calls",
+                model=model, kind="prompt")
+    inc_counter("pr_review_model_tokens_total", completion_tokens, model=model, kind="completion")
+    inc_counter("pr_review_model_tokens_total", cached_tokens, model=model, kind="cached_prompt")
+
+
+def estimate_request_tokens(messages: list, max_tokens: int = OPENAI_MAX_TOKENS) -> int:
+    """Prompt size counted locally plus the completion budget."""
+    return sum(count_tokens(m["content"], OPENAI_MODEL) for m in messages) + max_tokens
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, APIConnectionError)  # includes timeouts
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    retry_after = None
+    if isinstance(error, APIStatusError):
+        retry_after = error.response.headers.get("retry-after")
+    if retry_after:
         try:
-            parsed = json.loads(content)
-            print("✅ AI response parsed successfully")
-            # print("parsed-->", parsed)
-            return parsed
-        except json.JSONDecodeError:
-            print("⚠️ AI did not return valid JSON")
-            return {"raw_output": content, "error": "Model response not in JSON format"}
+            return min(float(retry_after), AI_RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    # full jitter exponential backoff
+    return random.uniform(0, min(AI_RETRY_MAX_DELAY, AI_RETRY_BASE_DELAY * (2 ** attempt)))
 
+
+async def analyze_pr_with_ai_async(ai_input: dict, on_comment=None):
+    """
+    Review the first file of ai_input (cached, rate limited, retried, with
+    hedging and fallback models). Returns the file's review dict.
+    """
+    files = ai_input.get("files", [])
+    if not files:
+        print("⚠️ No file found in ai_input")
+        return {"error": "No file found in ai_input"}
+    return (await review_files_packed({**ai_input, "files": files[:1]}, on_comment, budget_seconds=0))[0]
+
+
+class StreamInterrupted(Exception):
+    """A streamed response broke off after some of its comments were already handed to on_comment."""
+
+    def __init__(self, content: str, error: Exception):
+        super().__init__(str(error))
+        self.content = content
+        self.error = error
+
+
+def _resolve_section_file(file_path, section_files: list):
+    """Map a streamed comment's filePath onto the request's file names (None if ambiguous)."""
+    if len(set(section_files or [])) == 1:
+        return section_files[0]
+    wanted = (file_path or "").strip().lstrip("/").lower()
+    for name in section_files or []:
+        if name.strip().lstrip("/").lower() == wanted:
+            return name
+    return None
+
+
+async def _stream_completion(messages: list, max_tokens: int, span: dict, on_comment, section_files: list,
+                             model: str = OPENAI_MODEL, claim=None):
+    """
+    Streamed chat completion. Returns (content, usage, finish_reason), or
+    None when `claim()` refuses the first token (a hedged copy already won).
+
+    Each comment goes to `on_comment` as soon as its JSON object closes.
+    If the stream then breaks off, StreamInterrupted carries what was
+    streamed so far: those comments are already posted, and a retry would
+    post the same findings again in different wording.
+    """
+    stream = await async_client.chat.completions.create(
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True},
+        **completion_options(max_tokens, model)
+    )
+    started = time.perf_counter()
+    parser = ReviewStreamParser()
+    parts, usage, finish_reason = [], None, None
+    emitted = False
+    try:
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            delta = chunk.choices[0].delta.content or ""
+            if not delta:
+                continue
+            if not parts and claim and not claim():
+                await stream.close()
+                return None
+            parts.append(delta)
+            for file_path, comment in parser.feed(delta):
+                file_name = _resolve_section_file(file_path, section_files)
+                if on_comment and file_name and comment.get("comment"):
+                    span.setdefault("first_comment_seconds", round(time.perf_counter() - started, 4))
+                    on_comment(file_name, comment)
+                    emitted = True
     except Exception as e:
-        print("❌ analyze_pr_with_ai error -->", e)
-        return {"error": f"AI review failed: {str(e)}"}
+        if not emitted:
+            raise
+        raise StreamInterrupted("".join(parts), e) from e
+    return "".join(parts), usage, finish_reason
+
+
+async def _model_request(model: str, messages: list, max_tokens: int, tokens: int, span: dict,
+                         on_comment, section_files: list):
+    """
+    One request to `model` → (content, usage, finish_reason). A request
+    still silent after AI_HEDGE_AFTER seconds is raced against a copy, and
+    whichever starts answering first is kept.
+    """
+    async def start(claim, is_hedge: bool):
+        if is_hedge:
+            await rate_limiter.acquire(tokens)
+        if AI_STREAM_RESPONSES:
+            return await _stream_completion(messages, max_tokens, span, on_comment, section_files, model, claim)
+        response = await async_client.chat.completions.create(messages=messages,
+                                                              **completion_options(max_tokens, model))
+        if not claim():
+            return None
+        return response.choices[0].message.content or "", response.usage, response.choices[0].finish_reason
+
+    result, was_hedged = await hedged(start)
+    if was_hedged:
+        span["hedged"] = True
+    return result
+
+
+async def _complete_async(messages: list, max_tokens: int, on_comment=None, section_files: list = None,
+                          cost: dict = None) -> dict:
+    """
+    Rate-limited, retried chat completion parsed as review JSON.
+    Models are tried in order (OPENAI_MODEL, then AI_FALLBACK_MODELS):
+    a model whose circuit is open is skipped without a request, and a
+    model that keeps failing hands over to the next one. `cost` receives
+    the successful call's seconds and tokens.
+    """
+    tokens = estimate_request_tokens(messages, max_tokens)
+    chain = model_chain(OPENAI_MODEL)
+    last_error = None
+
+    async with _review_semaphore():
+        for model_index, model in enumerate(chain):
+            breaker = get_breaker(model)
+            max_retries = AI_MAX_RETRIES if model_index == len(chain) - 1 else min(AI_FALLBACK_AFTER_RETRIES,
+                                                                                  AI_MAX_RETRIES)
+            with stage_span("model_call", model=model) as span:
+                span["retries"] = 0
+                for attempt in range(max_retries + 1):
+                    if not breaker.allow():
+                        inc_counter("pr_review_model_calls_total", model=model, status="circuit_open")
+                        last_error = last_error or f"{model} circuit open"
+                        break
+                    try:
+                        # inside the try: a cancellation while waiting for the limiter must free the trial slot
+                        await rate_limiter.acquire(tokens)
+                        started = time.monotonic()
+                        content, usage, finish_reason = await _model_request(
+                            model, messages, max_tokens, tokens, span, on_comment, section_files
+                        )
+                    except asyncio.CancelledError:
+                        breaker.release()
+                        raise
+                    except StreamInterrupted as e:
+                        # its comments are already posted: no retry or fallback, keep what was streamed
+                        if _is_retryable(e.error):
+                            breaker.record_failure()
+                        else:
+                            breaker.release()
+                        inc_counter("pr_review_model_calls_total", model=model, status="interrupted")
+                        print(f"✂️ AI stream on {model} broke off after comments were posted; "
+                              f"keeping what was streamed -->", e.error)
+                        parsed = parse_review_content(e.content.strip())
+                        _mark_entries(parsed, "stream_interrupted", True)
+                        if model_index:
+                            _mark_entries(parsed, "fallback_model", model)
+                        return parsed
+                    except Exception as e:
+                        retryable = _is_retryable(e)
+                        # a rejected prompt says nothing about the model's health
+                        if retryable:
+                            breaker.record_failure()
+                        else:
+                            breaker.release()
+                        last_error = e
+                        if attempt < max_retries and retryable:
+                            delay = _retry_delay(e, attempt)
+                            span["retries"] += 1
+                            inc_counter("pr_review_http_retries_total", help_text="HTTP retries by upstream",
+                                        target="openai")
+                            print(f"🔁 Retrying AI review on {model} in {delay:.1f}s (attempt {attempt + 1}) -->", e)
+                            await asyncio.sleep(delay)
+                            continue
+                        inc_counter("pr_review_model_calls_total", model=model, status="error")
+                        print(f"❌ analyze_pr_with_ai_async error ({model}) -->", e)
+                        break
+
+                    breaker.record_success()
+                    record_usage(span, usage, model)
+                    inc_counter("pr_review_model_calls_total", help_text="Model calls by outcome",
+                                model=model, status="ok")
+                    if cost is not None:
+                        cost.update(seconds=time.monotonic() - started, tokens=_total_tokens(usage))
+                    parsed = parse_review_content(content.strip())
+                    if finish_reason == "length":
+                        span["truncated"] = True
+                        print(f"✂️ AI response hit max_tokens ({max_tokens}); keeping what was complete")
+                        _mark_entries(parsed, "max_tokens_reached", True)
+                    if parsed.get("json_repaired"):
+                        _mark_entries(parsed, "json_repaired", True)
+                    if model_index:
+                        # served by a fallback: flagged, and not cached under the primary model's key
+                        inc_counter("pr_review_model_fallbacks_total", help_text="Reviews served by a fallback model",
+                                    model=model)
+                        _mark_entries(parsed, "fallback_model", model)
+                    return parsed
+
+    return {"error": f"AI review failed: {last_error}"}
+
+
+def _mark_entries(review: dict, flag: str, value):
+    """Set `flag` on the review and on each of its per-file entries, so it survives split_batch_review."""
+    review[flag] = value
+    for entry in review.get("files", []) if isinstance(review.get("files"), list) else []:
+        if isinstance(entry, dict):
+            entry[flag] = value
+
+
+async def review_files_concurrently(ai_inputs: list) -> list:
+    """Review many single-file inputs at once; results keep the order of ai_inputs."""
+    return await asyncio.gather(*(analyze_pr_with_ai_async(ai_input) for ai_input in ai_inputs))
+
+
+# =========================================================
+# 🔹 Token-aware packing: split big files, bin-pack small ones
+# =========================================================
+async def analyze_batch_async(ai_input: dict, batch: list, on_comment=None, cost: dict = None) -> dict:
+    """Review one packed batch. A lone, unsplit file uses the plain single-file prompt."""
+    section_files = [section["file_name"] for section in batch]
+    if len(batch) == 1 and batch[0]["parts"] == 1:
+        single = {**ai_input, "files": [{"file_name": batch[0]["file_name"], "new_code": batch[0]["new_code"]}]}
+        review = await _complete_async(build_review_messages(single), OPENAI_MAX_TOKENS, on_comment, section_files,
+                                       cost)
+        return single_file_review(review)
+
+    messages = build_batch_messages(ai_input, batch)
+    max_tokens = min(OPENAI_MAX_TOKENS * len(batch), AI_MAX_OUTPUT_TOKENS)
+    return await _complete_async(messages, max_tokens, on_comment, section_files, cost)
+
+
+def _cached_reviews(keys: list) -> list:
+    # older entries hold the whole {"files": [...]} answer of a single-file request
+    return [single_file_review(review) if review is not None else None
+            for review in (get_cached_review(key) for key in keys)]
+
+
+# file cache key -> Future of that file's review while another review is sending it (e.g. the same diff in two PRs)
+_inflight_files = {}
+
+
+def _shareable(review: dict) -> bool:
+    return not any(review.get(flag) for flag in ("error", "partial_error", "stream_interrupted"))
+
+
+async def _shared_review(ai_input: dict, file: dict, future: asyncio.Future, on_comment) -> dict:
+    """Wait for the identical file another review is sending; review it here if that one fails or is cancelled."""
+    review = await asyncio.shield(future)
+    if review is None:
+        return (await review_files_packed({**ai_input, "files": [file]}, on_comment, budget_seconds=0))[0]
+    inc_counter("pr_review_files_deduplicated_total", help_text="File reviews served by an identical in-flight review")
+    review = copy.deepcopy(review)
+    # the leading review posted these only to its own PR
+    for comment in review.get("comments", []) if on_comment else []:
+        if comment.get("comment"):
+            on_comment(file["file_name"], comment)
+    return review
+
+
+def _store_reviews(entries: list):
+    for key, review, cost in entries:
+        if _cacheable(review):
+            store_review(key, review, cost.get("seconds", 0.0), int(cost.get("tokens", 0)))
+
+
+async def review_files_packed(ai_input: dict, on_comment=None, budget_seconds: float = AI_REVIEW_BUDGET_SECONDS) -> list:
+    """
+    Review every file of ai_input using as few requests as the token budget
+    allows. Returns one review per file, in the order of ai_input["files"].
+    `on_comment(file_name, comment)` is called for each comment as soon as
+    the model has finished writing it (and for the comments of a file
+    whose review was shared with another PR, once that review is done).
+
+    Requests still running after `budget_seconds` are cancelled; their
+    files come back as {"error": ..., "budget_exhausted": True} next to the
+    reviews that did finish.
+
+    The review cache is per file: files whose diff was reviewed before are
+    served from it and only the misses are packed, so changing one file
+    never re-sends the files it would have shared a request with. A miss
+    that another review (e.g. another PR in a bulk sweep) is already
+    sending is awaited instead of being packed again, whatever files
+    either request shares with it.
+    """
+    files = ai_input.get("files", [])
+    if not files:
+        return []
+
+    # the cache is SQLite on disk: keep its reads and writes off the event loop
+    keys = [file_cache_key(file) for file in files]
+    reviews = {file["file_name"]: review
+               for file, review in zip(files, await asyncio.to_thread(_cached_reviews, keys)) if review is not None}
+    if reviews:
+        print(f"⚡ {len(reviews)} of {len(files)} file reviews served from cache")
+    misses = [(file, key) for file, key in zip(files, keys) if file["file_name"] not in reviews]
+    shared = [(file, _inflight_files[key]) for file, key in misses if key in _inflight_files]
+    own = [(file, key) for file, key in misses if key not in _inflight_files]
+    futures = {}
+    for file, key in own:
+        futures[key] = _inflight_files[key] = asyncio.get_running_loop().create_future()
+
+    fresh = {}
+    try:
+        if misses:
+            fresh, costs = await _review_uncached(ai_input, [file for file, _ in own], shared, on_comment,
+                                                  budget_seconds)
+            await asyncio.to_thread(_store_reviews, [(key, fresh[file["file_name"]], costs[file["file_name"]])
+                                                     for file, key in own])
+    finally:
+        for file, key in own:
+            del _inflight_files[key]
+            review = fresh.get(file["file_name"])
+            futures[key].set_result(review if review is not None and _shareable(review) else None)
+    reviews.update(fresh)
+    return [reviews[file["file_name"]] for file in files]
+
+
+async def _review_uncached(ai_input: dict, files: list, shared: list, on_comment, budget_seconds: float):
+    """
+    Pack and review `files` and wait for the `shared` [(file, future)]
+    reviews, all within `budget_seconds`.
+    Returns ({file_name: review}, {file_name: {"seconds", "tokens"}}).
+    """
+    batches = []
+    if files:
+        code_budget = max(AI_REQUEST_TOKEN_BUDGET - prompt_overhead_tokens(ai_input), 512)
+        batches = pack_files(files, code_budget, OPENAI_MODEL)
+        print(f"📦 Packed {len(files)} files into {len(batches)} model requests")
+    if shared:
+        print(f"🔗 {len(shared)} files already being reviewed elsewhere; waiting for those reviews")
+
+    costs = [{} for _ in batches]
+    tasks = [asyncio.ensure_future(analyze_batch_async(ai_input, batch, on_comment, cost))
+             for batch, cost in zip(batches, costs)]
+    tasks += [asyncio.ensure_future(_shared_review(ai_input, file, future, on_comment)) for file, future in shared]
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=budget_seconds if budget_seconds > 0 else None)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+        inc_counter("pr_review_budget_exhausted_total", len(pending),
+                    "Model requests cancelled because the review budget ran out")
+        print(f"⏱️ AI review budget ({budget_seconds:.0f}s) exhausted; {len(pending)} of {len(tasks)} "
+              f"requests not finished")
+    exhausted = {"error": f"Review budget of {budget_seconds:.0f}s exhausted before this file was reviewed",
+                 "budget_exhausted": True}
+    results = [task.result() if task in done else dict(exhausted) for task in tasks]
+    batch_reviews = results[:len(batches)]
+
+    section_reviews, file_costs = {}, {file["file_name"]: {"seconds": 0.0, "tokens": 0} for file in files}
+    for batch, review, cost in zip(batches, batch_reviews, costs):
+        section_reviews.update(split_batch_review(batch, review))
+        # a request's cost is shared by its sections in proportion to their size
+        batch_tokens = sum(section["tokens"] for section in batch)
+        for section in batch:
+            share = section["tokens"] / batch_tokens
+            file_costs[section["file_name"]]["seconds"] += cost.get("seconds", 0.0) * share
+            file_costs[section["file_name"]]["tokens"] += cost.get("tokens", 0) * share
+
+    reviews = {}
+    for file in files:
+        parts = sorted((part, review) for (name, part), review in section_reviews.items() if name == file["file_name"])
+        reviews[file["file_name"]] = merge_file_reviews(file["file_name"], [review for _, review in parts])
+    for (file, _), review in zip(shared, results[len(batches):]):
+        review.setdefault("filePath", file["file_name"])
+        reviews[file["file_name"]] = review
+    return reviews, file_costs
@@ -0,0 +1,232 @@
+import os
+import copy
+import time
+import base64
+import threading
+import requests
+from urllib.parse import quote
+from concurrent.futures import Future
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from Services.metrics_service import inc_counter
+
+load_dotenv()
+
+# Default API host; registry entries may override it per repository
+AZURE_BASE_URL = os.getenv("AZURE_BASE_URL", "https://dev.azure.com").rstrip("/")
+
+AZURE_API_VERSION = "7.1"
+AZURE_HTTP_POOL_SIZE = int(os.getenv("AZURE_HTTP_POOL_SIZE", "10"))
+AZURE_MAX_RETRIES = int(os.getenv("AZURE_MAX_RETRIES", "5"))
+AZURE_RETRY_MAX_DELAY = float(os.getenv("AZURE_RETRY_MAX_DELAY", "60"))
+AZURE_CACHE_TTL_SECONDS = float(os.getenv("AZURE_CACHE_TTL_SECONDS", "30"))
+AZURE_CACHE_MAX_ENTRIES = int(os.getenv("AZURE_CACHE_MAX_ENTRIES", "512"))
+
+
+def encode_pat(pat: str) -> str:
+    token_bytes = f":{pat}".encode("ascii")
+    return base64.b64encode(token_bytes).decode("ascii")
+
+
+class BlobTooLargeError(ValueError):
+    pass
+
+
+class AzureDevOpsClient:
+    """
+    One pooled session for every Azure DevOps REST call of a repository
+    (one client per registered repository, see repo_registry_service).
+
+    GETs go through a small in-memory cache: fresh entries (younger than the
+    TTL) are served without a request, stale ones are revalidated with
+    If-None-Match so an unchanged resource costs a 304 instead of a full
+    body, and concurrent identical GETs share a single in-flight request.
+    """
+
+    def __init__(self, base_url: str, org: str, project: str, repo_id: str, pat: str,
+                 pool_size: int = AZURE_HTTP_POOL_SIZE, cache_ttl: float = AZURE_CACHE_TTL_SECONDS):
+        self.base_url = base_url.rstrip("/")
+        self.org = org
+        self.project = project
+        self.repo_id = repo_id
+        self.cache_ttl = cache_ttl
+        self._auth_header = f"Basic {encode_pat(pat or '')}"
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._cache = {}        # url -> {"body", "etag", "fetched_at"}
+        self._inflight = {}     # url -> Future of the leader's GET
+
+    # =========================================================
+    # 🔹 URLs
+    # =========================================================
+    def repo_url(self, resource: str, **params) -> str:
+        query = "&".join([f"{k}={v}" for k, v in params.items()] + [f"api-version={AZURE_API_VERSION}"])
+        return (f"{self.base_url}/{self.org}/{self.project}/_apis/git/repositories/"
+                f"{self.repo_id}/{resource}?{query}")
+
+    def pull_request_url(self, pr_id: int) -> str:
+        return self.repo_url(f"pullRequests/{pr_id}")
+
+    def threads_url(self, pr_id: int) -> str:
+        return self.repo_url(f"pullRequests/{pr_id}/threads")
+
+    # =========================================================
+    # 🔹 Transport
+    # =========================================================
+    def request(self, method: str, url: str, headers: dict = None, **kwargs) -> requests.Response:
+        """Send a request, sleeping on 429/503 for Retry-After (or exponential backoff)."""
+        headers = {"Content-Type": "application/json", "Authorization": self._auth_header, **(headers or {})}
+        for attempt in range(AZURE_MAX_RETRIES + 1):
+            response = self.session.request(method, url, headers=headers, timeout=30, **kwargs)
+            inc_counter("pr_review_azure_requests_total", help_text="Azure DevOps REST calls",
+                        method=method, status=response.status_code)
+            if response.status_code not in (429, 503) or attempt == AZURE_MAX_RETRIES:
+                return response
+
+            retry_after = response.headers.get("Retry-After")
+            try:
+                delay = float(retry_after) if retry_after else 2 ** attempt
+            except ValueError:
+                delay = 2 ** attempt
+            delay = min(delay, AZURE_RETRY_MAX_DELAY)
+            response.close()   # hand the connection back to the pool (streamed responses are not read)
+            inc_counter("pr_review_http_retries_total", help_text="HTTP retries by upstream", target="azure")
+            print(f"⏳ Azure throttled ({response.status_code}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+        return response
+
+    # =========================================================
+    # 🔹 Cached / coalesced GET
+    # =========================================================
+    def get_json(self, url: str, ttl: float = None) -> dict:
+        """
+        GET a JSON resource through the cache. `ttl=0` always revalidates
+        (still cheap when the server answers 304). Raises requests.HTTPError
+        on non-2xx responses.
+        """
+        ttl = self.cache_ttl if ttl is None else ttl
+        with self._lock:
+            entry = self._cache.get(url)
+            if entry and time.monotonic() - entry["fetched_at"] < ttl:
+                inc_counter("pr_review_azure_cache_total", help_text="Azure GET cache outcomes", result="hit")
+                return copy.deepcopy(entry["body"])
+            future = self._inflight.get(url)
+            leader = future is None
+            if leader:
+                future = self._inflight[url] = Future()
+
+        if not leader:
+            inc_counter("pr_review_azure_cache_total", result="coalesced")
+            return copy.deepcopy(future.result())
+
+        try:
+            body = self._fetch(url, entry)
+            future.set_result(body)
+            return copy.deepcopy(body)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(url, None)
+
+    def _fetch(self, url: str, entry: dict) -> dict:
+        headers = {"If-None-Match": entry["etag"]} if entry and entry.get("etag") else None
+        response = self.request("GET", url, headers=headers)
+
+        if response.status_code == 304 and entry:
+            inc_counter("pr_review_azure_cache_total", result="revalidated")
+            with self._lock:
+                entry["fetched_at"] = time.monotonic()
+            return entry["body"]
+
+        response.raise_for_status()
+        inc_counter("pr_review_azure_cache_total", result="miss")
+        body = response.json()
+        with self._lock:
+            if len(self._cache) >= AZURE_CACHE_MAX_ENTRIES and url not in self._cache:
+                oldest = min(self._cache, key=lambda key: self._cache[key]["fetched_at"])
+                del self._cache[oldest]
+            self._cache[url] = {"body": body, "etag": response.headers.get("ETag"), "fetched_at": time.monotonic()}
+        return body
+
+    def invalidate(self, url: str):
+        with self._lock:
+            self._cache.pop(url, None)
+
+    # =========================================================
+    # 🔹 Endpoints
+    # =========================================================
+    def get_pull_request(self, pr_id: int) -> dict:
+        # Always revalidated: a review started right after a push must see the new source commit
+        return self.get_json(self.pull_request_url(pr_id), ttl=0)
+
+    def list_active_pull_requests(self, page_size: int = 100) -> list:
+        """Every active PR of the repository, following $skip pages."""
+        pull_requests, skip = [], 0
+        while True:
+            page = self.get_json(self.repo_url(
+                "pullrequests", **{"searchCriteria.status": "active", "$top": page_size, "$skip": skip}
+            )).get("value", [])
+            pull_requests.extend(page)
+            if len(page) < page_size:
+                return pull_requests
+            skip += page_size
+
+    def list_iterations(self, pr_id: int) -> list:
+        # Always revalidated, like the PR itself: a new push adds an iteration
+        return self.get_json(self.repo_url(f"pullRequests/{pr_id}/iterations"), ttl=0).get("value", [])
+
+    def list_iteration_changes(self, pr_id: int, iteration_id: int, page_size: int = 1000) -> list:
+        """Every change entry of an iteration (vs. the merge base), following nextSkip pages."""
+        entries, skip = [], 0
+        while True:
+            page = self.get_json(self.repo_url(
+                f"pullRequests/{pr_id}/iterations/{iteration_id}/changes",
+                **{"$top": page_size, "$skip": skip, "$compareTo": 0}
+            ))
+            entries.extend(page.get("changeEntries", []))
+            next_skip = page.get("nextSkip") or 0
+            if not next_skip or next_skip <= skip:
+                return entries
+            skip = next_skip
+
+    def get_blob_text(self, object_id: str, max_bytes: int = 0) -> str:
+        """
+        Raw content of one blob (not cached here: callers fetch each changed
+        blob once). The body is streamed; past `max_bytes` (0 = no limit) the
+        download stops and BlobTooLargeError is raised.
+        """
+        response = self.request("GET", self.repo_url(f"blobs/{object_id}", **{"$format": "octetstream"}),
+                                headers={"Accept": "application/octet-stream"}, stream=True)
+        with response:
+            response.raise_for_status()
+            chunks, size = [], 0
+            for chunk in response.iter_content(chunk_size=65536):
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise BlobTooLargeError(f"Blob {object_id} is larger than {max_bytes} bytes")
+                chunks.append(chunk)
+        return b"".join(chunks).decode("utf-8", errors="replace")
+
+    def get_item_text(self, path: str, commit_id: str) -> str:
+        """Content of the file at `path` as of `commit_id`; raises requests.HTTPError (404) if it doesn't exist."""
+        response = self.request("GET", self.repo_url(
+            "items", **{"path": quote("/" + path.lstrip("/")), "versionDescriptor.version": commit_id,
+                        "versionDescriptor.versionType": "commit", "$format": "octetstream"}
+        ), headers={"Accept": "application/octet-stream"})
+        response.raise_for_status()
+        return response.content.decode("utf-8", errors="replace")
+
+    def list_threads(self, pr_id: int) -> list:
+        # Always revalidated: comment dedup needs what is on the PR right now
+        return self.get_json(self.threads_url(pr_id), ttl=0).get("value", [])
+
+    def create_thread(self, pr_id: int, payload: dict) -> requests.Response:
+        return self.request("POST", self.threads_url(pr_id), json=payload)
+
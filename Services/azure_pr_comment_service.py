@@ -1,60 +1,244 @@
 import os
+import re
+import hashlib
 import requests
-import base64
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from Services.metrics_service import stage_span, inc_counter
+from Services.repo_registry_service import RepoConfig, get_repo
 
 load_dotenv()
 
-AZURE_ORG = os.getenv("AZURE_ORG")
-AZURE_PROJECT = os.getenv("AZURE_PROJECT")
-AZURE_REPO_ID = os.getenv("AZURE_REPO_ID")
-AZURE_PAT = os.getenv("AZURE_PAT")
-
-def encode_pat(pat: str):
-    token_bytes = f":{pat}".encode("ascii")
-    return base64.b64encode(token_bytes).decode("ascii")
-
-def post_comments_to_azure(pr_id: int, ai_review: dict, file_path: str):
-    """Posts AI-generated comments to Azure DevOps PR inline"""
-    url = f"https://dev.azure.com/{AZURE_ORG}/{AZURE_PROJECT}/_apis/git/repositories/{AZURE_REPO_ID}/pullRequests/{pr_id}/threads?api-version=7.1"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Basic {encode_pat(AZURE_PAT)}"
+AZURE_COMMENT_CONCURRENCY = int(os.getenv("AZURE_COMMENT_CONCURRENCY", "4"))
+
+# ✅ One process-wide pool, so concurrent PR reviews (of every repository) share the comment-posting budget
+_post_pool = ThreadPoolExecutor(max_workers=AZURE_COMMENT_CONCURRENCY, thread_name_prefix="azure-comments")
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+# =========================================================
+# 🔹 Dedup against threads already on the PR
+# =========================================================
+def comment_fingerprint(file_path: str, line_number, text: str) -> str:
+    """Normalized identity of a comment: path, line and whitespace/case-folded text."""
+    norm_path = (file_path or "").strip().lstrip("/").lower()
+    norm_text = _WHITESPACE_RE.sub(" ", (text or "")).strip().lower()
+    return hashlib.sha1(f"{norm_path}|{line_number}|{norm_text}".encode("utf-8")).hexdigest()
+
+
+def fetch_existing_fingerprints(pr_id: int, repo: RepoConfig = None) -> set:
+    """One GET of the PR's threads → fingerprints of every comment already posted."""
+    try:
+        with stage_span("comment_threads_fetch"):
+            threads = (repo or get_repo()).client.list_threads(pr_id)
+    except requests.exceptions.RequestException as e:
+        print(f"⚠️ Could not load existing threads for PR {pr_id}: {e}")
+        return set()
+
+    fingerprints = set()
+    for thread in threads:
+        context = thread.get("threadContext") or {}
+        line_number = (context.get("rightFileStart") or {}).get("line")
+        for comment in thread.get("comments", []):
+            fingerprints.add(comment_fingerprint(context.get("filePath"), line_number, comment.get("content")))
+    return fingerprints
+
+
+def _comment_content(line_hint, comment_text, near_line=None) -> str:
+    if near_line is not None:
+        # file-level thread: keep the model's reference so the reader can find the spot
+        return f"💬 **AI Suggestion ({line_hint}, near line {near_line}):** {comment_text}"
+    return f"💬 **AI Suggestion ({line_hint}):** {comment_text}"
+
+
+def _thread_payload(file_path: str, line_number, content: str, line_text: str = None) -> dict:
+    """Thread on a new-file line (spanning its text when known), or a file-level thread when line_number is None."""
+    context = {"filePath": file_path}
+    if line_number is not None:
+        context["rightFileStart"] = {"line": line_number, "offset": 1}
+        context["rightFileEnd"] = {"line": line_number, "offset": len(line_text) + 1 if line_text else 1}
+    return {
+        "comments": [
+            {
+                "parentCommentId": 0,
+                "content": content,
+                "commentType": 1
+            }
+        ],
+        "status": "active",
+        "threadContext": context
     }
 
+
+# =========================================================
+# 🔹 Anchoring comments on the diff
+# =========================================================
+def _anchor_comment(file_path: str, comment: dict, line_indexes: dict = None) -> dict:
+    """
+    Where a model comment gets posted: {line_number, requested_line, anchor,
+    line_text, content}. With the diff's line index the line is checked
+    against `line_hint` and snapped locally; comments that land outside the
+    diff become file-level threads (line_number None). Without an index the
+    model's line is used as is ("unindexed").
+    """
+    requested = comment.get("line_number")
+    index = line_indexes.get(file_path) if line_indexes else None
+    if index is None:
+        line_number, anchor, line_text = requested, "unindexed", None
+    else:
+        line_number, anchor = index.anchor(requested, comment.get("line_hint"))
+        line_text = index.text(line_number)
+    near_line = requested if anchor == "file" else None
+    return {
+        "line_number": line_number,
+        "requested_line": requested,
+        "anchor": anchor,
+        "line_text": line_text,
+        "content": _comment_content(comment.get("line_hint"), comment.get("comment"), near_line)
+    }
+
+
+def _post_thread(pr_id: int, payload: dict, repo: RepoConfig) -> str:
+    try:
+        with stage_span("comment_post"):
+            response = repo.client.create_thread(pr_id, payload)
+        return "✅ Posted" if response.status_code in [200, 201] else f"❌ {response.text}"
+    except requests.exceptions.RequestException as e:
+        return f"❌ {e}"
+
+
+# =========================================================
+# 🔹 Early publishing while the model is still streaming
+# =========================================================
+class EarlyCommentPublisher:
+    """
+    Accepts comments one at a time as they stream out of the model and
+    posts each on the shared pool right away. The PR's existing threads are
+    loaded once (`load_existing`, run concurrently with the review); posts
+    wait for that so dedup still holds. The final `post_review_comments`
+    pass reuses these posts instead of sending them again.
+    """
+
+    def __init__(self, pr_id: int, repo: RepoConfig = None, line_indexes: dict = None):
+        self.pr_id = pr_id
+        self.repo = repo or get_repo()
+        self.line_indexes = line_indexes
+        self.existing = set()
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+        self._posts = {}   # fingerprint -> Future of the post status
+        self._context = contextvars.copy_context()
+
+    def load_existing(self):
+        try:
+            self.existing = fetch_existing_fingerprints(self.pr_id, self.repo)
+        finally:
+            self._loaded.set()
+
+    def wait_loaded(self) -> set:
+        self._loaded.wait()
+        return self.existing
+
+    def submit(self, file_path: str, comment: dict):
+        anchored = _anchor_comment(file_path, comment, self.line_indexes)
+        fingerprint = comment_fingerprint(file_path, anchored["line_number"], anchored["content"])
+        with self._lock:
+            if fingerprint in self._posts:
+                return
+            self._posts[fingerprint] = _post_pool.submit(
+                self._context.copy().run, self._post_if_new, fingerprint, file_path, anchored
+            )
+
+    def _post_if_new(self, fingerprint: str, file_path: str, anchored: dict) -> str:
+        if fingerprint in self.wait_loaded():
+            return "⏭️ Duplicate"
+        payload = _thread_payload(file_path, anchored["line_number"], anchored["content"], anchored["line_text"])
+        return _post_thread(self.pr_id, payload, self.repo)
+
+    def early_post(self, fingerprint: str):
+        with self._lock:
+            return self._posts.get(fingerprint)
+
+
+# =========================================================
+# 🔹 Publishing
+# =========================================================
+def post_comments_to_azure(pr_id: int, ai_review: dict, file_path: str, existing_fingerprints: set = None,
+                           publisher: EarlyCommentPublisher = None, repo: RepoConfig = None,
+                           line_indexes: dict = None):
+    """
+    Posts AI-generated comments to Azure DevOps PR inline, anchored on the
+    diff via `line_indexes` (see _anchor_comment).
+    Comments whose fingerprint is already on the PR are skipped; comments
+    the publisher already posted while streaming report that post's status.
+    """
+    repo = repo or (publisher.repo if publisher else get_repo())
+    if line_indexes is None and publisher:
+        line_indexes = publisher.line_indexes
+    if existing_fingerprints is None:
+        existing_fingerprints = fetch_existing_fingerprints(pr_id, repo)
+
     comments = ai_review.get("comments", [])
-    posted_results = []
-
-    for c in comments:
-        line_number = c.get("line_number")
-        comment_text = c.get("comment")
-        line_hint = c.get("line_hint")
-
-        payload = {
-            "comments": [
-                {
-                    "parentCommentId": 0,
-                    "content": f"💬 **AI Suggestion ({line_hint}):** {comment_text}",
-                    "commentType": 1
-                }
-            ],
-            "status": "active",
-            "threadContext": {
-                "filePath": file_path,
-                "rightFileStart": {"line": line_number, "offset": 1},
-                "rightFileEnd": {"line": line_number, "offset": 1},
-                "leftFileStart": {"line": line_number, "offset": 1},
-                "leftFileEnd": {"line": line_number, "offset": 1}
-            }
-        }
+    to_post = []
+    early = []
+    posted_results = [None] * len(comments)
+
+    for index, c in enumerate(comments):
+        anchored = _anchor_comment(file_path, c, line_indexes)
+        inc_counter("pr_review_comment_anchors_total", help_text="Model comments by how they were anchored",
+                    anchor=anchored["anchor"])
+        entry = {"line_hint": c.get("line_hint"), "line_number": anchored["line_number"],
+                 "requested_line": anchored["requested_line"], "anchor": anchored["anchor"]}
+        fingerprint = comment_fingerprint(file_path, anchored["line_number"], anchored["content"])
+
+        early_post = publisher.early_post(fingerprint) if publisher else None
+        if early_post is not None:
+            early.append((index, entry, early_post))
+            continue
+        if fingerprint in existing_fingerprints:
+            posted_results[index] = {**entry, "status": "⏭️ Duplicate"}
+            continue
+        # also guards against the model repeating itself within one review
+        existing_fingerprints.add(fingerprint)
+
+        payload = _thread_payload(file_path, anchored["line_number"], anchored["content"], anchored["line_text"])
+        to_post.append((index, entry, payload))
 
+    def _post(item):
+        index, entry, payload = item
+        return index, {**entry, "status": _post_thread(pr_id, payload, repo)}
+
+    if to_post:
+        # Each post runs in a copy of this context so its span joins the request's timings
+        context = contextvars.copy_context()
+        for index, result in _post_pool.map(lambda item: context.copy().run(_post, item), to_post):
+            posted_results[index] = result
+
+    skipped = len(comments) - len(to_post) - len(early)
+    for index, entry, early_post in early:
+        status = early_post.result()
+        skipped += status.startswith("⏭️")
+        posted_results[index] = {**entry, "status": status, "early": True}
+
+    return {
+        "total_comments": len(posted_results),
+        "skipped_duplicates": skipped,
+        "results": posted_results
+    }
 
-        response = requests.post(url, headers=headers, json=payload)
-        result = {
-            "line_hint": line_hint,
-            "line_number": line_number,
-            "status": "✅ Posted" if response.status_code in [200, 201] else f"❌ {response.text}"
-        }
-        posted_results.append(result)
 
-    return {"total_comments": len(posted_results), "results": posted_results}
+def post_review_comments(pr_id: int, ai_reviews: list, file_paths: list = None,
+                         publisher: EarlyCommentPublisher = None, repo: RepoConfig = None,
+                         line_indexes: dict = None) -> list:
+    """Post every file's review for a PR, loading the PR's existing threads only once."""
+    repo = repo or (publisher.repo if publisher else get_repo())
+    existing_fingerprints = publisher.wait_loaded() if publisher else fetch_existing_fingerprints(pr_id, repo)
+    results = []
+    for index, ai_review in enumerate(ai_reviews):
+        file_path = file_paths[index] if file_paths else ai_review.get("filePath")
+        results.append(post_comments_to_azure(pr_id, ai_review, file_path, existing_fingerprints, publisher, repo,
+                                              line_indexes))
+    return results
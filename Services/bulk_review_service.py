@@ -0,0 +1,88 @@
+import os
+import time
+import asyncio
+import requests
+from dotenv import load_dotenv
+from Services.diff_service import choose_diff_engine, sync_repository
+from Services.repo_cache_service import REVIEW_FETCH_STRATEGY
+from Services.review_pipeline_service import run_pr_review
+from Services.repo_registry_service import RepoConfig, get_repo
+
+load_dotenv()
+
+# PR pipelines running at once in a bulk sweep; model calls and comment posts
+# are further bounded by the process-wide AI / Azure limits
+REVIEW_BULK_CONCURRENCY = int(os.getenv("REVIEW_BULK_CONCURRENCY", "4"))
+
+
+def list_active_pr_ids(repo: RepoConfig = None) -> list:
+    repo = repo or get_repo()
+    return [pr["pullRequestId"] for pr in repo.client.list_active_pull_requests()]
+
+
+async def review_prs_bulk(pr_ids: list = None, incremental: bool = False, include_timings: bool = False,
+                          repo: RepoConfig = None):
+    """
+    Review many PRs of one repository and yield one result dict per PR as
+    each completes, followed by a summary. `pr_ids=None` sweeps every active PR.
+
+    The repository mirror is fetched once up front and reused by every PR;
+    a file with an identical diff in several PRs is sent to the model once,
+    whatever files it is packed with (per-file dedup and cache, see
+    ai_review_service.review_files_packed).
+    """
+    repo = repo or get_repo()
+    started = time.perf_counter()
+    if pr_ids is None:
+        try:
+            pr_ids = await asyncio.to_thread(list_active_pr_ids, repo)
+        except requests.exceptions.RequestException as e:
+            yield {"type": "error", "error": f"Failed to list active PRs: {e}"}
+            return
+    pr_ids = list(dict.fromkeys(pr_ids))
+    yield {"type": "scheduled", "repo": repo.name, "pr_ids": pr_ids}
+
+    # One shared fetch per repository; PR runs reuse any fetch started after this point.
+    # Partial mirrors fetch per PR (two branches each); a shared target branch is fetched once.
+    fresh_since = time.time()
+    if pr_ids and REVIEW_FETCH_STRATEGY == "full" and choose_diff_engine(pr_ids[0], repo=repo) == "git":
+        try:
+            await asyncio.to_thread(sync_repository, repo, fresh_since)
+        except Exception as e:
+            print("⚠️ Shared mirror fetch failed, PRs will fetch on their own -->", e)
+
+    semaphore = asyncio.Semaphore(REVIEW_BULK_CONCURRENCY)
+
+    async def _review(pr_id: int) -> dict:
+        async with semaphore:
+            pr_started = time.perf_counter()
+            try:
+                data = await run_pr_review(pr_id, include_timings=include_timings,
+                                           incremental=incremental, fresh_since=fresh_since, repo=repo)
+                entry = {"type": "result", "pr_id": pr_id, "status": "succeeded", "data": data}
+            except Exception as e:
+                print(f"❌ Bulk review of PR {pr_id} failed -->", e)
+                entry = {"type": "result", "pr_id": pr_id, "status": "failed", "error": str(e)}
+            entry["seconds"] = round(time.perf_counter() - pr_started, 3)
+            return entry
+
+    tasks = [asyncio.create_task(_review(pr_id)) for pr_id in pr_ids]
+    succeeded = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            entry = await next_done
+            succeeded += entry["status"] == "succeeded"
+            yield entry
+    finally:
+        # client went away mid-stream: don't keep reviewing for nobody
+        for task in tasks:
+            task.cancel()
+
+    yield {
+        "type": "summary",
+        "repo": repo.name,
+        "total": len(pr_ids),
+        "succeeded": succeeded,
+        "failed": len(pr_ids) - succeeded,
+        "seconds": round(time.perf_counter() - started, 3)
+    }
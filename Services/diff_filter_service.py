@@ -0,0 +1,254 @@
+import os
+import re
+import math
+import fnmatch
+from collections import Counter
+from dotenv import load_dotenv
+from Services.token_packing_service import count_tokens, SECTION_OVERHEAD_TOKENS
+
+load_dotenv()
+
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+REVIEW_PREFILTER_ENABLED = os.getenv("REVIEW_PREFILTER_ENABLED", "true").lower() == "true"
+# Files matching these globs never reach the model
+REVIEW_SKIP_GLOBS = [g.strip() for g in os.getenv(
+    "REVIEW_SKIP_GLOBS",
+    "*.min.js,*.bundle.js,*.chunk.js,*.d.ts,*.map,*.snap,**/__snapshots__/**,**/__generated__/**,"
+    "*.generated.*,**/dist/**,**/build/**,**/vendor/**,**/node_modules/**,"
+    "package-lock.json,yarn.lock,pnpm-lock.yaml"
+).split(",") if g.strip()]
+# Files matching these globs are reviewed last and are the first to go when over REVIEW_PR_TOKEN_BUDGET
+REVIEW_DOWNRANK_GLOBS = [g.strip() for g in os.getenv(
+    "REVIEW_DOWNRANK_GLOBS",
+    "*.test.*,*.spec.*,**/__tests__/**,**/__mocks__/**,*.stories.*"
+).split(",") if g.strip()]
+# Added lines longer than this mark a file as minified / machine-written
+REVIEW_MAX_LINE_LENGTH = int(os.getenv("REVIEW_MAX_LINE_LENGTH", "500"))
+# Bits per character of the added text above which it is treated as encoded data
+REVIEW_MAX_ENTROPY = float(os.getenv("REVIEW_MAX_ENTROPY", "5.2"))
+# Estimated input tokens per PR (0 = unlimited); down-ranked files are dropped first
+REVIEW_PR_TOKEN_BUDGET = int(os.getenv("REVIEW_PR_TOKEN_BUDGET", "0"))
+
+# Too little added text to judge line length / entropy reliably
+_MIN_HEURISTIC_CHARS = 256
+_WHITESPACE_RE = re.compile(r"\s+")
+# JS/TS string literals, whose whitespace is content rather than formatting
+_STRING_LITERAL_RE = re.compile(r"\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`")
+# Code tokens for whitespace-insensitive comparison (`return x` stays two tokens, unlike `returnx`)
+_CODE_TOKEN_RE = re.compile(r"\w+|\S")
+_IMPORT_LINE_RE = re.compile(
+    r"^(import\b|export\s+(\*|\{[^}]*\})\s+from\b|(const|let|var)\s+[^=]+=\s*require\()"
+)
+# Continuation lines of a multi-line `import { a, b } from "x"`
+_IMPORT_FRAGMENT_RE = re.compile(r"^([\w$]+(\s+as\s+[\w$]+)?,?|\}\s*from\s+['\"].*|\{)$")
+
+
+# =========================================================
+# 🔹 Globs and .gitattributes
+# =========================================================
+def _glob_match(path: str, pattern: str) -> bool:
+    """
+    gitattributes-style match: a pattern without "/" matches the basename at
+    any depth, "dir/" matches everything below dir, and "**/" may match nothing.
+    """
+    pattern = pattern.lstrip("/")
+    if pattern.endswith("/"):
+        pattern += "**"
+    if "/" not in pattern:
+        return fnmatch.fnmatchcase(path.rsplit("/", 1)[-1], pattern)
+    if fnmatch.fnmatchcase(path, pattern):
+        return True
+    return pattern.startswith("**/") and fnmatch.fnmatchcase(path, pattern[3:])
+
+
+def _match_any(path: str, patterns: list):
+    return next((pattern for pattern in patterns if _glob_match(path, pattern)), None)
+
+
+def parse_gitattributes(text: str) -> list:
+    """
+    [(pattern, {attribute: bool})] for the linguist attributes of a root
+    .gitattributes file, in file order (later lines win).
+    """
+    rules = []
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        pattern, *attributes = line.split()
+        flags = {}
+        for attribute in attributes:
+            name, _, value = attribute.lstrip("-!").partition("=")
+            if name not in ("linguist-generated", "linguist-vendored"):
+                continue
+            flags[name] = not attribute.startswith(("-", "!")) and value.lower() not in ("false", "0")
+        if flags:
+            rules.append((pattern, flags))
+    return rules
+
+
+def _linguist_flag(path: str, rules: list):
+    """"linguist-generated" / "linguist-vendored" if the last matching rule sets it, else None."""
+    state = {}
+    for pattern, flags in rules:
+        if _glob_match(path, pattern):
+            state.update(flags)
+    return next((name for name in ("linguist-generated", "linguist-vendored") if state.get(name)), None)
+
+
+# =========================================================
+# 🔹 Content heuristics
+# =========================================================
+def _shannon_entropy(text: str) -> float:
+    counts = Counter(text)
+    total = len(text)
+    return -sum(count / total * math.log2(count / total) for count in counts.values())
+
+
+def _changed_lines(file_diff, kind: str) -> list:
+    return [line.text for hunk in file_diff.hunks for line in hunk.lines if line.kind == kind]
+
+
+def _code_tokens(lines: list) -> list:
+    """The lines' tokens with formatting whitespace dropped; each string literal is one verbatim token."""
+    text = "\n".join(lines)
+    tokens, position = [], 0
+    for literal in _STRING_LITERAL_RE.finditer(text):
+        tokens += _CODE_TOKEN_RE.findall(text, position, literal.start())
+        tokens.append(literal.group())
+        position = literal.end()
+    return tokens + _CODE_TOKEN_RE.findall(text, position)
+
+
+def _is_whitespace_only(file_diff) -> bool:
+    """
+    Every hunk reads the same before and after once formatting whitespace
+    is ignored: each hunk's old side (context + removed) is compared with
+    its new side (context + added) in order, so moved or reordered code and
+    edits inside string literals still count as changes.
+    """
+    for hunk in file_diff.hunks:
+        old_side = [line.text for line in hunk.lines if line.kind != "+"]
+        new_side = [line.text for line in hunk.lines if line.kind != "-"]
+        if _code_tokens(old_side) != _code_tokens(new_side):
+            return False
+    return True
+
+
+def _is_import_reorder_only(removed: list, added: list) -> bool:
+    normalize = lambda lines: Counter(_WHITESPACE_RE.sub(" ", line).strip() for line in lines if line.strip())
+    removed_lines, added_lines = normalize(removed), normalize(added)
+    if removed_lines != added_lines:
+        return False
+    changed = list(added_lines)
+    return any(_IMPORT_LINE_RE.match(line) for line in changed) and all(
+        _IMPORT_LINE_RE.match(line) or _IMPORT_FRAGMENT_RE.match(line) for line in changed
+    )
+
+
+def classify_file(file_diff, attribute_rules: list = None):
+    """
+    (action, reason) for one FileDiff: action is "skip", "downrank" or
+    "review". Deleted / new-code-less files are left to build_ai_input.
+    """
+    path = file_diff.file_path
+    if file_diff.truncated and not file_diff.hunks:
+        return "skip", f"too large: {file_diff.truncated}"
+    if file_diff.change_type in ("renamed", "copied") and not file_diff.hunks:
+        return "skip", f"{file_diff.change_type} from {file_diff.old_path} without changes"
+
+    pattern = _match_any(path, REVIEW_SKIP_GLOBS)
+    if pattern:
+        return "skip", f"path matches {pattern}"
+    flag = _linguist_flag(path, attribute_rules or [])
+    if flag:
+        return "skip", f".gitattributes {flag}"
+
+    removed, added = _changed_lines(file_diff, "-"), _changed_lines(file_diff, "+")
+    if removed or added:
+        if _is_whitespace_only(file_diff):
+            return "skip", "whitespace-only change"
+        if removed and _is_import_reorder_only(removed, added):
+            return "skip", "import order only"
+
+    added_text = "\n".join(added)
+    if len(added_text) >= _MIN_HEURISTIC_CHARS:
+        longest = max(len(line) for line in added)
+        if longest > REVIEW_MAX_LINE_LENGTH:
+            return "skip", f"minified or generated (line of {longest} chars)"
+        entropy = _shannon_entropy(added_text)
+        if entropy > REVIEW_MAX_ENTROPY:
+            return "skip", f"high-entropy content ({entropy:.2f} bits/char)"
+
+    pattern = _match_any(path, REVIEW_DOWNRANK_GLOBS)
+    if pattern:
+        return "downrank", f"path matches {pattern}"
+    return "review", None
+
+
+# =========================================================
+# 🔹 Pipeline stage
+# =========================================================
+def _estimated_tokens(file_diff) -> int:
+    new_code = file_diff.numbered_new_code()
+    return count_tokens(new_code, OPENAI_MODEL) + SECTION_OVERHEAD_TOKENS if new_code else 0
+
+
+def prefilter_file_diffs(file_diffs: list, gitattributes_text: str = None,
+                         token_budget: int = REVIEW_PR_TOKEN_BUDGET):
+    """
+    Split the PR's FileDiffs into what goes to the model and a report of
+    what was left out. Kept files are returned in review order: regular
+    files first, then down-ranked ones (tests, stories, ...), which are
+    also the first to be dropped when the PR exceeds `token_budget`.
+
+    Returns (kept_file_diffs, report) where report is
+    {"reviewed", "downranked", "skipped": [{file, reason, estimated_tokens}],
+     "truncated": [{file, reason}], "estimated_tokens_saved"}; `truncated`
+    lists kept files the diff size caps cut short.
+    """
+    if not REVIEW_PREFILTER_ENABLED:
+        return list(file_diffs), {"enabled": False, "reviewed": len(file_diffs), "downranked": [],
+                                  "skipped": [], "truncated": _truncated(file_diffs), "estimated_tokens_saved": 0}
+
+    rules = parse_gitattributes(gitattributes_text)
+    primary, downranked, skipped = [], [], []
+    for file_diff in file_diffs:
+        action, reason = classify_file(file_diff, rules)
+        if action == "skip":
+            skipped.append({"file": file_diff.file_path, "reason": reason,
+                            "estimated_tokens": _estimated_tokens(file_diff)})
+        elif action == "downrank":
+            downranked.append((file_diff, reason))
+        else:
+            primary.append(file_diff)
+
+    kept = list(primary)
+    if token_budget > 0:
+        used = sum(_estimated_tokens(file_diff) for file_diff in primary)
+        for file_diff, reason in downranked:
+            tokens = _estimated_tokens(file_diff)
+            if used + tokens > token_budget:
+                skipped.append({"file": file_diff.file_path, "reason": f"{reason}; over PR token budget",
+                                "estimated_tokens": tokens})
+                continue
+            used += tokens
+            kept.append(file_diff)
+    else:
+        kept.extend(file_diff for file_diff, _ in downranked)
+
+    kept_paths = {file_diff.file_path for file_diff in kept}
+    return kept, {
+        "enabled": True,
+        "reviewed": len(kept),
+        "downranked": [{"file": f.file_path, "reason": reason} for f, reason in downranked
+                       if f.file_path in kept_paths],
+        "skipped": skipped,
+        "truncated": _truncated(kept),
+        "estimated_tokens_saved": sum(entry["estimated_tokens"] for entry in skipped)
+    }
+
+
+def _truncated(file_diffs) -> list:
+    return [{"file": f.file_path, "reason": f.truncated} for f in file_diffs if f.truncated]
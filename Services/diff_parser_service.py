@@ -0,0 +1,306 @@
+import os
+import re
+import difflib
+import subprocess
+from itertools import chain
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional
+from dotenv import load_dotenv
+from Services.repo_cache_service import git_deadline
+
+load_dotenv()
+
+# Per-file caps on what is kept of a diff (0 = unlimited); the rest is dropped while streaming
+REVIEW_DIFF_MAX_FILE_LINES = int(os.getenv("REVIEW_DIFF_MAX_FILE_LINES", "10000"))
+REVIEW_DIFF_MAX_FILE_BYTES = int(os.getenv("REVIEW_DIFF_MAX_FILE_BYTES", "1048576"))
+# Longer diff lines (minified bundles, inlined data) are cut here before they are ever held whole
+REVIEW_DIFF_MAX_LINE_BYTES = int(os.getenv("REVIEW_DIFF_MAX_LINE_BYTES", "16384"))
+
+LINE_TRUNCATED_MARKER = " …[line truncated]"
+
+# Precompiled once – these run for every line of every diff
+_DIFF_GIT_RE = re.compile(r"^diff --git a/(.+) b/(.+)$")
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@(.*)$")
+
+
+@dataclass
+class DiffLine:
+    kind: str                    # "+", "-" or " "
+    old_line: Optional[int]
+    new_line: Optional[int]
+    text: str
+
+
+@dataclass
+class Hunk:
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    section: str = ""
+    lines: List[DiffLine] = field(default_factory=list)
+
+
+@dataclass
+class FileDiff:
+    file_path: str
+    old_path: Optional[str] = None
+    change_type: str = "modified"
+    hunks: List[Hunk] = field(default_factory=list)
+    similarity: Optional[int] = None     # percent, for renames / copies detected by git
+    truncated: Optional[str] = None      # why part of the diff was dropped (size caps), shown to the model
+    omitted_lines: int = 0               # diff lines dropped by the caps
+
+    def numbered_new_code(self) -> str:
+        """
+        New-side code (added + context lines) prefixed with new-file line
+        numbers, followed by a truncation marker when the caps dropped part of the diff.
+        """
+        code = "\n".join(
+            f"{line.new_line:04d}: {line.text}"
+            for hunk in self.hunks
+            for line in hunk.lines
+            if line.kind != "-"
+        ).strip()
+        if code and self.truncated:
+            code += f"\n…[{self.truncated}]"
+        return code
+
+
+# =========================================================
+# 🔹 Incremental unified-diff parser
+# =========================================================
+def _utf8_len(text: str) -> int:
+    # the *_BYTES caps are in bytes; ASCII lines (most code) skip the encode
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+def _finish(file_diff: FileDiff, cut_lines: int) -> FileDiff:
+    reasons = []
+    if file_diff.omitted_lines:
+        reasons.append(f"diff truncated by the size cap: {file_diff.omitted_lines} more lines omitted")
+    if cut_lines:
+        reasons.append(f"{cut_lines} overlong lines shortened")
+    file_diff.truncated = "; ".join(reasons) or None
+    return file_diff
+
+
+def parse_unified_diff(lines: Iterable[str], max_file_lines: int = REVIEW_DIFF_MAX_FILE_LINES,
+                       max_file_bytes: int = REVIEW_DIFF_MAX_FILE_BYTES) -> Iterator[FileDiff]:
+    """
+    Parse `git diff` output line by line and yield one FileDiff per file
+    as soon as the next file header is reached. Once a file has
+    `max_file_lines` diff lines or `max_file_bytes` of text (0 = no cap),
+    its remaining lines are only counted, never stored.
+    """
+    current = None
+    hunk = None
+    old_no = new_no = 0
+    kept_lines = kept_bytes = cut_lines = 0
+
+    for raw in lines:
+        line = raw.rstrip("\r\n")
+
+        if line.startswith("diff --git "):
+            if current:
+                yield _finish(current, cut_lines)
+            match = _DIFF_GIT_RE.match(line)
+            current = FileDiff(file_path=match.group(2) if match else "")
+            hunk = None
+            kept_lines = kept_bytes = cut_lines = 0
+            continue
+
+        if current is None:
+            continue
+
+        if hunk is None:
+            # file header block (before the first @@)
+            # git ends the path with a tab when it contains a space ("+++ b/my file.js\t")
+            if line.startswith("+++ "):
+                if line != "+++ /dev/null":
+                    current.file_path = line[6:].rstrip("\t")
+                continue
+            if line.startswith("--- "):
+                if line != "--- /dev/null":
+                    current.old_path = line[6:].rstrip("\t")
+                continue
+            if line.startswith("new file mode"):
+                current.change_type = "added"
+                continue
+            if line.startswith("deleted file mode"):
+                current.change_type = "deleted"
+                continue
+            # -M / -C: a pure move has no ---/+++ lines, so the paths come from here
+            if line.startswith(("rename from ", "copy from ")):
+                kind, _, path = line.partition(" from ")
+                current.old_path = path
+                current.change_type = "renamed" if kind == "rename" else "copied"
+                continue
+            if line.startswith(("rename to ", "copy to ")):
+                current.file_path = line.partition(" to ")[2]
+                continue
+            if line.startswith("similarity index "):
+                current.similarity = int(line[17:].rstrip("%") or 0)
+                continue
+
+        if current.omitted_lines:
+            # over the cap: hunk headers and lines of the rest of this file are counted, not kept
+            if not line.startswith(("@@", "\\")):
+                current.omitted_lines += 1
+            continue
+
+        if line.startswith("@@"):
+            match = _HUNK_RE.match(line)
+            if not match:
+                continue
+            old_start, old_count, new_start, new_count, section = match.groups()
+            hunk = Hunk(
+                old_start=int(old_start),
+                old_count=int(old_count) if old_count is not None else 1,
+                new_start=int(new_start),
+                new_count=int(new_count) if new_count is not None else 1,
+                section=section.strip(),
+            )
+            current.hunks.append(hunk)
+            old_no, new_no = hunk.old_start, hunk.new_start
+            continue
+
+        if hunk is None:
+            continue
+
+        kind = line[:1]
+        if kind in ("+", "-", " ") or line == "":
+            kept_lines += 1
+            kept_bytes += _utf8_len(line)
+            if (max_file_lines and kept_lines > max_file_lines) or (max_file_bytes and kept_bytes > max_file_bytes):
+                current.omitted_lines = 1
+                continue
+            if line.endswith(LINE_TRUNCATED_MARKER):
+                cut_lines += 1
+        if kind == "+":
+            hunk.lines.append(DiffLine("+", None, new_no, line[1:]))
+            new_no += 1
+        elif kind == "-":
+            hunk.lines.append(DiffLine("-", old_no, None, line[1:]))
+            old_no += 1
+        elif kind == " " or line == "":
+            hunk.lines.append(DiffLine(" ", old_no, new_no, line[1:]))
+            old_no += 1
+            new_no += 1
+        # "\ No newline at end of file" and anything else is metadata
+
+    if current:
+        yield _finish(current, cut_lines)
+
+
+# =========================================================
+# 🔹 One `git diff` for the whole PR
+# =========================================================
+def _read_capped_lines(stream, max_line_bytes: int) -> Iterator[bytes]:
+    """Lines of a binary stream; a line longer than `max_line_bytes` is cut and the rest skipped unread into memory."""
+    while True:
+        line = stream.readline(max_line_bytes) if max_line_bytes else stream.readline()
+        if not line:
+            return
+        if line.endswith(b"\n"):
+            yield line
+            continue
+        # the cap was hit mid-line: drain the remainder chunk by chunk
+        rest = line
+        while rest and not rest.endswith(b"\n"):
+            rest = stream.readline(max_line_bytes)
+        yield line + LINE_TRUNCATED_MARKER.encode("utf-8") + b"\n"
+
+
+def stream_git_diff(repo_dir: str, base_ref: str, head_ref: str, file_paths: List[str] = None,
+                    unified: int = 5, find_renames: bool = True,
+                    max_line_bytes: int = REVIEW_DIFF_MAX_LINE_BYTES) -> Iterator[str]:
+    """
+    Run a single `git diff` and yield its stdout line by line, straight from
+    the pipe. With `find_renames`, moved and copied files (-M -C) come out
+    as the delta against their source; the source paths must be among
+    `file_paths`. Lines over `max_line_bytes` end in LINE_TRUNCATED_MARKER.
+    git is killed after REVIEW_GIT_TIMEOUT or on git_cancel_scope
+    cancellation, like run_git (see git_deadline).
+    """
+    cmd = ["git", "-c", "core.quotePath=false", "-C", repo_dir, "diff", "--no-color", "--no-ext-diff",
+           f"--unified={unified}", *(["-M", "-C"] if find_renames else []), base_ref, head_ref]
+    if file_paths:
+        cmd += ["--"] + list(file_paths)
+
+    # binary pipe: split on "\n" only, so stray "\r" in code can't break hunk accounting
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               start_new_session=os.name == "posix")
+    completed = False
+    with git_deadline(process):
+        try:
+            for line in _read_capped_lines(process.stdout, max_line_bytes):
+                yield line.decode("utf-8", errors="replace")
+            completed = True
+        finally:
+            if not completed:
+                # consumer stopped early – don't leave git blocked on a full pipe
+                process.kill()
+            process.stdout.close()
+            stderr = process.stderr.read().decode("utf-8", errors="replace")
+            process.stderr.close()
+            return_code = process.wait()
+            if completed and return_code != 0:
+                raise subprocess.CalledProcessError(return_code, cmd, stderr=stderr)
+
+
+def diff_files(repo_dir: str, base_ref: str, head_ref: str, file_paths: List[str] = None,
+               unified: int = 5, find_renames: bool = True, max_file_lines: int = REVIEW_DIFF_MAX_FILE_LINES,
+               max_file_bytes: int = REVIEW_DIFF_MAX_FILE_BYTES,
+               max_line_bytes: int = REVIEW_DIFF_MAX_LINE_BYTES) -> Dict[str, FileDiff]:
+    """
+    Parse the whole PR diff in one pass, keyed by new file path. Memory
+    stays within the per-file caps however large the diff git produces.
+    """
+    lines = stream_git_diff(repo_dir, base_ref, head_ref, file_paths, unified, find_renames, max_line_bytes)
+    return {file_diff.file_path: file_diff for file_diff in parse_unified_diff(lines, max_file_lines, max_file_bytes)}
+
+
+# =========================================================
+# 🔹 Diff of two in-memory file versions (no repository)
+# =========================================================
+def _split_text_lines(text: str) -> List[str]:
+    # like git, only "\n" ends a line; long lines are cut like stream_git_diff does
+    lines = text.split("\n")
+    if lines and lines[-1] == "":
+        lines.pop()
+    if REVIEW_DIFF_MAX_LINE_BYTES:
+        lines = [line if _utf8_len(line) <= REVIEW_DIFF_MAX_LINE_BYTES else
+                 line.encode("utf-8")[:REVIEW_DIFF_MAX_LINE_BYTES].decode("utf-8", errors="ignore")
+                 + LINE_TRUNCATED_MARKER for line in lines]
+    return lines
+
+
+def diff_texts(file_path: str, old_text: Optional[str], new_text: Optional[str], old_path: str = None,
+               unified: int = 5) -> FileDiff:
+    """
+    Unified diff of two blobs computed locally with difflib and parsed by the
+    same parser as `git diff` output. None means the side does not exist.
+    """
+    old_path = old_path or file_path
+    old_lines = _split_text_lines(old_text) if old_text is not None else []
+    new_lines = _split_text_lines(new_text) if new_text is not None else []
+    diff_lines = difflib.unified_diff(
+        old_lines, new_lines,
+        fromfile=f"a/{old_path}" if old_text is not None else "/dev/null",
+        tofile=f"b/{file_path}" if new_text is not None else "/dev/null",
+        n=unified, lineterm=""
+    )
+
+    header = [f"diff --git a/{old_path} b/{file_path}"]
+    parsed = next(parse_unified_diff(chain(header, diff_lines)))
+    parsed.file_path = file_path
+    if old_path != file_path:
+        parsed.old_path = old_path
+    if old_text is None:
+        parsed.change_type = "added"
+    elif new_text is None:
+        parsed.change_type = "deleted"
+    elif old_path != file_path:
+        parsed.change_type = "renamed"
+    return parsed
@@ -1,34 +1,46 @@
 import os
-import base64
 import requests
 import subprocess
-import re
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from Services.repo_cache_service import (
+    sync_mirror,
+    sync_pr_refs,
+    fetch_commit,
+    hydrate_paths,
+    get_mirror_dir,
+    run_git,
+    prepare_pr_checkout,
+    REVIEW_FETCH_STRATEGY
+)
+from Services.diff_parser_service import diff_files, diff_texts, FileDiff
+from Services.azure_client_service import BlobTooLargeError
+from Services.repo_registry_service import RepoConfig, get_repo
+from Services.metrics_service import stage_span
 
 load_dotenv()
 
-AZURE_ORG = os.getenv("AZURE_ORG")
-AZURE_PROJECT = os.getenv("AZURE_PROJECT")
-AZURE_REPO_ID = os.getenv("AZURE_REPO_ID")
-AZURE_PAT = os.getenv("AZURE_PAT")
+# "auto" picks per PR; "git" always uses the mirror; "api" always diffs via the Azure REST API
+REVIEW_DIFF_ENGINE = os.getenv("REVIEW_DIFF_ENGINE", "auto").lower()
+# auto: PRs changing at most this many files are diffed via the API when no mirror exists yet
+REVIEW_API_DIFF_MAX_FILES = int(os.getenv("REVIEW_API_DIFF_MAX_FILES", "40"))
+AZURE_BLOB_CONCURRENCY = int(os.getenv("AZURE_BLOB_CONCURRENCY", "8"))
+# API engine: blobs larger than this are not downloaded whole or diffed (0 = no limit)
+REVIEW_API_MAX_BLOB_BYTES = int(os.getenv("REVIEW_API_MAX_BLOB_BYTES", "4194304"))
 
-
-def encode_pat(pat: str) -> str:
-    token_bytes = f":{pat}".encode("ascii")
-    return base64.b64encode(token_bytes).decode("ascii")
+REVIEWABLE_EXTENSIONS = (".js", ".jsx", ".ts", ".tsx")
+# Git pathspec for the same files (a "*" also matches "/", so any depth)
+REVIEWABLE_PATHSPEC = [f"*{extension}" for extension in REVIEWABLE_EXTENSIONS]
 
 
 # =========================================================
 # 🔹 Step 1: Get PR metadata
 # =========================================================
-def get_pr_details(pr_id: int):
+def get_pr_details(pr_id: int, repo: RepoConfig = None):
+    repo = repo or get_repo()
     try:
-        url = f"https://dev.azure.com/{AZURE_ORG}/{AZURE_PROJECT}/_apis/git/repositories/{AZURE_REPO_ID}/pullRequests/{pr_id}?api-version=7.1"
-        headers = {"Authorization": f"Basic {encode_pat(AZURE_PAT)}", "Content-Type": "application/json"}
-
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        pr_data = response.json()
+        # Served from the repository client's short-TTL / ETag cache when unchanged
+        pr_data = repo.client.get_pull_request(pr_id)
 
         source_branch = pr_data.get("sourceRefName", "").replace("refs/heads/", "")
         target_branch = pr_data.get("targetRefName", "").replace("refs/heads/", "")
@@ -46,43 +58,140 @@ def get_pr_details(pr_id: int):
 # =========================================================
 # 🔹 Step 2: Local Git Diff (Lightweight Summary)
 # =========================================================
-def get_git_diff(base_branch: str, feature_branch: str, pr_id: int = None):
-    """Get changed React-related files & git diff command."""
-    repo_root = os.path.join(os.getcwd(), "local_repo")
-    os.makedirs(repo_root, exist_ok=True)
-    repo_dir = os.path.join(repo_root, f"pr_{pr_id or 'temp'}")
-    repo_url = f"https://{AZURE_PAT}@dev.azure.com/{AZURE_ORG}/{AZURE_PROJECT}/_git/{AZURE_REPO_ID}"
+def sync_repository(repo: RepoConfig = None, fresh_since: float = None, branches: tuple = None) -> str:
+    """
+    Create or incrementally fetch the repository's shared bare mirror. With
+    the "partial" fetch strategy and `branches` (source, target) only those
+    two branches are fetched, blobless; otherwise every branch is.
+    """
+    repo = repo or get_repo()
+    if REVIEW_FETCH_STRATEGY == "partial" and branches:
+        return sync_pr_refs(repo.clone_url, repo.name, branches[0], branches[1], fresh_since)
+    return sync_mirror(repo.clone_url, repo.name, fresh_since)
 
-    try:
-        # Step 1️⃣: Clone or fetch repo
-        if not os.path.exists(repo_dir):
-            subprocess.run(["git", "clone", repo_url, repo_dir], check=True)
+
+def _rev_parse(repo_dir: str, ref: str):
+    result = run_git(["-C", repo_dir, "rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}"], check=False)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def _is_ancestor(repo_dir: str, ancestor: str, descendant: str) -> bool:
+    result = run_git(["-C", repo_dir, "merge-base", "--is-ancestor", ancestor, descendant], check=False)
+    return result.returncode == 0
+
+
+def _merge_base(repo_dir: str, target_ref: str, head_ref: str):
+    result = run_git(["-C", repo_dir, "merge-base", target_ref, head_ref], check=False)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+_NAME_STATUS_TYPES = {"A": "added", "D": "deleted", "R": "renamed", "C": "copied"}
+
+
+def _changed_react_files(repo_dir: str, base_ref: str, head_ref: str) -> list:
+    """
+    [{filePath, changeType, originalPath}] between two commits, with renames
+    and copies (-M -C) reported against their source instead of as delete + add.
+
+    Rename detection only compares reviewable files, and a partial mirror
+    fetches their blobs in one request first (hydrate_paths); otherwise git
+    would read every changed blob in the tree and, blobless, fetch each one
+    lazily. A file renamed from a non-reviewable path is listed as added.
+    """
+    with stage_span("git_hydrate"):
+        hydrate_paths(repo_dir, base_ref, head_ref, REVIEWABLE_PATHSPEC)
+    result = run_git(["-c", "core.quotePath=false", "-C", repo_dir, "diff", "--name-status", "-z", "-M", "-C",
+                      base_ref, head_ref, "--", *REVIEWABLE_PATHSPEC])
+    # -z: "<status>\0<path>\0", or "<R|C><score>\0<source>\0<path>\0"
+    fields = result.stdout.split("\0")
+    changed, index = [], 0
+    while index < len(fields) - 1:
+        status = fields[index]
+        if status[:1] in ("R", "C"):
+            original_path, path = fields[index + 1], fields[index + 2]
+            index += 3
         else:
-            subprocess.run(["git", "-C", repo_dir, "fetch", "origin"], check=True)
+            original_path, path = None, fields[index + 1]
+            index += 2
+        if path.endswith(REVIEWABLE_EXTENSIONS):
+            changed.append({"filePath": path, "changeType": _NAME_STATUS_TYPES.get(status[:1], "modified"),
+                            "originalPath": original_path})
+    return changed
+
 
-        # Step 2️⃣: Fetch branches
-        subprocess.run(["git", "-C", repo_dir, "fetch", "origin", base_branch, feature_branch], check=True)
+def _diff_paths(files: list) -> list:
+    """Pathspec for diffing `files`: their paths plus rename/copy sources, without which git sees an add."""
+    return list(dict.fromkeys([f["filePath"] for f in files] +
+                              [f["originalPath"] for f in files if f.get("originalPath")]))
 
-        # Step 3️⃣: Get changed files (React-only)
-        result = subprocess.run(
-            ["git", "-C", repo_dir, "diff", "--name-only", f"origin/{base_branch}", f"origin/{feature_branch}"],
-            capture_output=True, text=True, check=True
-        )
 
-        changed_files = [
-            f for f in result.stdout.splitlines()
-            if f.endswith((".js", ".jsx", ".ts", ".tsx"))
-        ]
+def get_git_diff(base_branch: str, feature_branch: str, pr_id: int = None, since_commit: str = None,
+                 fresh_since: float = None, repo: RepoConfig = None):
+    """
+    Get changed React-related files & git diff command.
+
+    The PR is diffed from the merge base of the target branch and the PR
+    head (three-dot semantics), so commits that landed on the target after
+    the PR branched off are not reviewed as part of it. Renamed and copied
+    files are diffed against their source, so only the real delta is sent.
+
+    With `since_commit` (the last reviewed source commit) only files touched
+    between that commit and the current head are listed, and the returned
+    "baseRef" points at it so later diffs cover just the new pushes. Falls
+    back to the full PR range when the commit is gone or was rewritten.
+    A mirror fetch started after `fresh_since` is reused (see sync_mirror).
+    """
+    repo = repo or get_repo()
+    try:
+        # Step 1️⃣: Create or incrementally fetch the shared bare mirror (partial: just these two branches)
+        repo_dir = sync_repository(repo, fresh_since, (feature_branch, base_branch))
+
+        # Step 2️⃣: Optional per-PR worktree (no-op in default no-checkout mode)
+        prepare_pr_checkout(repo_dir, repo.name, pr_id, feature_branch)
+
+        # Step 3️⃣: Get changed files (React-only) since the merge base
+        head_commit = _rev_parse(repo_dir, f"origin/{feature_branch}")
+        head_ref = head_commit or f"origin/{feature_branch}"
+        merge_base = _merge_base(repo_dir, f"origin/{base_branch}", head_ref)
+        if not merge_base:
+            print(f"⚠️ No merge base of {base_branch} and {feature_branch}; diffing against the branch tip")
+        base_ref = merge_base or f"origin/{base_branch}"
+        changed_files = _changed_react_files(repo_dir, base_ref, head_ref)
+
+        incremental = False
+        if since_commit and head_commit:
+            if since_commit == head_commit:
+                incremental, base_ref, changed_files = True, since_commit, []
+            elif (_rev_parse(repo_dir, since_commit) or (REVIEW_FETCH_STRATEGY == "partial" and
+                                                          fetch_commit(repo_dir, since_commit))) \
+                    and _is_ancestor(repo_dir, since_commit, head_commit):
+                # Files merged in from the target branch are not part of the PR diff; keep only PR files
+                pr_files = {f["filePath"] for f in changed_files}
+                changed_files = [f for f in _changed_react_files(repo_dir, since_commit, head_commit)
+                                 if f["filePath"] in pr_files]
+                incremental, base_ref = True, since_commit
+            else:
+                print(f"⚠️ Last reviewed commit {since_commit[:12]} is not in {feature_branch} history (force push?); "
+                      f"reviewing the full PR")
+
+        # Step 4️⃣: Partial mirror → the changed files' blobs were fetched in one request while listing them
 
         return {
+            "engine": "git",
+            "repo": repo.name,
             "source": feature_branch,
             "target": base_branch,
+            "baseRef": base_ref,
+            "mergeBase": merge_base,
+            "headCommit": head_commit,
+            "incremental": incremental,
             "totalFiles": len(changed_files),
+            "renamedFiles": sum(1 for f in changed_files if f["originalPath"]),
             "files": [
                 {
-                    "filePath": f,
-                    "changeType": "modified",
-                    "diffCommand": f"git diff origin/{base_branch} origin/{feature_branch} -- {f}"
+                    **f,
+                    "diffCommand": f"git diff -M -C {base_ref} {head_ref} -- "
+                                   + " ".join(_diff_paths([f]))
                 }
                 for f in changed_files
             ]
@@ -91,92 +200,192 @@ def get_git_diff(base_branch: str, feature_branch: str, pr_id: int = None):
     except subprocess.CalledProcessError as e:
         print(f"❌ Git diff failed:\n{e.stderr or e.stdout}")
         return None
+    except subprocess.TimeoutExpired as e:
+        print(f"❌ Git timed out after {e.timeout}s: {' '.join(e.cmd)}")
+        return None
 
 
 # =========================================================
-# 🔹 Step 3: Get single file diff (Only new added code)
+# 🔹 Step 3: Get file diffs (Only new added code)
 # =========================================================
-def get_file_diff(base_branch: str, feature_branch: str, file_path: str, pr_id: int):
-    """Return diff for a specific file with line numbers for new code."""
-    repo_dir = os.path.join(os.getcwd(), "local_repo", f"pr_{pr_id}")
-    try:
-        result = subprocess.run(
-            ["git", "-C", repo_dir, "diff", "--unified=5", f"origin/{base_branch}", f"origin/{feature_branch}", "--", file_path],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-
-        diff_text = result.stdout.strip()
-        if not diff_text:
-            return {"filePath": file_path, "diffText": ""}
-
-        numbered_lines = []
-        current_line_num = 0
-
-        for line in diff_text.splitlines():
-            # skip headers and metadata
-            if line.startswith(("diff --git", "index ", "--- ", "+++ ")):
-                continue
-
-            if line.startswith("@@"):
-                # extract line number from diff hunk header
-                match = re.search(r"\+(\d+)", line)
-                if match:
-                    current_line_num = int(match.group(1)) - 1
-                continue
-
-            # update line number counter
-            current_line_num += 1
-
-            # clean up and add line number
-            if line.startswith("+") and not line.startswith("+++"):
-                code_line = line[1:]
-                numbered_lines.append(f"{current_line_num:04d}: {code_line}")
-            elif not line.startswith("-"):  # keep context lines
-                code_line = line[1:] if line.startswith(" ") else line
-                numbered_lines.append(f"{current_line_num:04d}: {code_line}")
-
-        clean_code = "\n".join(numbered_lines).strip()
-        return {"filePath": file_path, "diffText": clean_code}
+def get_all_file_diffs(base_branch: str, feature_branch: str, file_paths: list, pr_id: int,
+                       base_ref: str = None, head_ref: str = None, repo: RepoConfig = None,
+                       rename_sources: list = None):
+    """
+    Parse every requested file's diff from a single `git diff` run.
+    Returns {file_path: FileDiff}; files git reports no change for are omitted.
+    `base_ref` / `head_ref` override the merge base / source branch tip (e.g.
+    last reviewed commit → head). `rename_sources` are the original paths of
+    renamed / copied files, so they diff against their source.
+    """
+    if not file_paths:
+        return {}
 
+    repo_dir = get_mirror_dir((repo or get_repo()).name)
+    head_ref = head_ref or f"origin/{feature_branch}"
+    try:
+        base_ref = base_ref or _merge_base(repo_dir, f"origin/{base_branch}", head_ref) or f"origin/{base_branch}"
+        parsed = diff_files(repo_dir, base_ref, head_ref, list(dict.fromkeys(file_paths + (rename_sources or []))))
     except subprocess.CalledProcessError as e:
-        return {"error": f"Git diff failed for {file_path}: {e.stderr or e.stdout}"}
+        return {"error": f"Git diff failed for PR {pr_id}: {e.stderr or e.stdout}"}
+    except subprocess.TimeoutExpired as e:
+        return {"error": f"Git diff for PR {pr_id} timed out after {e.timeout}s"}
+
+    return {file_path: parsed[file_path] for file_path in file_paths if file_path in parsed}
+
+
+def get_file_diff(base_branch: str, feature_branch: str, file_path: str, pr_id: int, base_ref: str = None,
+                  repo: RepoConfig = None):
+    """Return diff for a specific file with line numbers for new code."""
+    result = get_all_file_diffs(base_branch, feature_branch, [file_path], pr_id, base_ref, repo=repo)
+    if "error" in result:
+        return {"error": f"Git diff failed for {file_path}: {result['error']}"}
+    file_diff = result.get(file_path)
+    return {"filePath": file_path, "diffText": file_diff.numbered_new_code() if file_diff else ""}
 
 
 # =========================================================
-# 🔹 Step 4: Azure API fallback
+# 🔹 Step 4: Azure API engine (no clone)
 # =========================================================
-def get_pr_diff_summary_via_api(source_branch: str, target_branch: str):
-    """Fallback if Git diff fails."""
-    def fetch_branch_heads():
-        refs_url = (
-            f"https://dev.azure.com/{AZURE_ORG}/{AZURE_PROJECT}/_apis/git/repositories/"
-            f"{AZURE_REPO_ID}/refs?filter=heads/&api-version=7.1"
-        )
-        headers = {"Authorization": f"Basic {encode_pat(AZURE_PAT)}"}
-        resp = requests.get(refs_url, headers=headers)
-        refs = resp.json().get("value", [])
-        return {r["name"].replace("refs/heads/", ""): r["objectId"] for r in refs}
-
-    branch_heads = fetch_branch_heads()
-    base_commit = branch_heads.get(target_branch)
-    target_commit = branch_heads.get(source_branch)
-
-    if not base_commit or not target_commit:
-        return {"error": "Commit IDs not found."}
-    return {"source": source_branch, "target": target_branch, "files": []}
+def get_pr_diff_summary_via_api(source_branch: str, target_branch: str, pr_id: int, repo: RepoConfig = None):
+    """
+    Changed files of the PR's latest iteration, straight from the Azure
+    DevOps iterations/changes API. Each entry carries the blob ids of both
+    sides so `get_api_file_diffs` can diff them without a local repository.
+    """
+    repo = repo or get_repo()
+    try:
+        iterations = repo.client.list_iterations(pr_id)
+        if not iterations:
+            return {"error": f"PR {pr_id} has no iterations"}
+        latest = max(iterations, key=lambda iteration: iteration["id"])
+        changes = repo.client.list_iteration_changes(pr_id, latest["id"])
+    except requests.exceptions.RequestException as e:
+        return {"error": f"Azure API diff failed for PR {pr_id}: {e}"}
+
+    files = []
+    for change in changes:
+        item = change.get("item") or {}
+        path = (item.get("path") or "").lstrip("/")
+        change_type = change.get("changeType", "edit")
+        if item.get("isFolder") or not path.endswith(REVIEWABLE_EXTENSIONS):
+            continue
+        original_path = (change.get("originalPath") or change.get("sourceServerItem") or "").lstrip("/")
+        files.append({
+            "filePath": path,
+            "changeType": change_type,
+            "objectId": item.get("objectId"),
+            "originalObjectId": item.get("originalObjectId"),
+            "originalPath": original_path or None
+        })
+
+    return {
+        "engine": "api",
+        "repo": repo.name,
+        "source": source_branch,
+        "target": target_branch,
+        "baseRef": (latest.get("commonRefCommit") or latest.get("targetRefCommit") or {}).get("commitId"),
+        "headCommit": (latest.get("sourceRefCommit") or {}).get("commitId"),
+        "incremental": False,
+        "iteration": latest["id"],
+        "totalFiles": len(files),
+        "files": files
+    }
+
+
+def get_api_file_diffs(files: list, pr_id: int, repo: RepoConfig = None):
+    """
+    Fetch both blobs of every changed file (bounded concurrency) and diff them
+    locally. Returns {file_path: FileDiff} like `get_all_file_diffs`.
+    """
+    client = (repo or get_repo()).client
+
+    def _diff(file):
+        deleted = "delete" in file["changeType"]
+        old_id = file.get("originalObjectId")
+        try:
+            new_text = None if deleted else client.get_blob_text(file["objectId"], REVIEW_API_MAX_BLOB_BYTES)
+            old_text = client.get_blob_text(old_id, REVIEW_API_MAX_BLOB_BYTES) \
+                if old_id and "add" not in file["changeType"] else None
+        except BlobTooLargeError as e:
+            # No hunks: the pre-filter reports it as skipped with this reason
+            return FileDiff(file_path=file["filePath"], old_path=file.get("originalPath"), truncated=str(e))
+        return diff_texts(file["filePath"], old_text, new_text, old_path=file.get("originalPath"))
+
+    # Deleted files have no new code to review; skip their downloads entirely
+    wanted = [f for f in files if "delete" not in f["changeType"] and f.get("objectId")]
+    try:
+        with ThreadPoolExecutor(max_workers=AZURE_BLOB_CONCURRENCY) as pool:
+            parsed = list(pool.map(_diff, wanted))
+    except requests.exceptions.RequestException as e:
+        return {"error": f"Blob download failed for PR {pr_id}: {e}"}
+    return {file_diff.file_path: file_diff for file_diff in parsed}
 
 
 # =========================================================
 # 🔹 Step 5: Unified entry point
 # =========================================================
-def get_pr_diff_summary(source_branch: str, target_branch: str, pr_id: int = None):
-    diff_summary = get_git_diff(target_branch, source_branch, pr_id)
+def choose_diff_engine(pr_id: int, since_commit: str = None, repo: RepoConfig = None) -> str:
+    """
+    "git" when a mirror already exists (an incremental fetch is cheap) or
+    for incremental reviews, which need commit history; otherwise "auto"
+    defers to the PR's size once the API has listed its changes.
+    """
+    if REVIEW_DIFF_ENGINE in ("git", "api"):
+        return REVIEW_DIFF_ENGINE
+    if since_commit or pr_id is None or os.path.isdir(get_mirror_dir((repo or get_repo()).name)):
+        return "git"
+    return "auto"
+
+
+def get_pr_diff_summary(source_branch: str, target_branch: str, pr_id: int = None, since_commit: str = None,
+                        fresh_since: float = None, repo: RepoConfig = None):
+    repo = repo or get_repo()
+    engine = choose_diff_engine(pr_id, since_commit, repo)
+    if engine in ("api", "auto"):
+        diff_summary = get_pr_diff_summary_via_api(source_branch, target_branch, pr_id, repo)
+        if "error" not in diff_summary and (engine == "api" or diff_summary["totalFiles"] <= REVIEW_API_DIFF_MAX_FILES):
+            print(f"🌐 Diffing {diff_summary['totalFiles']} files via Azure API (no clone)")
+            return diff_summary
+        if "error" in diff_summary:
+            print(f"⚠️ {diff_summary['error']}; using local git.")
+
+    diff_summary = get_git_diff(target_branch, source_branch, pr_id, since_commit, fresh_since, repo)
     if diff_summary:
         return diff_summary
     print("⚠️ Falling back to Azure API diff.")
-    return get_pr_diff_summary_via_api(source_branch, target_branch)
+    return get_pr_diff_summary_via_api(source_branch, target_branch, pr_id, repo)
+
+
+def get_summary_file_diffs(diff_summary: dict, pr_id: int):
+    """Parsed diffs of every file in a summary, using the engine (and repository) that produced it."""
+    repo = get_repo(diff_summary.get("repo"))
+    files = diff_summary.get("files", [])
+    if diff_summary.get("engine") == "api":
+        return get_api_file_diffs(files, pr_id, repo)
+    return get_all_file_diffs(
+        diff_summary["target"], diff_summary["source"], [f["filePath"] for f in files], pr_id,
+        diff_summary.get("baseRef"), diff_summary.get("headCommit"), repo,
+        [f["originalPath"] for f in files if f.get("originalPath")]
+    )
+
+def get_gitattributes(diff_summary: dict) -> str:
+    """Root .gitattributes at the PR head ("" when absent or unreadable), for the pre-filter stage."""
+    head = diff_summary.get("headCommit")
+    if not head:
+        return ""
+    repo = get_repo(diff_summary.get("repo"))
+    if diff_summary.get("engine") == "api":
+        try:
+            return repo.client.get_item_text(".gitattributes", head)
+        except requests.exceptions.RequestException:
+            return ""
+    try:
+        result = run_git(["-C", get_mirror_dir(repo.name), "show", f"{head}:.gitattributes"], check=False)
+    except (subprocess.TimeoutExpired, UnicodeDecodeError):
+        return ""
+    return result.stdout if result.returncode == 0 else ""
+
 
 # =========================================================
 # 🔹 Step 6: Save all file diffs
@@ -214,36 +423,23 @@ def get_pr_diff_summary(source_branch: str, target_branch: str, pr_id: int = Non
 #     return {"totalFiles": len(saved_diffs), "saved": saved_diffs}
 
 # =========================================================
-# 🔹 Step 7: Create sdiff folder and copy all file diffs
+# 🔹 Step 7: Archive diffs to disk (debug / audit only)
 # =========================================================
-def create_sdiff_files(pr_id: int):
+def archive_file_diffs(pr_id: int, file_diffs: list, repo_name: str = None):
     """
-    Create a /local_repo/sdiff folder (if not exists),
-    and copy each .diff from local_repo/pr_<id>/diffs/
-    into /local_repo/sdiff/ as pr_<id>_<filename>.diff
+    Write each FileDiff's numbered new code to local_repo/[<repo>/]pr_<id>/diffs/.
+    Only used when REVIEW_ARCHIVE_DIFFS is on; the pipeline itself stays in memory.
     """
-    base_dir = os.path.join(os.getcwd(), "local_repo")
-    source_diffs_dir = os.path.join(base_dir, f"pr_{pr_id}", "diffs")
-    sdiff_dir = os.path.join(base_dir, "sdiff")
-    os.makedirs(sdiff_dir, exist_ok=True)
-
-    if not os.path.exists(source_diffs_dir):
-        return {"error": f"No diffs found for PR {pr_id} in {source_diffs_dir}"}
-
-    created_files = []
-
-    for filename in sorted(os.listdir(source_diffs_dir)):
-        if filename.endswith(".diff"):
-            src_path = os.path.join(source_diffs_dir, filename)
-            dest_filename = f"pr_{pr_id}_{filename}"
-            dest_path = os.path.join(sdiff_dir, dest_filename)
-
-            with open(src_path, "r", encoding="utf-8") as src, \
-                 open(dest_path, "w", encoding="utf-8") as dest:
-                dest.write(f"# Diff for PR {pr_id}: {filename.replace('.diff', '')}\n\n")
-                dest.write(src.read())
-
-            created_files.append(dest_path)
-
-    print(f"✅ {len(created_files)} sdiff files created in: {sdiff_dir}")
-    return {"sdiffDir": sdiff_dir, "files": created_files}
+    diffs_dir = os.path.join(os.getcwd(), "local_repo", *([repo_name] if repo_name else []), f"pr_{pr_id}", "diffs")
+    os.makedirs(diffs_dir, exist_ok=True)
+
+    saved_files = []
+    for file_diff in file_diffs:
+        safe_name = file_diff.file_path.replace("/", "_#").replace("\\", "_#")
+        diff_file_path = os.path.join(diffs_dir, f"{safe_name}.diff")
+        with open(diff_file_path, "w", encoding="utf-8") as df:
+            df.write(file_diff.numbered_new_code() or "No diff available.")
+        saved_files.append({"filePath": file_diff.file_path, "diffFile": diff_file_path})
+
+    print(f"✅ {len(saved_files)} diffs archived in: {diffs_dir}")
+    return {"diffsDir": diffs_dir, "files": saved_files}
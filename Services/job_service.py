@@ -0,0 +1,298 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from Services.review_pipeline_service import run_pr_review, REVIEW_STAGES
+from Services.repo_registry_service import get_repo
+
+load_dotenv()
+
+REVIEW_JOB_WORKERS = int(os.getenv("REVIEW_JOB_WORKERS", "4"))
+REVIEW_JOB_STORE = os.getenv("REVIEW_JOB_STORE", "memory").lower()   # "memory" | "sqlite"
+REVIEW_JOB_DB_PATH = os.getenv("REVIEW_JOB_DB_PATH", os.path.join(os.getcwd(), "local_repo", "review_jobs.sqlite3"))
+# Finished jobs (and their results) are dropped after this many hours (0 = kept until the count limit)
+REVIEW_JOB_RETENTION_HOURS = float(os.getenv("REVIEW_JOB_RETENTION_HOURS", "24"))
+# At most this many finished jobs are kept, newest first (0 = no limit)
+REVIEW_JOB_MAX_FINISHED = int(os.getenv("REVIEW_JOB_MAX_FINISHED", "1000"))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+# =========================================================
+# 🔹 Job stores (in-memory default, SQLite optional)
+# =========================================================
+def _retention_cutoff() -> float:
+    return time.time() - REVIEW_JOB_RETENTION_HOURS * 3600 if REVIEW_JOB_RETENTION_HOURS else 0.0
+
+
+class InMemoryJobStore:
+    """Jobs live in a dict; lost on restart. Finished jobs expire (see _evict_finished)."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def save(self, job: dict):
+        with self._lock:
+            self._jobs[job["job_id"]] = json.loads(json.dumps(job))
+            if job["status"] not in ACTIVE_STATUSES:
+                self._evict_finished()
+
+    def _evict_finished(self):
+        """Drop finished jobs past REVIEW_JOB_RETENTION_HOURS, then all but the newest REVIEW_JOB_MAX_FINISHED."""
+        cutoff = _retention_cutoff()
+        finished = sorted((j for j in self._jobs.values() if j["status"] not in ACTIVE_STATUSES),
+                          key=lambda j: j.get("finished_at") or j["updated_at"], reverse=True)
+        for index, job in enumerate(finished):
+            if (job.get("finished_at") or job["updated_at"]) < cutoff or \
+                    (REVIEW_JOB_MAX_FINISHED and index >= REVIEW_JOB_MAX_FINISHED):
+                del self._jobs[job["job_id"]]
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job else None
+
+    def find_active(self, dedup_key: str, statuses: tuple = ACTIVE_STATUSES):
+        with self._lock:
+            for job in self._jobs.values():
+                if job["dedup_key"] == dedup_key and job["status"] in statuses:
+                    return json.loads(json.dumps(job))
+        return None
+
+    def list_active(self) -> list:
+        with self._lock:
+            return [json.loads(json.dumps(j)) for j in self._jobs.values() if j["status"] in ACTIVE_STATUSES]
+
+
+class SQLiteJobStore:
+    """Jobs persisted as JSON rows so queued work survives a restart."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._session() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS review_jobs (
+                    job_id     TEXT PRIMARY KEY,
+                    dedup_key  TEXT NOT NULL,
+                    status     TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    job_json   TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_review_jobs_dedup ON review_jobs(dedup_key, status)")
+
+    @contextmanager
+    def _session(self):
+        with self._lock:
+            conn = sqlite3.connect(self.path, timeout=10)
+            try:
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+
+    def save(self, job: dict):
+        with self._session() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO review_jobs (job_id, dedup_key, status, created_at, job_json) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job["job_id"], job["dedup_key"], job["status"], job["created_at"], json.dumps(job))
+            )
+            if job["status"] not in ACTIVE_STATUSES:
+                # same retention as the in-memory store; created_at stands in for the finish time
+                conn.execute("DELETE FROM review_jobs WHERE status NOT IN (?, ?) AND created_at < ?",
+                             (*ACTIVE_STATUSES, _retention_cutoff()))
+                if REVIEW_JOB_MAX_FINISHED:
+                    conn.execute(
+                        "DELETE FROM review_jobs WHERE job_id IN ("
+                        "  SELECT job_id FROM review_jobs WHERE status NOT IN (?, ?) "
+                        "  ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                        (*ACTIVE_STATUSES, REVIEW_JOB_MAX_FINISHED)
+                    )
+
+    def get(self, job_id: str):
+        with self._session() as conn:
+            row = conn.execute("SELECT job_json FROM review_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find_active(self, dedup_key: str, statuses: tuple = ACTIVE_STATUSES):
+        placeholders = ", ".join("?" for _ in statuses)
+        with self._session() as conn:
+            row = conn.execute(
+                f"SELECT job_json FROM review_jobs WHERE dedup_key = ? AND status IN ({placeholders}) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (dedup_key, *statuses)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list_active(self) -> list:
+        with self._session() as conn:
+            rows = conn.execute(
+                "SELECT job_json FROM review_jobs WHERE status IN (?, ?) ORDER BY created_at",
+                ACTIVE_STATUSES
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+
+def _create_store():
+    if REVIEW_JOB_STORE == "sqlite":
+        return SQLiteJobStore(REVIEW_JOB_DB_PATH)
+    return InMemoryJobStore()
+
+
+job_store = _create_store()
+
+
+# =========================================================
+# 🔹 Queue + worker pool
+# =========================================================
+_queue = None
+_workers = []
+_submit_lock = None
+
+
+def _new_job(pr_id: int, dedup_key: str, incremental: bool = False, repo: str = None) -> dict:
+    now = time.time()
+    return {
+        "job_id": uuid.uuid4().hex,
+        "repo": repo,
+        "pr_id": pr_id,
+        "incremental": incremental,
+        "dedup_key": dedup_key,
+        "status": "queued",
+        "stages": {stage: {"status": "pending"} for stage in REVIEW_STAGES},
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now
+    }
+
+
+async def _save_job(job: dict, previous: asyncio.Future = None):
+    """Store a job off the event loop (SQLite writes block), after the save `previous` of the same job."""
+    if previous is not None:
+        await asyncio.wait([previous])
+    try:
+        await asyncio.to_thread(job_store.save, job)
+    except Exception as e:
+        print(f"⚠️ Could not save review job {job['job_id']} -->", e)
+
+
+async def _run_job(job_id: str):
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if not job:
+        return
+
+    job["status"] = "running"
+    job["started_at"] = time.time()
+    await _save_job(job)
+
+    # on_stage is called synchronously from the pipeline: its saves run in the background, in order
+    pending_save = None
+
+    def on_stage(stage: str, status: str, detail: dict = None):
+        nonlocal pending_save
+        entry = job["stages"].setdefault(stage, {})
+        entry["status"] = status
+        entry["started_at" if status == "running" else "finished_at"] = time.time()
+        if detail:
+            entry.update(detail)
+        job["updated_at"] = time.time()
+        pending_save = asyncio.ensure_future(_save_job(json.loads(json.dumps(job)), pending_save))
+
+    try:
+        # jobs persisted before the registry existed carry no repo → default repository
+        job["result"] = await run_pr_review(job["pr_id"], on_stage, incremental=job.get("incremental", False),
+                                            repo=get_repo(job.get("repo")))
+        job["status"] = "succeeded"
+    except Exception as e:
+        print(f"❌ Review job {job_id} failed -->", e)
+        job["status"] = "failed"
+        job["error"] = str(e)
+        for entry in job["stages"].values():
+            if entry.get("status") == "running":
+                entry["status"] = "failed"
+
+    job["finished_at"] = job["updated_at"] = time.time()
+    await _save_job(job, pending_save)
+
+
+async def _worker():
+    while True:
+        job_id = await _queue.get()
+        try:
+            await _run_job(job_id)
+        finally:
+            _queue.task_done()
+
+
+async def _ensure_workers():
+    """Start the worker pool on first use and requeue unfinished persisted jobs."""
+    global _queue, _submit_lock
+    if _queue is not None:
+        return
+
+    _queue = asyncio.Queue()
+    _submit_lock = asyncio.Lock()
+    # submissions arriving meanwhile wait for the lock, so they can't duplicate a job being requeued
+    async with _submit_lock:
+        for job in await asyncio.to_thread(job_store.list_active):
+            job["status"] = "queued"
+            await _save_job(job)
+            _queue.put_nowait(job["job_id"])
+    for _ in range(REVIEW_JOB_WORKERS):
+        _workers.append(asyncio.create_task(_worker()))
+    print(f"✅ Started {REVIEW_JOB_WORKERS} review workers ({REVIEW_JOB_STORE} job store)")
+
+
+async def submit_review_job(pr_id: int, incremental: bool = False, repo: str = None) -> dict:
+    """
+    Queue a review for a PR of a registered repository (default: the default
+    repository) and return its job. If a review for the same PR is already
+    queued or running, that job is returned instead. Raises
+    UnknownRepositoryError for an unregistered repository.
+
+    Incremental submissions (webhook pushes) only join a job that is still
+    queued: a running job may already have fetched, so the new commits get a
+    follow-up job that runs once the current one has recorded its head.
+    """
+    repo_name = get_repo(repo).name
+    await _ensure_workers()
+    dedup_key = f"{repo_name}:pr:{pr_id}"
+
+    async with _submit_lock:
+        existing = await asyncio.to_thread(job_store.find_active, dedup_key,
+                                           ("queued",) if incremental else ACTIVE_STATUSES)
+        if existing:
+            if not incremental and existing.get("incremental") and existing["status"] == "queued":
+                # A full review request widens the queued incremental one
+                existing["incremental"] = False
+                await _save_job(existing)
+            return {**existing, "coalesced": True}
+
+        job = _new_job(pr_id, dedup_key, incremental, repo_name)
+        await _save_job(job)
+        await _queue.put(job["job_id"])
+        return {**job, "coalesced": False}
+
+
+def get_job(job_id: str):
+    return job_store.get(job_id)
+
+
+async def stop_job_workers():
+    """Cancel the worker pool (app shutdown)."""
+    global _queue
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _queue = None
@@ -0,0 +1,166 @@
+import re
+import json
+
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+# =========================================================
+# 🔹 Incremental parsing of a streamed review
+# =========================================================
+class ReviewStreamParser:
+    """
+    Feed the model's output chunk by chunk; `feed` returns every entry of a
+    "comments" array that became complete in that chunk, as
+    (file_path, comment_dict). file_path is the "filePath" of the enclosing
+    file object when it was seen before the comment, else None.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        # [bracket, key it was opened under, start offset]
+        self._stack = []
+        self._key = None          # last key string seen in the current object
+        self._value_key = None    # key whose value comes next (after ":")
+        self._file_path = None
+
+    def feed(self, chunk: str) -> list:
+        self.buffer += chunk
+        completed = []
+        text = self.buffer
+        for index in range(self._pos, len(text)):
+            char = text[index]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._on_string(text[self._string_start:index + 1])
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = index
+            elif char == ":":
+                self._value_key, self._key = self._key, None
+            elif char == ",":
+                self._value_key = None
+            elif char in "{[":
+                parent = self._stack[-1] if self._stack else None
+                self._stack.append([char, self._value_key, index])
+                if char == "{" and parent and parent[0] == "[" and parent[1] == "files":
+                    self._file_path = None
+                self._value_key = None
+            elif char in "}]":
+                if not self._stack:
+                    continue
+                opened = self._stack.pop()
+                parent = self._stack[-1] if self._stack else None
+                if opened[0] == "{" and parent and parent[0] == "[" and parent[1] == "comments":
+                    try:
+                        comment = json.loads(text[opened[2]:index + 1])
+                    except json.JSONDecodeError:
+                        comment = None
+                    if isinstance(comment, dict):
+                        completed.append((self._file_path, comment))
+                self._value_key = None
+
+        self._pos = len(text)
+        return completed
+
+    def _on_string(self, token: str):
+        try:
+            value = json.loads(token)
+        except json.JSONDecodeError:
+            value = None
+        in_object = self._stack and self._stack[-1][0] == "{"
+        if not in_object:
+            return
+        if self._value_key is not None:
+            if self._value_key == "filePath":
+                self._file_path = value
+            self._value_key = None
+        else:
+            self._key = value
+
+
+# =========================================================
+# 🔹 Repair of truncated / slightly invalid JSON
+# =========================================================
+def _scan(text: str):
+    """Open brackets, whether we end inside a string, and the structural cut points."""
+    stack, cut_points = [], []
+    in_string = escape = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+            cut_points.append(index + 1)
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            cut_points.append(index + 1)
+        elif char == ",":
+            cut_points.append(index)
+    return stack, in_string, cut_points
+
+
+def _close(prefix: str) -> str:
+    stack, in_string, _ = _scan(prefix)
+    if in_string:
+        prefix += '"'
+    prefix = prefix.rstrip()
+    if prefix.endswith(","):
+        prefix = prefix[:-1]
+    return prefix + "".join(_CLOSERS[bracket] for bracket in reversed(stack))
+
+
+def repair_json(text: str, max_attempts: int = 200):
+    """
+    Best-effort recovery of a JSON object from model output: strips code
+    fences and trailing prose, drops trailing commas, and for truncated
+    output closes open strings/brackets, cutting back to the last complete
+    element when needed. Returns the dict, or None if nothing is recoverable.
+    """
+    text = _FENCE_RE.sub("", text or "")
+    start = text.find("{")
+    if start < 0:
+        return None
+    text = text[start:]
+
+    decoder = json.JSONDecoder()
+    for candidate in (text, _TRAILING_COMMA_RE.sub(r"\1", text)):
+        try:
+            value, _ = decoder.raw_decode(candidate)
+            if isinstance(value, dict):
+                return value
+        except json.JSONDecodeError:
+            pass
+
+    text = _TRAILING_COMMA_RE.sub(r"\1", text)
+    _, _, cut_points = _scan(text)
+    for cut in [len(text)] + list(reversed(cut_points))[:max_attempts]:
+        try:
+            value = json.loads(_close(text[:cut]))
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict):
+            return value
+    return None
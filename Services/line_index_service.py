@@ -0,0 +1,100 @@
+import re
+from bisect import bisect_left
+
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_$][\w$]*")
+_WHITESPACE_RE = re.compile(r"\s+")
+# Quoting and elision the model wraps hints in ("`apiLink`", "split(...)")
+_HINT_NOISE_RE = re.compile(r"^[`'\"]+|[`'\"]+$|\.\.\.|…")
+
+
+def _squash(text: str) -> str:
+    return _WHITESPACE_RE.sub("", text or "")
+
+
+def _nearest(lines: list, target) -> int:
+    """Entry of the sorted `lines` closest to `target` (ties → the earlier line)."""
+    if not isinstance(target, int):
+        return lines[0]
+    index = bisect_left(lines, target)
+    if index == 0:
+        return lines[0]
+    if index == len(lines):
+        return lines[-1]
+    before, after = lines[index - 1], lines[index]
+    return after if after - target < target - before else before
+
+
+# =========================================================
+# 🔹 Per-file index of the new side of a diff
+# =========================================================
+class LineIndex:
+    """
+    New-file line numbers of one FileDiff (added and context lines, i.e.
+    every line a right-side comment can sit on) with their hunk and text,
+    plus identifier → sorted line numbers, so a model comment can be
+    checked against its `line_hint` and moved to the closest matching line
+    without another model call.
+    """
+
+    def __init__(self, file_diff):
+        self.file_path = file_diff.file_path
+        self.lines = []          # sorted new-side line numbers
+        self.entries = {}        # line -> (hunk index, kind, text)
+        self.identifiers = {}    # identifier -> sorted lines containing it
+        for hunk_index, hunk in enumerate(file_diff.hunks):
+            for line in hunk.lines:
+                if line.kind == "-" or line.new_line in self.entries:
+                    continue
+                self.lines.append(line.new_line)
+                self.entries[line.new_line] = (hunk_index, line.kind, line.text)
+                for identifier in set(_IDENTIFIER_RE.findall(line.text)):
+                    self.identifiers.setdefault(identifier, []).append(line.new_line)
+
+    def __contains__(self, line_number) -> bool:
+        return line_number in self.entries
+
+    def text(self, line_number) -> str:
+        entry = self.entries.get(line_number)
+        return entry[2] if entry else None
+
+    def hunk_of(self, line_number):
+        entry = self.entries.get(line_number)
+        return entry[0] if entry else None
+
+    def _hint_lines(self, hint: str) -> list:
+        """Sorted lines matching the hint: containing it verbatim, else containing all of its identifiers."""
+        hint = _HINT_NOISE_RE.sub("", (hint or "").strip())
+        identifiers = set(_IDENTIFIER_RE.findall(hint))
+        postings = [self.identifiers.get(identifier) for identifier in identifiers]
+        if not identifiers or not all(postings):
+            return []
+        # candidates come from the rarest identifier, so the scan stays small
+        candidates = min(postings, key=len)
+        squashed = _squash(hint)
+        verbatim = [line for line in candidates if squashed in _squash(self.entries[line][2])]
+        if verbatim:
+            return verbatim
+        return [line for line in candidates
+                if identifiers.issubset(_IDENTIFIER_RE.findall(self.entries[line][2]))]
+
+    def anchor(self, line_number, line_hint: str = None):
+        """
+        (line, how) for a model comment. `how` is "exact" (the line matches
+        the hint), "snapped" (moved to the nearest line matching the hint),
+        "line" (inside the diff, hint not found) or "file" (line is None:
+        outside the diff with no matching line, post as a file-level thread).
+        """
+        if isinstance(line_number, str) and line_number.strip().isdigit():
+            line_number = int(line_number)
+        matches = self._hint_lines(line_hint)
+        if matches:
+            line = _nearest(matches, line_number)
+            return line, "exact" if line == line_number else "snapped"
+        if line_number in self.entries:
+            return line_number, "line"
+        return None, "file"
+
+
+def build_line_indexes(file_diffs: list) -> dict:
+    """{"/<path>": LineIndex} for the PR's FileDiffs, keyed like the AI input's file names."""
+    return {"/" + file_diff.file_path: LineIndex(file_diff) for file_diff in file_diffs}
@@ -0,0 +1,133 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Seconds; covers sub-ms cache hits up to multi-minute clones
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_lock = threading.Lock()
+_counters = {}      # (name, labels) -> value
+_histograms = {}    # (name, labels) -> {"buckets": [...], "sum": float, "count": int}
+_help = {}
+
+# Spans of the review currently running in this context (None → not collected)
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+# =========================================================
+# 🔹 Counters / histograms
+# =========================================================
+def inc_counter(name: str, value: float = 1, help_text: str = "", **labels):
+    with _lock:
+        key = (name, _label_key(labels))
+        _counters[key] = _counters.get(key, 0) + value
+        if help_text:
+            _help.setdefault(name, help_text)
+
+
+def observe(name: str, seconds: float, help_text: str = "", **labels):
+    with _lock:
+        key = (name, _label_key(labels))
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(DEFAULT_BUCKETS), "sum": 0.0, "count": 0}
+        for index, bound in enumerate(DEFAULT_BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][index] += 1
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+        if help_text:
+            _help.setdefault(name, help_text)
+
+
+# =========================================================
+# 🔹 Timing spans
+# =========================================================
+def start_request_timings() -> list:
+    """Collect every span recorded from here on (in this context) into the returned list."""
+    spans = []
+    _request_spans.set(spans)
+    return spans
+
+
+@contextmanager
+def stage_span(stage: str, **labels):
+    """
+    Time a pipeline stage into pr_review_stage_seconds and, when collection
+    is on, the per-request breakdown. Yields the span dict so callers can
+    attach details (tokens, cache hit, retries…).
+    """
+    spans = _request_spans.get()
+    span = {"stage": stage, **labels}
+    if spans is not None:
+        spans.append(span)
+    started = time.perf_counter()
+    try:
+        yield span
+    except BaseException:
+        span["status"] = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        span["seconds"] = round(seconds, 4)
+        observe("pr_review_stage_seconds", seconds, "Time spent in each review pipeline stage", stage=stage)
+
+
+def summarize_spans(spans: list) -> dict:
+    """Total seconds and call count per stage, for the optional response breakdown."""
+    summary = {}
+    for span in spans:
+        entry = summary.setdefault(span["stage"], {"seconds": 0.0, "calls": 0})
+        entry["seconds"] = round(entry["seconds"] + span.get("seconds", 0.0), 4)
+        entry["calls"] += 1
+    return summary
+
+
+# =========================================================
+# 🔹 Prometheus text exposition
+# =========================================================
+def _format_labels(label_key: tuple, extra: tuple = ()) -> str:
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for k, v in pairs:
+        v = v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escaped.append(f'{k}="{v}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus() -> str:
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(_histograms.items(), key=lambda item: item[0])
+        help_texts = dict(_help)
+
+    seen = set()
+    for (name, label_key), value in counters:
+        if name not in seen:
+            seen.add(name)
+            if name in help_texts:
+                lines.append(f"# HELP {name} {help_texts[name]}")
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_format_labels(label_key)} {value}")
+
+    for (name, label_key), histogram in histograms:
+        if name not in seen:
+            seen.add(name)
+            if name in help_texts:
+                lines.append(f"# HELP {name} {help_texts[name]}")
+            lines.append(f"# TYPE {name} histogram")
+        for bound, count in zip(DEFAULT_BUCKETS, histogram["buckets"]):
+            lines.append(f"{name}_bucket{_format_labels(label_key, (('le', str(bound)),))} {count}")
+        lines.append(f"{name}_bucket{_format_labels(label_key, (('le', '+Inf'),))} {histogram['count']}")
+        lines.append(f"{name}_sum{_format_labels(label_key)} {histogram['sum']}")
+        lines.append(f"{name}_count{_format_labels(label_key)} {histogram['count']}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,155 @@
+import os
+import time
+import asyncio
+import threading
+from dotenv import load_dotenv
+from Services.metrics_service import inc_counter
+
+load_dotenv()
+
+# Models tried, in order, when the primary (OPENAI_MODEL) fails or its circuit is open, e.g. "gpt-4.1-nano"
+AI_FALLBACK_MODELS = [m.strip() for m in os.getenv("AI_FALLBACK_MODELS", "").split(",") if m.strip()]
+# Consecutive failed calls (after the SDK/HTTP error, not bad model output) that open a model's circuit
+AI_BREAKER_FAILURES = int(os.getenv("AI_BREAKER_FAILURES", "5"))
+# Seconds an open circuit rejects calls before one trial call is let through
+AI_BREAKER_COOLDOWN = float(os.getenv("AI_BREAKER_COOLDOWN", "30"))
+# Seconds without any output before a second, identical request is raced against the first (0 = off)
+AI_HEDGE_AFTER = float(os.getenv("AI_HEDGE_AFTER", "10"))
+
+
+# =========================================================
+# 🔹 Per-model circuit breaker
+# =========================================================
+class CircuitBreaker:
+    """
+    closed → (AI_BREAKER_FAILURES consecutive failures) → open → (cooldown)
+    → half_open: a single trial call; success closes the circuit, failure
+    opens it for another cooldown. While open, calls are rejected without
+    touching the network, so an outage costs nothing but the fallback.
+    """
+
+    def __init__(self, model: str, failure_threshold: int = AI_BREAKER_FAILURES,
+                 cooldown: float = AI_BREAKER_COOLDOWN):
+        self.model = model
+        self.failure_threshold = max(failure_threshold, 1)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now (claims the trial slot when half-open)."""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self._set_state("half_open")
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.trial_in_flight = False
+            if self.state != "closed":
+                self._set_state("closed")
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._set_state("open")
+
+    def release(self):
+        """A call ended without a verdict (cancelled, e.g. it lost a hedge race); free the trial slot."""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def _set_state(self, state: str):
+        print(f"🔌 Model {self.model} circuit {self.state} → {state}")
+        inc_counter("pr_review_model_circuit_transitions_total", help_text="Model circuit breaker state changes",
+                    model=self.model, state=state)
+        self.state = state
+
+    def describe(self) -> dict:
+        with self._lock:
+            retry_in = None
+            if self.state == "open":
+                retry_in = round(max(self.cooldown - (time.monotonic() - self.opened_at), 0), 1)
+            return {"model": self.model, "state": self.state, "consecutive_failures": self.failures,
+                    "retry_in_seconds": retry_in}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker(model)
+        return _breakers[model]
+
+
+def model_chain(primary: str) -> list:
+    """The primary model followed by the configured fallbacks (duplicates dropped)."""
+    return list(dict.fromkeys([primary] + AI_FALLBACK_MODELS))
+
+
+def model_health(primary: str) -> list:
+    return [get_breaker(model).describe() for model in model_chain(primary)]
+
+
+# =========================================================
+# 🔹 Hedged requests
+# =========================================================
+async def hedged(start_call, hedge_after: float = AI_HEDGE_AFTER):
+    """
+    Run `start_call(claim, is_hedge)` and, if it has produced nothing after
+    `hedge_after` seconds, a second copy alongside it. Each call invokes
+    `claim()` when it produces its first output (a streamed comment) and
+    must stop emitting output if that returns False; the first call to
+    claim (or to finish) wins and the other is cancelled, so callers
+    never see output from both. Returns (result, hedged: bool).
+    """
+    winner = None
+
+    def claimer(call_id: int):
+        def claim() -> bool:
+            nonlocal winner
+            if winner is None:
+                winner = call_id
+            return winner == call_id
+        return claim
+
+    if hedge_after <= 0:
+        return await start_call(claimer(0), False), False
+
+    tasks = {0: asyncio.ensure_future(start_call(claimer(0), False))}
+    try:
+        done, _ = await asyncio.wait(tasks.values(), timeout=hedge_after)
+        if done or winner is not None:
+            return await tasks[0], False
+
+        inc_counter("pr_review_model_hedges_total", help_text="Second requests raced against a slow model call")
+        tasks[1] = asyncio.ensure_future(start_call(claimer(1), True))
+        while True:
+            done, _ = await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_COMPLETED)
+            if winner is not None:
+                # whoever claimed first owns the output; a loser stops as soon as its claim is refused
+                return await tasks[winner], True
+            call_id, finished = next((i, t) for i, t in tasks.items() if t in done)
+            if not finished.exception() or len(tasks) == 1:
+                return finished.result(), True
+            # one copy failed before producing anything; the other may still succeed
+            del tasks[call_id]
+    finally:
+        for task in tasks.values():
+            if not task.done():
+                task.cancel()
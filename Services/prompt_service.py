@@ -0,0 +1,86 @@
+import os
+import json
+import hashlib
+from string import Formatter
+from dataclasses import dataclass
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Templates live in <AI_PROMPT_DIR>/<name>/<version>/{system.txt, user.txt, schema.json}
+AI_PROMPT_DIR = os.getenv("AI_PROMPT_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "Prompts"))
+AI_PROMPT_VERSION = os.getenv("AI_PROMPT_VERSION", "v2")
+# "json_schema" (structured outputs), "json_object" or "text" for servers without either
+AI_RESPONSE_FORMAT = os.getenv("AI_RESPONSE_FORMAT", "json_schema").lower()
+
+USER_TEMPLATE_FIELDS = {"title", "source_branch", "target_branch", "files_changed", "sections"}
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """
+    One prompt version. The system message is fully static, so every request
+    starts with the same prefix; everything PR- or file-specific is rendered
+    into the user message that follows it. Provider-side prompt caching only
+    applies once that prefix reaches 1024 tokens, which v2 does not.
+    """
+    name: str
+    version: str
+    system: str
+    user: str
+    schema: Optional[dict]
+    fingerprint: str
+
+    def response_format(self) -> Optional[dict]:
+        if AI_RESPONSE_FORMAT == "json_schema" and self.schema:
+            return {"type": "json_schema",
+                    "json_schema": {"name": f"{self.name}_{self.version}", "strict": True, "schema": self.schema}}
+        if AI_RESPONSE_FORMAT in ("json_schema", "json_object"):
+            return {"type": "json_object"}
+        return None
+
+    def render_user(self, ai_input: dict, sections: list) -> str:
+        return self.user.format(
+            title=ai_input.get("title"),
+            source_branch=ai_input.get("source_branch"),
+            target_branch=ai_input.get("target_branch"),
+            files_changed=ai_input.get("files_changed"),
+            sections="\n\n".join(sections)
+        )
+
+    def messages(self, ai_input: dict, sections: list) -> list:
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.render_user(ai_input, sections)}
+        ]
+
+
+def load_prompt(name: str, version: str, prompt_dir: str = AI_PROMPT_DIR) -> PromptTemplate:
+    """Read and validate one template version; raises ValueError / OSError if it is unusable."""
+    base = os.path.join(prompt_dir, name, version)
+    with open(os.path.join(base, "system.txt"), encoding="utf-8") as f:
+        system = f.read().strip()
+    with open(os.path.join(base, "user.txt"), encoding="utf-8") as f:
+        user = f.read().strip()
+
+    schema = None
+    schema_path = os.path.join(base, "schema.json")
+    if os.path.exists(schema_path):
+        with open(schema_path, encoding="utf-8") as f:
+            schema = json.load(f)
+
+    fields = {field for _, field, _, _ in Formatter().parse(user) if field}
+    unknown = fields - USER_TEMPLATE_FIELDS
+    if unknown or "sections" not in fields:
+        raise ValueError(f"Prompt {name}/{version}: user.txt must use {{sections}} and only "
+                         f"{sorted(USER_TEMPLATE_FIELDS)} (found {sorted(fields)})")
+
+    digest = hashlib.sha256()
+    for part in (name, version, system, user, json.dumps(schema, sort_keys=True), AI_RESPONSE_FORMAT):
+        digest.update(part.encode("utf-8") + b"\x1f")
+    return PromptTemplate(name, version, system, user, schema, digest.hexdigest())
+
+
+# ✅ Loaded once at startup; a missing or broken template fails the import, not the first review
+REVIEW_PROMPT = load_prompt("review", AI_PROMPT_VERSION)
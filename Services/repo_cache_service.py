@@ -0,0 +1,402 @@
+import os
+import time
+import shutil
+import signal
+import subprocess
+import threading
+import contextvars
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "full" → every branch with its whole history (one fetch shared by all PRs);
+# "partial" → blobless (--filter=blob:none), depth-limited fetch of just the PR's two branches,
+# deepened until their merge base is present; the changed files' blobs are fetched on demand
+REVIEW_FETCH_STRATEGY = os.getenv("REVIEW_FETCH_STRATEGY", "full").lower()
+# Commits fetched per branch the first time a partial mirror sees it
+REVIEW_FETCH_DEPTH = int(os.getenv("REVIEW_FETCH_DEPTH", "50"))
+# Doubling --deepen rounds looking for the merge base before falling back to --unshallow
+REVIEW_FETCH_MAX_DEEPEN = int(os.getenv("REVIEW_FETCH_MAX_DEEPEN", "4"))
+# Wall-clock limit for one fetch / hydration git command, in seconds (0 = none)
+REVIEW_GIT_TIMEOUT = float(os.getenv("REVIEW_GIT_TIMEOUT", "300"))
+
+# "none" → diffs are read straight from the mirror's object store (no checkout)
+# "worktree" → a lightweight per-PR worktree is also materialised
+REVIEW_CHECKOUT_MODE = os.getenv("REVIEW_CHECKOUT_MODE", "none").lower()
+REVIEW_MAX_WORKTREES = int(os.getenv("REVIEW_MAX_WORKTREES", "20"))
+REVIEW_WORKTREE_BUDGET_MB = int(os.getenv("REVIEW_WORKTREE_BUDGET_MB", "2048"))
+
+# One lock per mirror so concurrent reviews don't race on git's ref locks
+_mirror_locks = {}
+_mirror_locks_guard = threading.Lock()
+# mirror_dir (full fetch) or (mirror_dir, branch) (partial fetch) -> time.time() at which its last
+# successful fetch started
+_last_fetch_started = {}
+# Set by the review that runs the git command; set() kills it (see git_cancel_scope)
+_git_cancel_event = contextvars.ContextVar("git_cancel_event", default=None)
+# worktree path -> (mtime, bytes) when last measured; only a worktree used since then is walked again
+_worktree_sizes = {}
+# How often a running git command checks its deadline / cancellation
+_GIT_POLL_SECONDS = 0.1
+_ZERO_OID = "0" * 40
+
+
+class GitCancelledError(subprocess.SubprocessError):
+    pass
+
+
+def _mirror_lock(mirror_dir: str) -> threading.Lock:
+    with _mirror_locks_guard:
+        return _mirror_locks.setdefault(mirror_dir, threading.Lock())
+
+
+def _dir_size_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+# =========================================================
+# 🔹 Git commands with a timeout and cancellation
+# =========================================================
+@contextmanager
+def git_cancel_scope():
+    """
+    Yields an Event; setting it kills any git command run_git started in
+    this context, including from worker threads (asyncio.to_thread copies
+    the context), so a cancelled review does not leave a fetch running.
+    """
+    event = threading.Event()
+    token = _git_cancel_event.set(event)
+    try:
+        yield event
+    finally:
+        _git_cancel_event.reset(token)
+
+
+def _kill_process_tree(process: subprocess.Popen):
+    # fetch runs helpers (remote-https, index-pack) that would keep the pipes open after git itself dies
+    if os.name == "posix":
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+            return
+        except ProcessLookupError:
+            pass
+    process.kill()
+
+
+def run_git(args: list, timeout: float = REVIEW_GIT_TIMEOUT, input: str = None,
+            check: bool = True) -> subprocess.CompletedProcess:
+    """
+    `git <args>` with captured text output. The process is killed when it
+    runs longer than `timeout` seconds (TimeoutExpired) or the surrounding
+    git_cancel_scope is cancelled (GitCancelledError); a non-zero exit raises
+    CalledProcessError when `check` is set.
+    """
+    cmd = ["git", *args]
+    cancel = _git_cancel_event.get()
+    deadline = time.monotonic() + timeout if timeout else None
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                               start_new_session=os.name == "posix")
+    while True:
+        try:
+            stdout, stderr = process.communicate(input, timeout=_GIT_POLL_SECONDS)
+            break
+        except subprocess.TimeoutExpired:
+            input = None   # already handed over; communicate() keeps writing it
+            cancelled = cancel is not None and cancel.is_set()
+            if not cancelled and (deadline is None or time.monotonic() < deadline):
+                continue
+            _kill_process_tree(process)
+            stdout, stderr = process.communicate()
+            if cancelled:
+                raise GitCancelledError(f"Cancelled: {' '.join(cmd)}")
+            raise subprocess.TimeoutExpired(cmd, timeout, stdout, stderr)
+
+    if check and process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
+@contextmanager
+def git_deadline(process: subprocess.Popen, timeout: float = REVIEW_GIT_TIMEOUT):
+    """
+    run_git's limits for a git process whose output is streamed instead:
+    a watcher thread kills it after `timeout` seconds or when the
+    surrounding git_cancel_scope is cancelled, and leaving the block then
+    raises TimeoutExpired / GitCancelledError (over whatever error the
+    killed process caused).
+    """
+    cancel = _git_cancel_event.get()
+    deadline = time.monotonic() + timeout if timeout else None
+    done, reason = threading.Event(), []
+
+    def _watch():
+        while not done.wait(_GIT_POLL_SECONDS):
+            if cancel is not None and cancel.is_set():
+                reason.append("cancelled")
+            elif deadline is not None and time.monotonic() >= deadline:
+                reason.append("timeout")
+            else:
+                continue
+            _kill_process_tree(process)
+            return
+
+    watcher = threading.Thread(target=_watch, daemon=True)
+    watcher.start()
+    try:
+        yield
+    finally:
+        done.set()
+        watcher.join()
+        if reason == ["cancelled"]:
+            raise GitCancelledError(f"Cancelled: {' '.join(process.args)}")
+        if reason:
+            raise subprocess.TimeoutExpired(process.args, timeout)
+
+
+# =========================================================
+# 🔹 Bare mirror (one per repository)
+# =========================================================
+def get_mirror_dir(repo_id: str) -> str:
+    """Location of the persistent bare mirror for a repository."""
+    return os.path.join(os.getcwd(), "local_repo", "mirrors", f"{repo_id}.git")
+
+
+def get_worktrees_dir(repo_id: str) -> str:
+    return os.path.join(os.getcwd(), "local_repo", "worktrees", repo_id)
+
+
+def sync_mirror(repo_url: str, repo_id: str, fresh_since: float = None) -> str:
+    """
+    Create the bare mirror on first use, then keep it current with
+    incremental fetches. Remote branches land under refs/remotes/origin/*
+    so existing `origin/<branch>` diff commands keep working.
+    Returns the mirror's git dir.
+
+    A fetch that started at or after `fresh_since` (default: the time of
+    this call) is reused instead of fetching again, so callers queued on the
+    mirror lock share one fetch and a bulk run can fetch once for all PRs.
+    """
+    mirror_dir = get_mirror_dir(repo_id)
+    fresh_since = time.time() if fresh_since is None else fresh_since
+
+    with _mirror_lock(mirror_dir):
+        if _last_fetch_started.get(mirror_dir, 0) >= fresh_since and os.path.exists(os.path.join(mirror_dir, "HEAD")):
+            return mirror_dir
+
+        _ensure_mirror(mirror_dir, repo_url)
+        fetch_started = time.time()
+        # a partial mirror keeps its blob:none filter (remote.origin.partialclonefilter) on full fetches too
+        run_git(["-C", mirror_dir, "fetch", "--prune", "--quiet", "origin"])
+        _last_fetch_started[mirror_dir] = fetch_started
+
+    return mirror_dir
+
+
+def _ensure_mirror(mirror_dir: str, repo_url: str):
+    """Create the bare mirror on first use; otherwise keep its remote URL current. Call under the mirror lock."""
+    if not os.path.exists(os.path.join(mirror_dir, "HEAD")):
+        os.makedirs(mirror_dir, exist_ok=True)
+        run_git(["init", "--bare", "--quiet", mirror_dir])
+        run_git(["-C", mirror_dir, "remote", "add", "origin", repo_url])
+        run_git(["-C", mirror_dir, "config", "remote.origin.fetch", "+refs/heads/*:refs/remotes/origin/*"])
+        print(f"✅ Created bare mirror: {mirror_dir}")
+    else:
+        # PAT rotation changes the URL, keep it in sync
+        run_git(["-C", mirror_dir, "remote", "set-url", "origin", repo_url])
+
+
+# =========================================================
+# 🔹 Partial mirror: only the PR's refs, blobs on demand
+# =========================================================
+def _has_ref(mirror_dir: str, ref: str) -> bool:
+    return run_git(["-C", mirror_dir, "rev-parse", "--verify", "--quiet", ref], check=False).returncode == 0
+
+
+def _has_merge_base(mirror_dir: str, ref_a: str, ref_b: str) -> bool:
+    return run_git(["-C", mirror_dir, "merge-base", ref_a, ref_b], check=False).returncode == 0
+
+
+def _fetch_partial(mirror_dir: str, refspecs: list, *options):
+    run_git(["-C", mirror_dir, "fetch", "--quiet", "--no-tags", "--filter=blob:none", *options, "origin", *refspecs])
+
+
+def sync_pr_refs(repo_url: str, repo_id: str, source_branch: str, target_branch: str,
+                 fresh_since: float = None) -> str:
+    """
+    "partial" strategy: fetch only the PR's source and target branches,
+    without blobs. A branch the mirror has never seen is fetched
+    REVIEW_FETCH_DEPTH commits deep; known branches fetch just their new
+    commits. History is then deepened (doubling, then --unshallow) until
+    the two branches share a merge base. Branches fetched at or after
+    `fresh_since` are not fetched again. Returns the mirror's git dir.
+    """
+    mirror_dir = get_mirror_dir(repo_id)
+    fresh_since = time.time() if fresh_since is None else fresh_since
+    branches = list(dict.fromkeys([source_branch, target_branch]))
+
+    with _mirror_lock(mirror_dir):
+        _ensure_mirror(mirror_dir, repo_url)
+        full_fetch = _last_fetch_started.get(mirror_dir, 0)
+        stale = [b for b in branches if max(full_fetch, _last_fetch_started.get((mirror_dir, b), 0)) < fresh_since]
+        if not stale:
+            return mirror_dir
+
+        fetch_started = time.time()
+        refspec = lambda branch: f"+refs/heads/{branch}:refs/remotes/origin/{branch}"
+        known = [b for b in stale if _has_ref(mirror_dir, f"refs/remotes/origin/{b}")]
+        new = [b for b in stale if b not in known]
+        if known:
+            _fetch_partial(mirror_dir, [refspec(b) for b in known])
+        if new:
+            _fetch_partial(mirror_dir, [refspec(b) for b in new], f"--depth={REVIEW_FETCH_DEPTH}")
+
+        source_ref, target_ref = f"origin/{source_branch}", f"origin/{target_branch}"
+        refspecs = [refspec(b) for b in branches]
+        deepen = REVIEW_FETCH_DEPTH
+        for _ in range(REVIEW_FETCH_MAX_DEEPEN):
+            if _has_merge_base(mirror_dir, source_ref, target_ref):
+                break
+            _fetch_partial(mirror_dir, refspecs, f"--deepen={deepen}")
+            deepen *= 2
+        else:
+            if not _has_merge_base(mirror_dir, source_ref, target_ref) and \
+                    os.path.exists(os.path.join(mirror_dir, "shallow")):
+                print(f"⚠️ No merge base of {source_branch} and {target_branch} within the deepened history; "
+                      f"fetching their full (blobless) history")
+                _fetch_partial(mirror_dir, refspecs, "--unshallow")
+
+        for branch in stale:
+            _last_fetch_started[(mirror_dir, branch)] = fetch_started
+
+    return mirror_dir
+
+
+def fetch_commit(mirror_dir: str, commit_id: str) -> bool:
+    """Best-effort blobless fetch of one commit by id (e.g. a last reviewed commit a partial mirror never saw)."""
+    try:
+        _fetch_partial(mirror_dir, [commit_id], f"--depth={REVIEW_FETCH_DEPTH}")
+        return True
+    except subprocess.CalledProcessError:
+        return False
+
+
+def is_partial_mirror(mirror_dir: str) -> bool:
+    result = run_git(["-C", mirror_dir, "config", "--get", "remote.origin.promisor"], check=False)
+    return result.stdout.strip() == "true"
+
+
+def hydrate_paths(mirror_dir: str, base_ref: str, head_ref: str, file_paths: list) -> int:
+    """
+    Fetch the blobs of `file_paths` (a pathspec) on both sides of base_ref..head_ref
+    into a partial mirror with one request, instead of git lazily fetching
+    them one by one during the diff. Blobs already present are not
+    requested again by git. Returns the number of blob ids asked for.
+    """
+    if not file_paths or not is_partial_mirror(mirror_dir):
+        return 0
+    # --no-renames: rename detection would read (and lazily fetch) the very blobs being listed
+    raw = run_git(["-c", "core.quotePath=false", "-C", mirror_dir, "diff", "--raw", "--no-abbrev", "--no-renames",
+                   base_ref, head_ref, "--", *file_paths]).stdout
+    # ":100644 100644 <old blob> <new blob> M\t<path>"
+    blob_ids = {oid for line in raw.splitlines() if line.startswith(":")
+                for oid in line.split("\t", 1)[0].split()[2:4] if oid != _ZERO_OID}
+    if blob_ids:
+        run_git(["-c", "fetch.negotiationAlgorithm=noop", "-C", mirror_dir, "fetch", "--quiet", "--no-tags",
+                 "--no-write-fetch-head", "--recurse-submodules=no", "--filter=blob:none", "--stdin", "origin"],
+                input="\n".join(sorted(blob_ids)) + "\n")
+    return len(blob_ids)
+
+
+# =========================================================
+# 🔹 Per-PR worktrees (optional) + LRU garbage collection
+# =========================================================
+def prepare_pr_checkout(mirror_dir: str, repo_id: str, pr_id: int, feature_branch: str):
+    """
+    In "worktree" mode, check out the PR's source branch into a detached
+    worktree that shares the mirror's objects. Returns the worktree path,
+    or None in the default no-checkout mode.
+    """
+    if REVIEW_CHECKOUT_MODE != "worktree":
+        return None
+
+    worktrees_dir = get_worktrees_dir(repo_id)
+    os.makedirs(worktrees_dir, exist_ok=True)
+    worktree_dir = os.path.join(worktrees_dir, f"pr_{pr_id or 'temp'}")
+
+    with _mirror_lock(mirror_dir):
+        if os.path.exists(worktree_dir):
+            run_git(["-C", worktree_dir, "checkout", "--quiet", "--detach", f"origin/{feature_branch}"])
+        else:
+            run_git(["-C", mirror_dir, "worktree", "add", "--quiet", "--force", "--detach",
+                     worktree_dir, f"origin/{feature_branch}"])
+
+    # mtime doubles as the LRU timestamp
+    os.utime(worktree_dir, None)
+    gc_worktrees(mirror_dir, repo_id, keep=worktree_dir)
+    return worktree_dir
+
+
+def _worktree_size(path: str, mtime: float) -> int:
+    cached = _worktree_sizes.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    size = _dir_size_bytes(path)
+    _worktree_sizes[path] = (mtime, size)
+    return size
+
+
+def gc_worktrees(mirror_dir: str, repo_id: str, keep: str = None):
+    """
+    Evict least-recently-used worktrees until both the count limit
+    (REVIEW_MAX_WORKTREES) and size budget (REVIEW_WORKTREE_BUDGET_MB) hold.
+    The count limit needs only mtimes; sizes are cached per mtime, so a
+    review walks just the worktree it used instead of every worktree.
+    """
+    worktrees_dir = get_worktrees_dir(repo_id)
+    if not os.path.isdir(worktrees_dir):
+        return {"removed": []}
+
+    entries = []
+    for name in os.listdir(worktrees_dir):
+        path = os.path.join(worktrees_dir, name)
+        if os.path.isdir(path):
+            entries.append((os.path.getmtime(path), path))
+    entries.sort()  # oldest first
+
+    budget_bytes = REVIEW_WORKTREE_BUDGET_MB * 1024 * 1024
+    removed = []
+
+    with _mirror_lock(mirror_dir):
+        evictable = [path for _, path in entries if path != keep]
+        doomed = evictable[:max(len(entries) - REVIEW_MAX_WORKTREES, 0)]
+        remaining = [(mtime, path) for mtime, path in entries if path not in doomed]
+        sizes = {path: _worktree_size(path, mtime) for mtime, path in remaining}
+        total_bytes = sum(sizes.values())
+        for _, path in remaining:
+            if total_bytes <= budget_bytes:
+                break
+            if path == keep:
+                continue
+            doomed.append(path)
+            total_bytes -= sizes[path]
+
+        for path in doomed:
+            run_git(["-C", mirror_dir, "worktree", "remove", "--force", path], check=False)
+            shutil.rmtree(path, ignore_errors=True)
+            _worktree_sizes.pop(path, None)
+            removed.append(path)
+
+        run_git(["-C", mirror_dir, "worktree", "prune"], check=False)
+
+    if removed:
+        print(f"🧹 Removed {len(removed)} stale worktrees from {worktrees_dir}")
+    return {"removed": removed}
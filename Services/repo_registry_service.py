@@ -0,0 +1,170 @@
+import os
+import json
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
+from urllib.parse import quote, urlsplit
+from dotenv import load_dotenv
+from Services.azure_client_service import AzureDevOpsClient, AZURE_BASE_URL
+
+load_dotenv()
+
+# JSON list of repositories served by this deployment (see README); unset → the single AZURE_* repo
+REVIEW_REPOS_FILE = os.getenv("REVIEW_REPOS_FILE")
+# Registry name used when a request does not name a repository
+REVIEW_DEFAULT_REPO = os.getenv("REVIEW_DEFAULT_REPO")
+# PR reviews running at once per repository, unless the registry entry sets its own
+REVIEW_REPO_CONCURRENCY = int(os.getenv("REVIEW_REPO_CONCURRENCY", "4"))
+
+
+class UnknownRepositoryError(LookupError):
+    pass
+
+
+@dataclass
+class RepoConfig:
+    """
+    One Azure DevOps repository: where it lives, how to authenticate, and
+    the per-repository resources (REST client, mirror, review quota).
+    `name` is the registry key used by requests and for the mirror directory.
+    """
+    name: str
+    org: str
+    project: str
+    repo_id: str
+    pat: str = field(default=None, repr=False)
+    base_url: str = AZURE_BASE_URL
+    git_url: Optional[str] = field(default=None, repr=False)
+    max_concurrent_reviews: int = REVIEW_REPO_CONCURRENCY
+    client: AzureDevOpsClient = field(default=None, init=False, repr=False)
+    _slots: dict = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        self.client = AzureDevOpsClient(self.base_url, self.org, self.project, self.repo_id, self.pat)
+
+    @property
+    def clone_url(self) -> str:
+        """`git_url`, or the repository's git URL on `base_url` (Azure DevOps Server too) with the PAT inlined."""
+        if self.git_url:
+            return self.git_url
+        base = urlsplit(self.base_url)
+        auth = f"{quote(self.pat, safe='')}@" if self.pat else ""
+        path = "/".join(quote(part) for part in (self.org, self.project, "_git", self.repo_id))
+        return f"{base.scheme}://{auth}{base.netloc}{base.path.rstrip('/')}/{path}"
+
+    def review_slot(self) -> asyncio.Semaphore:
+        """This repository's review quota on the running event loop."""
+        loop = asyncio.get_running_loop()
+        if loop not in self._slots:
+            self._slots.clear()
+            self._slots[loop] = asyncio.Semaphore(self.max_concurrent_reviews)
+        return self._slots[loop]
+
+    def matches(self, repository: dict) -> bool:
+        """Whether an Azure `repository` object (webhook payload) refers to this repository."""
+        ids = {str(repository.get("id", "")).lower(), str(repository.get("name", "")).lower()}
+        if self.repo_id.lower() not in ids:
+            return False
+        project = repository.get("project") or {}
+        names = {str(project.get("id", "")).lower(), str(project.get("name", "")).lower()} - {""}
+        return not names or self.project.lower() in names
+
+    def describe(self) -> dict:
+        return {"name": self.name, "org": self.org, "project": self.project, "repo_id": self.repo_id,
+                "base_url": self.base_url, "max_concurrent_reviews": self.max_concurrent_reviews}
+
+
+def _from_entry(entry: dict) -> RepoConfig:
+    missing = [key for key in ("org", "project", "repo_id") if not entry.get(key)]
+    if missing:
+        raise ValueError(f"Repository entry {entry.get('name') or entry} is missing {', '.join(missing)}")
+    # PATs belong in the environment, not in the registry file
+    pat = os.getenv(entry["pat_env"]) if entry.get("pat_env") else entry.get("pat")
+    return RepoConfig(
+        name=entry.get("name") or entry["repo_id"],
+        org=entry["org"],
+        project=entry["project"],
+        repo_id=entry["repo_id"],
+        pat=pat,
+        base_url=(entry.get("base_url") or AZURE_BASE_URL).rstrip("/"),
+        git_url=entry.get("git_url"),
+        max_concurrent_reviews=int(entry.get("max_concurrent_reviews") or REVIEW_REPO_CONCURRENCY)
+    )
+
+
+def _load_repositories() -> dict:
+    if REVIEW_REPOS_FILE:
+        with open(REVIEW_REPOS_FILE, encoding="utf-8") as f:
+            entries = json.load(f)
+        if isinstance(entries, dict):
+            entries = entries.get("repositories", [])
+    else:
+        # Single-repository deployments keep working from the original AZURE_* variables
+        entries = [{
+            "org": os.getenv("AZURE_ORG"),
+            "project": os.getenv("AZURE_PROJECT"),
+            "repo_id": os.getenv("AZURE_REPO_ID"),
+            "pat": os.getenv("AZURE_PAT"),
+            "git_url": os.getenv("AZURE_GIT_URL")
+        }]
+        if not all(entries[0][key] for key in ("org", "project", "repo_id")):
+            print("⚠️ No REVIEW_REPOS_FILE and AZURE_ORG/AZURE_PROJECT/AZURE_REPO_ID incomplete; no repository registered")
+            return {}
+
+    repositories = {}
+    for entry in entries:
+        repo = _from_entry(entry)
+        if repo.name in repositories:
+            raise ValueError(f"Repository {repo.name!r} is registered twice")
+        repositories[repo.name] = repo
+    return repositories
+
+
+_lock = threading.Lock()
+_repositories = None
+
+
+def _registry() -> dict:
+    global _repositories
+    with _lock:
+        if _repositories is None:
+            _repositories = _load_repositories()
+        return _repositories
+
+
+# =========================================================
+# 🔹 Lookup
+# =========================================================
+def get_repo(name: str = None) -> RepoConfig:
+    """
+    Registry entry by name (or Azure repository id / name). Without a name,
+    REVIEW_DEFAULT_REPO or the only registered repository. Raises
+    UnknownRepositoryError.
+    """
+    repositories = _registry()
+    if name is None:
+        if REVIEW_DEFAULT_REPO:
+            name = REVIEW_DEFAULT_REPO
+        elif len(repositories) == 1:
+            return next(iter(repositories.values()))
+        elif not repositories:
+            raise UnknownRepositoryError("No repository is registered (set REVIEW_REPOS_FILE or AZURE_*)")
+        else:
+            raise UnknownRepositoryError("Several repositories are registered; specify which one to review")
+
+    if name in repositories:
+        return repositories[name]
+    for repo in repositories.values():
+        if name.lower() in (repo.name.lower(), repo.repo_id.lower()):
+            return repo
+    raise UnknownRepositoryError(f"Repository {name!r} is not registered")
+
+
+def find_repo_for_event(repository: dict) -> Optional[RepoConfig]:
+    """Registered repository a webhook payload's `resource.repository` refers to, or None."""
+    return next((repo for repo in _registry().values() if repo.matches(repository)), None)
+
+
+def list_repos() -> list:
+    return list(_registry().values())
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from dotenv import load_dotenv
+from Services.metrics_service import inc_counter
+
+load_dotenv()
+
+REVIEW_CACHE_ENABLED = os.getenv("REVIEW_CACHE_ENABLED", "true").lower() == "true"
+REVIEW_CACHE_PATH = os.getenv("REVIEW_CACHE_PATH", os.path.join(os.getcwd(), "local_repo", "review_cache.sqlite3"))
+REVIEW_CACHE_TTL_HOURS = float(os.getenv("REVIEW_CACHE_TTL_HOURS", "168"))
+REVIEW_CACHE_MAX_ENTRIES = int(os.getenv("REVIEW_CACHE_MAX_ENTRIES", "5000"))
+
+_lock = threading.Lock()
+_initialized = False
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "saved_seconds": 0.0, "saved_tokens": 0}
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _connect() -> sqlite3.Connection:
+    global _initialized
+    if not _initialized:
+        os.makedirs(os.path.dirname(REVIEW_CACHE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(REVIEW_CACHE_PATH, timeout=10)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS review_cache (
+                cache_key    TEXT PRIMARY KEY,
+                review_json  TEXT NOT NULL,
+                created_at   REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                latency_s    REAL NOT NULL DEFAULT 0,
+                tokens       INTEGER NOT NULL DEFAULT 0,
+                hit_count    INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_review_cache_last_used ON review_cache(last_used_at)")
+        conn.commit()
+        _initialized = True
+    return conn
+
+
+# =========================================================
+# 🔹 Cache key
+# =========================================================
+def make_cache_key(file_name: str, diff_text: str, model: str, temperature: float, prompt_template: str) -> str:
+    """Content address for one file review: diff + model settings + prompt version."""
+    parts = [file_name, _sha256(diff_text), model, repr(float(temperature)), _sha256(prompt_template)]
+    return _sha256("\x1f".join(parts))
+
+
+# =========================================================
+# 🔹 Lookup / store
+# =========================================================
+def get_cached_review(cache_key: str):
+    """Return the cached review dict, or None on miss/expiry."""
+    if not REVIEW_CACHE_ENABLED:
+        return None
+
+    now = time.time()
+    min_created = now - REVIEW_CACHE_TTL_HOURS * 3600
+    with _lock:
+        conn = _connect()
+        try:
+            row = conn.execute(
+                "SELECT review_json, latency_s, tokens FROM review_cache WHERE cache_key = ? AND created_at >= ?",
+                (cache_key, min_created)
+            ).fetchone()
+            if row is None:
+                _stats["misses"] += 1
+                inc_counter("pr_review_cache_misses_total", help_text="Review cache misses")
+                return None
+
+            conn.execute(
+                "UPDATE review_cache SET last_used_at = ?, hit_count = hit_count + 1 WHERE cache_key = ?",
+                (now, cache_key)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        _stats["hits"] += 1
+        _stats["saved_seconds"] += row[1]
+        _stats["saved_tokens"] += row[2]
+    inc_counter("pr_review_cache_hits_total", help_text="Review cache hits")
+
+    return json.loads(row[0])
+
+
+def store_review(cache_key: str, review: dict, latency_s: float = 0.0, tokens: int = 0):
+    """Persist a successful review and enforce TTL / size limits."""
+    if not REVIEW_CACHE_ENABLED or not review or "error" in review:
+        return
+
+    now = time.time()
+    payload = json.dumps(review, separators=(",", ":"))
+    with _lock:
+        conn = _connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO review_cache (cache_key, review_json, created_at, last_used_at, latency_s, tokens) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key, payload, now, now, latency_s, tokens)
+            )
+            expired = conn.execute(
+                "DELETE FROM review_cache WHERE created_at < ?", (now - REVIEW_CACHE_TTL_HOURS * 3600,)
+            ).rowcount
+            overflow = conn.execute(
+                "DELETE FROM review_cache WHERE cache_key IN ("
+                "  SELECT cache_key FROM review_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (REVIEW_CACHE_MAX_ENTRIES,)
+            ).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+
+        _stats["stores"] += 1
+        _stats["evictions"] += expired + overflow
+
+
+def get_cache_stats() -> dict:
+    """Hit/miss counters since process start plus the current cache size."""
+    with _lock:
+        stats = dict(_stats)
+        conn = _connect()
+        try:
+            stats["entries"] = conn.execute("SELECT COUNT(*) FROM review_cache").fetchone()[0]
+        finally:
+            conn.close()
+
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    stats["saved_seconds"] = round(stats["saved_seconds"], 3)
+    stats["enabled"] = REVIEW_CACHE_ENABLED
+    return stats
@@ -0,0 +1,256 @@
+import os
+import time
+import asyncio
+import weakref
+from dotenv import load_dotenv
+from Services.diff_service import (
+    get_pr_details,
+    get_pr_diff_summary,
+    get_summary_file_diffs,
+    get_gitattributes,
+    archive_file_diffs
+)
+from Services.diff_filter_service import prefilter_file_diffs
+from Services.line_index_service import build_line_indexes
+from Services.ai_input_service import build_ai_input
+from Services.ai_review_service import review_files_packed
+from Services.azure_pr_comment_service import post_review_comments, EarlyCommentPublisher
+from Services.review_state_service import get_last_reviewed_commit, record_reviewed_commit
+from Services.review_store_service import save_review_run
+from Services.repo_registry_service import RepoConfig, get_repo
+from Services.repo_cache_service import git_cancel_scope
+from Services.metrics_service import stage_span, start_request_timings, summarize_spans, observe, inc_counter
+
+load_dotenv()
+
+# Write each PR's diffs to local_repo/pr_<id>/diffs/ (debug / audit only)
+REVIEW_ARCHIVE_DIFFS = os.getenv("REVIEW_ARCHIVE_DIFFS", "false").lower() == "true"
+# Post each comment as soon as it streams out of the model instead of after the whole review
+REVIEW_EARLY_COMMENTS = os.getenv("REVIEW_EARLY_COMMENTS", "true").lower() == "true"
+
+# Order in which run_pr_review reports its stages
+REVIEW_STAGES = ["pr_details", "git_fetch", "diff", "prefilter", "ai_input", "ai_review", "post_comments"]
+
+
+class ReviewStageError(RuntimeError):
+    """A pipeline stage could not get what it needs from Azure DevOps or git (the review cannot go on)."""
+
+    def __init__(self, stage: str, message: str):
+        super().__init__(message)
+        self.stage = stage
+
+
+# One review per (repository, PR) at a time, so an incremental run sees the commit its predecessor recorded.
+# Weak values: a lock disappears once no review holds or waits on it, instead of one per PR ever reviewed
+_pr_locks = weakref.WeakValueDictionary()
+
+
+def _noop_stage(stage: str, status: str, detail: dict = None):
+    pass
+
+
+async def run_pr_review(pr_id: int, on_stage=None, include_timings: bool = False, incremental: bool = False,
+                        fresh_since: float = None, repo: RepoConfig = None) -> dict:
+    """
+    Full review pipeline for one PR: details → git fetch → in-memory diff →
+    pre-filter (generated / vendored / trivial files) → AI input → concurrent AI review → Azure comments. Blocking steps run in a worker
+    thread. `on_stage(stage, status, detail)` is called as each stage
+    starts ("running") and ends ("done"). Every stage is also timed into
+    the /metrics histograms; `include_timings` adds the per-span breakdown
+    to the result.
+
+    With `incremental`, only the commits pushed since the PR's last
+    successful review are diffed and sent to the model. `fresh_since` lets
+    a bulk run reuse the mirror fetch it already did for all of its PRs.
+
+    `repo` is the registered repository the PR belongs to (default: the
+    default repository); at most its `max_concurrent_reviews` PRs are
+    reviewed at once, so one busy tenant cannot take every worker.
+    """
+    repo = repo or get_repo()
+    on_stage = on_stage or _noop_stage
+    spans = start_request_timings()
+    started = time.perf_counter()
+    try:
+        with git_cancel_scope() as cancel_git:
+            try:
+                # PR lock first: duplicate requests for one PR wait without holding one of the repo's slots
+                async with _pr_locks.setdefault((repo.name, pr_id), asyncio.Lock()), repo.review_slot():
+                    result = await _run_stages(pr_id, on_stage, incremental, fresh_since, repo)
+            except asyncio.CancelledError:
+                # worker threads can't be cancelled, but the git commands they run can
+                cancel_git.set()
+                raise
+    except Exception:
+        inc_counter("pr_review_runs_total", help_text="Completed review pipeline runs", status="error")
+        raise
+    inc_counter("pr_review_runs_total", help_text="Completed review pipeline runs", status="ok")
+    total = time.perf_counter() - started
+    observe("pr_review_seconds", total, "End-to-end review pipeline time")
+
+    if include_timings:
+        result["timings"] = {"total_seconds": round(total, 4), "stages": summarize_spans(spans), "spans": spans}
+    return result
+
+
+async def _run_stages(pr_id: int, on_stage, incremental: bool, fresh_since: float, repo: RepoConfig) -> dict:
+    # Step 1️⃣: Get PR details
+    on_stage("pr_details", "running")
+    with stage_span("pr_details"):
+        pr_details = await asyncio.to_thread(get_pr_details, pr_id, repo)
+    if "error" in pr_details:
+        raise ReviewStageError("pr_details", pr_details["error"])
+    source_branch = pr_details.get("source_branch")
+    target_branch = pr_details.get("target_branch")
+    on_stage("pr_details", "done", {"title": pr_details.get("title")})
+
+    # Step 2️⃣: Get diff summary (list of files), since the last reviewed commit when incremental
+    on_stage("git_fetch", "running")
+    since_commit = await asyncio.to_thread(get_last_reviewed_commit, repo.name, pr_id) if incremental else None
+    with stage_span("git_fetch"):
+        diff_summary = await asyncio.to_thread(
+            get_pr_diff_summary, source_branch, target_branch, pr_id, since_commit, fresh_since, repo
+        )
+    if "error" in diff_summary:
+        raise ReviewStageError("git_fetch", diff_summary["error"])
+    files = diff_summary.get("files", [])
+    head_commit = diff_summary.get("headCommit")
+    reviewed_range = {
+        "incremental": bool(diff_summary.get("incremental")),
+        "from": diff_summary.get("baseRef"),
+        "to": head_commit
+    }
+    on_stage("git_fetch", "done", {"files": len(files), "engine": diff_summary.get("engine"), **reviewed_range})
+
+    if reviewed_range["incremental"] and head_commit == since_commit:
+        for stage in REVIEW_STAGES[REVIEW_STAGES.index("diff"):]:
+            on_stage(stage, "skipped")
+        return {
+            "repo": repo.name,
+            "pr_id": pr_details.get("pr_id"),
+            "title": pr_details.get("title"),
+            "source_branch": source_branch,
+            "target_branch": target_branch,
+            "reviewed_range": reviewed_range,
+            "skipped": "No new commits since the last review",
+            "azure_result": []
+        }
+
+    # Step 3️⃣: One `git diff` for the whole range (or blob-by-blob via the API engine),
+    # parsed into FileDiff objects in memory
+    on_stage("diff", "running")
+    with stage_span("diff", engine=diff_summary.get("engine")):
+        all_diffs = await asyncio.to_thread(get_summary_file_diffs, diff_summary, pr_id)
+    if "error" in all_diffs:
+        raise ReviewStageError("diff", all_diffs["error"])
+    file_diffs = list(all_diffs.values())
+    # New-file line → hunk/text and identifier → lines, used to anchor the model's comments
+    with stage_span("line_index"):
+        line_indexes = build_line_indexes(file_diffs)
+
+    # Step 4️⃣: Optional on-disk copy for debugging / audit
+    if REVIEW_ARCHIVE_DIFFS:
+        await asyncio.to_thread(archive_file_diffs, pr_id, file_diffs, repo.name)
+    on_stage("diff", "done", {"files": len(file_diffs)})
+
+    # Step 4️⃣ (continued): Generated, vendored and whitespace/import-only files never reach the model
+    on_stage("prefilter", "running")
+    with stage_span("prefilter"):
+        gitattributes = await asyncio.to_thread(get_gitattributes, diff_summary)
+        file_diffs, prefilter = prefilter_file_diffs(file_diffs, gitattributes)
+    inc_counter("pr_review_prefilter_skipped_total", len(prefilter["skipped"]), "Files dropped by the pre-filter")
+    inc_counter("pr_review_prefilter_tokens_saved_total", prefilter["estimated_tokens_saved"],
+                "Estimated model input tokens saved by the pre-filter")
+    on_stage("prefilter", "done", {"skipped": len(prefilter["skipped"]),
+                                   "estimated_tokens_saved": prefilter["estimated_tokens_saved"]})
+
+    # Step 5️⃣: Build AI Input JSON
+    on_stage("ai_input", "running")
+    with stage_span("ai_input"):
+        ai_input = build_ai_input(pr_details, file_diffs)
+    on_stage("ai_input", "done", {"files": len(ai_input.get("files", []))})
+
+    # Existing PR threads load while the model works, so streamed comments can be posted right away
+    publisher = EarlyCommentPublisher(pr_id, repo, line_indexes) if REVIEW_EARLY_COMMENTS else None
+    load_existing = asyncio.create_task(asyncio.to_thread(publisher.load_existing)) if publisher else None
+
+    # Files are packed into token-bounded requests and reviewed concurrently;
+    # results come back one per file, in file order
+    on_stage("ai_review", "running", {"files": len(ai_input.get("files", []))})
+    try:
+        with stage_span("ai_review"):
+            ai_reviews = await review_files_packed(ai_input, on_comment=publisher.submit if publisher else None)
+    finally:
+        if load_existing:
+            await load_existing
+    file_paths = [f["file_name"] for f in ai_input.get("files", [])]
+    # Files left unreviewed (budget exhausted, every model down) don't fail the run; they are reported
+    review_status = _review_status(ai_reviews, file_paths)
+    on_stage("ai_review", "done", {"failed": len(review_status["unreviewed_files"]),
+                                   "partial": review_status["partial"]})
+
+    # Step 5️⃣ (continued): Post AI comments to Azure PR
+    on_stage("post_comments", "running")
+    # Existing PR threads are loaded once so re-runs don't post duplicates
+    with stage_span("post_comments"):
+        azure_result = await asyncio.to_thread(post_review_comments, pr_id, ai_reviews, file_paths, publisher, repo,
+                                                 line_indexes)
+    on_stage("post_comments", "done", {"comments": sum(r.get("total_comments", 0) for r in azure_result)})
+
+    # Files whose review failed must be looked at again, so the range only advances on full success
+    if head_commit and not any(_incomplete_review(r) for r in ai_reviews):
+        await asyncio.to_thread(record_reviewed_commit, repo.name, pr_id, head_commit, source_branch)
+
+    result = {
+        "repo": repo.name,
+        "pr_id": pr_details.get("pr_id"),
+        "title": pr_details.get("title"),
+        "source_branch": source_branch,
+        "target_branch": target_branch,
+        "reviewed_range": reviewed_range,
+        "prefilter": prefilter,
+        "review_status": review_status,
+        # "diff_summary": diff_summary,
+        # "ai_input": ai_input,
+        # "ai_review": ai_review,   → stored; GET /pr/reviews/{review_id}
+        "azure_result": azure_result
+    }
+
+    # Keep the model's file reviews so past results can be read back without re-running anything;
+    # the comments are already on the PR, so a store failure must not fail the run
+    try:
+        with stage_span("store_review"):
+            result["review_id"] = await asyncio.to_thread(save_review_run, repo.name, pr_id, result,
+                                                          ai_reviews, file_paths)
+    except Exception as e:
+        print(f"⚠️ Could not store review of PR {pr_id} -->", e)
+    return result
+
+
+def _incomplete_review(review: dict):
+    """Why (part of) a file went unreviewed, or None when the whole file was reviewed."""
+    return review.get("error") or review.get("partial_error") or (
+        review.get("stream_interrupted") and "Model stream broke off before the review was complete")
+
+
+def _review_status(ai_reviews: list, file_paths: list) -> dict:
+    """
+    Which files the model did not (fully) review (budget ran out, every
+    model failed, some chunks of a split file failed) and which were
+    reviewed by a fallback model. A partial run still posts and returns
+    what was reviewed.
+    """
+    unreviewed, fallbacks = [], {}
+    for file_path, review in zip(file_paths, ai_reviews):
+        error = _incomplete_review(review)
+        if error:
+            unreviewed.append({"file": file_path, "error": error,
+                               "budget_exhausted": bool(review.get("budget_exhausted"))})
+        elif review.get("fallback_model"):
+            fallbacks[file_path] = review["fallback_model"]
+    return {
+        "partial": bool(unreviewed),
+        "budget_exhausted": any(entry["budget_exhausted"] for entry in unreviewed),
+        "unreviewed_files": unreviewed,
+        "fallback_models": fallbacks
+    }
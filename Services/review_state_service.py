@@ -0,0 +1,95 @@
+import os
+import time
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REVIEW_STATE_PATH = os.getenv("REVIEW_STATE_PATH", os.path.join(os.getcwd(), "local_repo", "review_state.sqlite3"))
+# Registry name that state recorded by single-repository versions belongs to (its AZURE_REPO_ID)
+REVIEW_STATE_LEGACY_REPO = os.getenv("REVIEW_STATE_LEGACY_REPO", os.getenv("AZURE_REPO_ID", ""))
+
+_lock = threading.Lock()
+_initialized = False
+
+
+def _connect() -> sqlite3.Connection:
+    global _initialized
+    if not _initialized:
+        os.makedirs(os.path.dirname(REVIEW_STATE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(REVIEW_STATE_PATH, timeout=10)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS repo_pr_review_state (
+                repo            TEXT NOT NULL,
+                pr_id           INTEGER NOT NULL,
+                last_commit     TEXT NOT NULL,
+                source_branch   TEXT,
+                review_count    INTEGER NOT NULL DEFAULT 0,
+                updated_at      REAL NOT NULL,
+                PRIMARY KEY (repo, pr_id)
+            )
+        """)
+        _migrate_single_repo_state(conn)
+        conn.commit()
+        _initialized = True
+    return conn
+
+
+def _migrate_single_repo_state(conn: sqlite3.Connection):
+    """Rows from the single-repository table (keyed by PR only) move under REVIEW_STATE_LEGACY_REPO."""
+    legacy = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'pr_review_state'").fetchone()
+    if legacy and REVIEW_STATE_LEGACY_REPO:
+        conn.execute(
+            "INSERT OR IGNORE INTO repo_pr_review_state "
+            "SELECT ?, pr_id, last_commit, source_branch, review_count, updated_at FROM pr_review_state",
+            (REVIEW_STATE_LEGACY_REPO,)
+        )
+        conn.execute("DROP TABLE pr_review_state")
+
+
+# =========================================================
+# 🔹 Last reviewed source commit per (repository, PR)
+# =========================================================
+def get_review_state(repo: str, pr_id: int):
+    """{repo, pr_id, last_commit, source_branch, review_count, updated_at} or None if never reviewed."""
+    with _lock:
+        conn = _connect()
+        try:
+            row = conn.execute(
+                "SELECT last_commit, source_branch, review_count, updated_at FROM repo_pr_review_state "
+                "WHERE repo = ? AND pr_id = ?",
+                (repo, pr_id)
+            ).fetchone()
+        finally:
+            conn.close()
+
+    if row is None:
+        return None
+    return {"repo": repo, "pr_id": pr_id, "last_commit": row[0], "source_branch": row[1],
+            "review_count": row[2], "updated_at": row[3]}
+
+
+def get_last_reviewed_commit(repo: str, pr_id: int):
+    state = get_review_state(repo, pr_id)
+    return state["last_commit"] if state else None
+
+
+def record_reviewed_commit(repo: str, pr_id: int, commit_id: str, source_branch: str = None):
+    """Mark `commit_id` as the newest source commit whose changes have been reviewed."""
+    with _lock:
+        conn = _connect()
+        try:
+            conn.execute(
+                "INSERT INTO repo_pr_review_state (repo, pr_id, last_commit, source_branch, review_count, updated_at) "
+                "VALUES (?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT(repo, pr_id) DO UPDATE SET last_commit = excluded.last_commit, "
+                "source_branch = excluded.source_branch, review_count = review_count + 1, "
+                "updated_at = excluded.updated_at",
+                (repo, pr_id, commit_id, source_branch, time.time())
+            )
+            conn.commit()
+        finally:
+            conn.close()
@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import uuid
+import zlib
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REVIEW_STORE_ENABLED = os.getenv("REVIEW_STORE_ENABLED", "true").lower() == "true"
+REVIEW_STORE_PATH = os.getenv("REVIEW_STORE_PATH", os.path.join(os.getcwd(), "local_repo", "review_results.sqlite3"))
+# Runs older than this are deleted when a new one is stored (0 = keep everything)
+REVIEW_STORE_RETENTION_DAYS = float(os.getenv("REVIEW_STORE_RETENTION_DAYS", "0"))
+
+_lock = threading.Lock()
+_initialized = False
+
+
+def _connect() -> sqlite3.Connection:
+    global _initialized
+    if not _initialized:
+        os.makedirs(os.path.dirname(REVIEW_STORE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(REVIEW_STORE_PATH, timeout=10)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS review_runs (
+                run_id          TEXT PRIMARY KEY,
+                repo            TEXT NOT NULL,
+                pr_id           INTEGER NOT NULL,
+                head_commit     TEXT,
+                base_commit     TEXT,
+                incremental     INTEGER NOT NULL DEFAULT 0,
+                title           TEXT,
+                created_at      REAL NOT NULL,
+                files_reviewed  INTEGER NOT NULL DEFAULT 0,
+                files_failed    INTEGER NOT NULL DEFAULT 0,
+                comments        INTEGER NOT NULL DEFAULT 0,
+                avg_score       REAL,
+                result_blob     BLOB NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS review_files (
+                run_id       TEXT NOT NULL,
+                repo         TEXT NOT NULL,
+                pr_id        INTEGER NOT NULL,
+                head_commit  TEXT,
+                file_path    TEXT NOT NULL,
+                created_at   REAL NOT NULL,
+                score        INTEGER,
+                comments     INTEGER NOT NULL DEFAULT 0,
+                review_blob  BLOB NOT NULL,
+                PRIMARY KEY (run_id, file_path)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_review_runs_pr ON review_runs(repo, pr_id, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_review_runs_commit ON review_runs(repo, head_commit)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_review_files_path ON review_files(repo, file_path, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_review_files_pr ON review_files(repo, pr_id, file_path)")
+        conn.commit()
+        _initialized = True
+    return conn
+
+
+def _pack(value) -> bytes:
+    """Compact JSON, zlib-compressed: reviews are mostly repetitive English text."""
+    return zlib.compress(json.dumps(value, separators=(",", ":"), default=str).encode("utf-8"))
+
+
+def _unpack(blob: bytes):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+def _score(review: dict):
+    score = review.get("code_quality_score")
+    return score if isinstance(score, int) and not isinstance(score, bool) else None
+
+
+_RUN_COLUMNS = ("run_id", "repo", "pr_id", "head_commit", "base_commit", "incremental", "title", "created_at",
+                "files_reviewed", "files_failed", "comments", "avg_score")
+
+
+def _run_summary(row) -> dict:
+    summary = dict(zip(_RUN_COLUMNS, row))
+    summary["incremental"] = bool(summary["incremental"])
+    return summary
+
+
+# =========================================================
+# 🔹 Writing a finished review
+# =========================================================
+def save_review_run(repo: str, pr_id: int, result: dict, ai_reviews: list, file_paths: list):
+    """
+    Persist one pipeline run: the response (`result`, timings excluded) and
+    every file's model review, indexed by (repo, PR), head commit and file.
+    Returns the run id, or None when the store is disabled.
+    """
+    if not REVIEW_STORE_ENABLED:
+        return None
+
+    run_id = uuid.uuid4().hex
+    now = time.time()
+    reviewed_range = result.get("reviewed_range") or {}
+    head_commit = reviewed_range.get("to")
+    file_rows = []
+    for index, review in enumerate(ai_reviews):
+        file_path = file_paths[index] if index < len(file_paths) else review.get("filePath")
+        file_rows.append((run_id, repo, pr_id, head_commit, file_path, now, _score(review),
+                          len(review.get("comments") or []), _pack(review)))
+    scores = [row[6] for row in file_rows if row[6] is not None]
+    stored = {key: value for key, value in result.items() if key != "timings"}
+
+    with _lock:
+        conn = _connect()
+        try:
+            conn.execute(
+                f"INSERT INTO review_runs ({', '.join(_RUN_COLUMNS)}, result_blob) "
+                f"VALUES ({', '.join('?' for _ in _RUN_COLUMNS)}, ?)",
+                (run_id, repo, pr_id, head_commit, reviewed_range.get("from"),
+                 int(bool(reviewed_range.get("incremental"))), result.get("title"), now,
+                 len(file_rows), sum(1 for review in ai_reviews if "error" in review),
+                 sum(row[7] for row in file_rows), round(sum(scores) / len(scores), 2) if scores else None,
+                 _pack(stored))
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO review_files (run_id, repo, pr_id, head_commit, file_path, created_at, "
+                "score, comments, review_blob) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                file_rows
+            )
+            if REVIEW_STORE_RETENTION_DAYS > 0:
+                cutoff = now - REVIEW_STORE_RETENTION_DAYS * 86400
+                conn.execute("DELETE FROM review_files WHERE created_at < ?", (cutoff,))
+                conn.execute("DELETE FROM review_runs WHERE created_at < ?", (cutoff,))
+            conn.commit()
+        finally:
+            conn.close()
+    return run_id
+
+
+# =========================================================
+# 🔹 Queries (no git, no model)
+# =========================================================
+def _file_reviews(conn: sqlite3.Connection, run_id: str, file_path: str = None) -> list:
+    query = "SELECT file_path, score, comments, review_blob FROM review_files WHERE run_id = ?"
+    params = [run_id]
+    if file_path:
+        query += " AND file_path = ?"
+        params.append(file_path)
+    rows = conn.execute(query + " ORDER BY rowid", params).fetchall()
+    return [{"file_path": row[0], "score": row[1], "comments": row[2], "review": _unpack(row[3])} for row in rows]
+
+
+def _load_run(conn: sqlite3.Connection, where: str, params: tuple, file_path: str = None):
+    row = conn.execute(
+        f"SELECT {', '.join(_RUN_COLUMNS)}, result_blob FROM review_runs WHERE {where} "
+        "ORDER BY created_at DESC LIMIT 1",
+        params
+    ).fetchone()
+    if row is None:
+        return None
+    run = _run_summary(row[:-1])
+    run["result"] = _unpack(row[-1])
+    run["files"] = _file_reviews(conn, run["run_id"], file_path)
+    return run
+
+
+def get_review_run(run_id: str, file_path: str = None):
+    """One stored run with its response and file reviews (optionally just `file_path`), or None."""
+    with _lock:
+        conn = _connect()
+        try:
+            return _load_run(conn, "run_id = ?", (run_id,), file_path)
+        finally:
+            conn.close()
+
+
+def get_latest_review(repo: str, pr_id: int, commit: str = None, file_path: str = None):
+    """Newest stored run of a PR, optionally the one that reviewed `commit` (full SHA or a prefix)."""
+    where, params = "repo = ? AND pr_id = ?", [repo, pr_id]
+    if commit:
+        where += " AND head_commit LIKE ?"
+        params.append(commit.replace("%", "").replace("_", "") + "%")
+    with _lock:
+        conn = _connect()
+        try:
+            return _load_run(conn, where, tuple(params), file_path)
+        finally:
+            conn.close()
+
+
+def list_review_runs(repo: str, pr_id: int, limit: int = 50) -> list:
+    """Run summaries of a PR, newest first (no review bodies)."""
+    with _lock:
+        conn = _connect()
+        try:
+            rows = conn.execute(
+                f"SELECT {', '.join(_RUN_COLUMNS)} FROM review_runs WHERE repo = ? AND pr_id = ? "
+                "ORDER BY created_at DESC LIMIT ?",
+                (repo, pr_id, limit)
+            ).fetchall()
+        finally:
+            conn.close()
+    return [_run_summary(row) for row in rows]
+
+
+def get_score_trend(repo: str, pr_id: int = None, file_path: str = None, limit: int = 100) -> dict:
+    """
+    Code-quality scores over time, oldest first: one point per run (average
+    over its files) or, with `file_path`, one point per review of that file.
+    Either can be narrowed to one PR.
+    """
+    if file_path:
+        query = ("SELECT run_id, pr_id, head_commit, created_at, score, comments FROM review_files "
+                 "WHERE repo = ? AND file_path = ?")
+        params = [repo, file_path]
+    else:
+        query = ("SELECT run_id, pr_id, head_commit, created_at, avg_score, comments FROM review_runs "
+                 "WHERE repo = ?")
+        params = [repo]
+    if pr_id is not None:
+        query += " AND pr_id = ?"
+        params.append(pr_id)
+    query += " ORDER BY created_at DESC LIMIT ?"
+    params.append(limit)
+
+    with _lock:
+        conn = _connect()
+        try:
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+    points = [{"run_id": row[0], "pr_id": row[1], "head_commit": row[2], "created_at": row[3],
+               "score": row[4], "comments": row[5]} for row in reversed(rows)]
+    scores = [point["score"] for point in points if point["score"] is not None]
+    return {
+        "repo": repo,
+        "pr_id": pr_id,
+        "file_path": file_path,
+        "points": points,
+        "average": round(sum(scores) / len(scores), 2) if scores else None,
+        "change": round(scores[-1] - scores[0], 2) if len(scores) > 1 else None
+    }
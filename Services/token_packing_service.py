@@ -0,0 +1,250 @@
+import os
+import re
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    import tiktoken
+except ImportError:  # falls back to a ~4 chars/token estimate
+    tiktoken = None
+
+AI_REQUEST_TOKEN_BUDGET = int(os.getenv("AI_REQUEST_TOKEN_BUDGET", "6000"))
+AI_CHUNK_OVERLAP_LINES = int(os.getenv("AI_CHUNK_OVERLAP_LINES", "3"))
+AI_MAX_FILES_PER_REQUEST = int(os.getenv("AI_MAX_FILES_PER_REQUEST", "8"))
+
+# Headings / separators added around each section in the user message
+SECTION_OVERHEAD_TOKENS = 16
+
+_NUMBERED_LINE_RE = re.compile(r"^(\d+): ")
+_encoders = {}
+
+
+# =========================================================
+# 🔹 Token counting
+# =========================================================
+def _encoder(model: str):
+    if tiktoken is None:
+        return None
+    if model not in _encoders:
+        try:
+            try:
+                _encoders[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encoders[model] = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            # BPE files are downloaded on first use; offline hosts fall back to the estimate
+            print("⚠️ tiktoken encoding unavailable, estimating tokens -->", e)
+            _encoders[model] = None
+    return _encoders[model]
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    encoder = _encoder(model)
+    if encoder is None:
+        return len(text) // 4 + 1
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+# =========================================================
+# 🔹 Splitting oversized diffs on hunk boundaries
+# =========================================================
+def split_into_hunks(new_code: str) -> list:
+    """
+    Split line-numbered code ("0042: ...") into hunks; a jump in line
+    numbers marks the start of a new hunk.
+    """
+    hunks, current, previous = [], [], None
+    for line in new_code.splitlines():
+        match = _NUMBERED_LINE_RE.match(line)
+        number = int(match.group(1)) if match else None
+        if current and number is not None and previous is not None and number != previous + 1:
+            hunks.append(current)
+            current = []
+        current.append(line)
+        if number is not None:
+            previous = number
+    if current:
+        hunks.append(current)
+    return hunks
+
+
+def _split_lines(lines: list, budget: int, model: str) -> list:
+    """Last resort for a single hunk over budget: cut it into line windows."""
+    pieces, current, current_tokens = [], [], 0
+    for line in lines:
+        line_tokens = count_tokens(line, model) + 1
+        if current and current_tokens + line_tokens > budget:
+            pieces.append(current)
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_code(new_code: str, budget: int, model: str = "gpt-4o-mini",
+               overlap_lines: int = AI_CHUNK_OVERLAP_LINES) -> list:
+    """
+    Split one file's numbered code into chunks of at most ~budget tokens,
+    cutting on hunk boundaries and repeating `overlap_lines` lines of the
+    previous chunk at the top of the next for context.
+    """
+    if count_tokens(new_code, model) <= budget:
+        return [new_code]
+
+    units = []
+    for hunk in split_into_hunks(new_code):
+        if count_tokens("\n".join(hunk), model) > budget:
+            units.extend(_split_lines(hunk, budget, model))
+        else:
+            units.append(hunk)
+
+    chunks, current, current_tokens = [], [], 0
+    for unit in units:
+        unit_tokens = count_tokens("\n".join(unit), model) + 1
+        if current and current_tokens + unit_tokens > budget:
+            chunks.append(current)
+            overlap = current[-overlap_lines:] if overlap_lines else []
+            current = list(overlap)
+            current_tokens = count_tokens("\n".join(current), model) if current else 0
+        current.extend(unit)
+        current_tokens += unit_tokens
+    if current:
+        chunks.append(current)
+
+    return ["\n".join(chunk) for chunk in chunks]
+
+
+# =========================================================
+# 🔹 Packing sections into requests
+# =========================================================
+def pack_files(files: list, budget: int = None, model: str = "gpt-4o-mini",
+               max_files_per_request: int = AI_MAX_FILES_PER_REQUEST) -> list:
+    """
+    Turn [{"file_name", "new_code"}] into request batches. Oversized files
+    are split; small sections are bin-packed (first-fit decreasing) so each
+    batch stays under `budget` code tokens.
+
+    Each batch is a list of sections:
+        {"file_name", "new_code", "part", "parts", "tokens"}
+    """
+    budget = budget or AI_REQUEST_TOKEN_BUDGET
+    section_budget = max(budget - SECTION_OVERHEAD_TOKENS, 1)
+
+    sections = []
+    for file in files:
+        chunks = split_code(file["new_code"], section_budget, model)
+        for part, chunk in enumerate(chunks, start=1):
+            sections.append({
+                "file_name": file["file_name"],
+                "new_code": chunk,
+                "part": part,
+                "parts": len(chunks),
+                "tokens": count_tokens(chunk, model) + SECTION_OVERHEAD_TOKENS
+            })
+
+    # A split file's parts each fill most of a request; only whole files share
+    bins = []
+    for section in sorted(sections, key=lambda s: s["tokens"], reverse=True):
+        target = None
+        if section["parts"] == 1:
+            for candidate in bins:
+                if (candidate["shareable"] and len(candidate["sections"]) < max_files_per_request
+                        and candidate["tokens"] + section["tokens"] <= budget):
+                    target = candidate
+                    break
+        if target is None:
+            target = {"sections": [], "tokens": 0, "shareable": section["parts"] == 1}
+            bins.append(target)
+        target["sections"].append(section)
+        target["tokens"] += section["tokens"]
+
+    # Deterministic order: by position of each batch's first file in the input
+    order = {file["file_name"]: index for index, file in enumerate(files)}
+    batches = [sorted(b["sections"], key=lambda s: (order[s["file_name"]], s["part"])) for b in bins]
+    batches.sort(key=lambda batch: (order[batch[0]["file_name"]], batch[0]["part"]))
+    return batches
+
+
+# =========================================================
+# 🔹 Mapping batch output back to files
+# =========================================================
+def _normalize_path(path: str) -> str:
+    return (path or "").strip().lstrip("/").lower()
+
+
+def split_batch_review(batch: list, review: dict) -> dict:
+    """
+    Map a multi-section review ({"files": [...]}) back onto the batch's
+    sections. Returns {(file_name, part): review}.
+    """
+    if "error" in review:
+        return {(s["file_name"], s["part"]): review for s in batch}
+
+    if len(batch) == 1 and "files" not in review:
+        return {(batch[0]["file_name"], batch[0]["part"]): review}
+
+    by_path = {}
+    for entry in review.get("files", []):
+        by_path.setdefault(_normalize_path(entry.get("filePath")), []).append(entry)
+
+    mapped = {}
+    for section in batch:
+        entries = by_path.get(_normalize_path(section["file_name"]), [])
+        if entries:
+            mapped[(section["file_name"], section["part"])] = entries.pop(0)
+        else:
+            mapped[(section["file_name"], section["part"])] = {
+                "filePath": section["file_name"],
+                "error": "Model response had no section for this file"
+            }
+    return mapped
+
+
+def _unique_comments(comments) -> list:
+    """Chunks overlap by a few lines, so the same comment can come back twice."""
+    seen, unique = set(), []
+    for comment in comments:
+        key = (comment.get("line_number"), (comment.get("comment") or "").strip())
+        if key not in seen:
+            seen.add(key)
+            unique.append(comment)
+    return unique
+
+
+def merge_file_reviews(file_name: str, part_reviews: list) -> dict:
+    """Combine the reviews of one file's chunks into a single review dict."""
+    if len(part_reviews) == 1:
+        review = dict(part_reviews[0])
+        review.setdefault("filePath", file_name)
+        return review
+
+    ok = [r for r in part_reviews if "error" not in r]
+    if not ok:
+        failed = {"filePath": file_name, "error": part_reviews[0].get("error")}
+        if any(r.get("budget_exhausted") for r in part_reviews):
+            failed["budget_exhausted"] = True
+        return failed
+
+    scores = [r["code_quality_score"] for r in ok if isinstance(r.get("code_quality_score"), (int, float))]
+    merged = {
+        "filePath": file_name,
+        "summary": " ".join(r.get("summary", "") for r in ok).strip(),
+        "issues": [i for r in ok for i in r.get("issues", [])],
+        "recommendations": [i for r in ok for i in r.get("recommendations", [])],
+        "comments": _unique_comments(c for r in ok for c in r.get("comments", [])),
+        "code_quality_score": round(sum(scores) / len(scores)) if scores else None
+    }
+    for flag in ("json_repaired", "max_tokens_reached", "stream_interrupted"):
+        if any(r.get(flag) for r in ok):
+            merged[flag] = True
+    fallback_models = sorted({r["fallback_model"] for r in ok if r.get("fallback_model")})
+    if fallback_models:
+        merged["fallback_model"] = ", ".join(fallback_models)
+    if len(ok) < len(part_reviews):
+        merged["partial_error"] = f"{len(part_reviews) - len(ok)} of {len(part_reviews)} parts failed"
+        if any(r.get("budget_exhausted") for r in part_reviews):
+            merged["budget_exhausted"] = True
+    return merged
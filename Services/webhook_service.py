@@ -0,0 +1,58 @@
+import os
+import hmac
+from dotenv import load_dotenv
+from Services.review_state_service import get_last_reviewed_commit
+from Services.repo_registry_service import find_repo_for_event
+
+load_dotenv()
+
+# Shared secret sent by the Azure service hook as an `X-Webhook-Secret` header (unset → every call is rejected)
+AZURE_WEBHOOK_SECRET = os.getenv("AZURE_WEBHOOK_SECRET")
+# Explicit opt-out for trusted networks: accept webhook calls without a secret when none is configured
+AZURE_WEBHOOK_ALLOW_UNSIGNED = os.getenv("AZURE_WEBHOOK_ALLOW_UNSIGNED", "false").lower() == "true"
+
+PR_EVENT_TYPES = ("git.pullrequest.created", "git.pullrequest.updated")
+
+
+def verify_webhook_secret(received: str) -> bool:
+    """Fails closed: without AZURE_WEBHOOK_SECRET only AZURE_WEBHOOK_ALLOW_UNSIGNED lets calls through."""
+    if not AZURE_WEBHOOK_SECRET:
+        return AZURE_WEBHOOK_ALLOW_UNSIGNED
+    return hmac.compare_digest((received or "").encode("utf-8"), AZURE_WEBHOOK_SECRET.encode("utf-8"))
+
+
+def parse_pr_event(payload: dict) -> dict:
+    """
+    Reduce an Azure DevOps service-hook payload to
+    {repo, pr_id, head_commit, event_type, ignored, reason}, where repo is the
+    registry name of the repository the PR belongs to. Events that cannot
+    bring new code to review (unregistered repos, closed PRs, reviewer/vote
+    updates whose head was already reviewed) come back with ignored=True.
+    Reads the review state database, so async callers run it in a thread.
+    """
+    event_type = payload.get("eventType")
+    resource = payload.get("resource") or {}
+    repository = resource.get("repository") or {}
+    repo = find_repo_for_event(repository)
+    event = {
+        "repo": repo.name if repo else None,
+        "pr_id": resource.get("pullRequestId"),
+        "head_commit": (resource.get("lastMergeSourceCommit") or {}).get("commitId"),
+        "event_type": event_type,
+        "ignored": True,
+        "reason": None
+    }
+
+    if event_type not in PR_EVENT_TYPES:
+        event["reason"] = f"Unsupported event type {event_type!r}"
+    elif not event["pr_id"]:
+        event["reason"] = "Payload has no pullRequestId"
+    elif repo is None:
+        event["reason"] = f"Repository {repository.get('name') or repository.get('id')!r} is not registered"
+    elif resource.get("status", "active") != "active":
+        event["reason"] = f"Pull request is {resource.get('status')}"
+    elif event["head_commit"] and event["head_commit"] == get_last_reviewed_commit(repo.name, event["pr_id"]):
+        event["reason"] = "Source commit already reviewed"
+    else:
+        event["ignored"] = False
+    return event
@@ -1,6 +1,9 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from Route import pr_review   # 👈 folder name should be lowercase
+from Services.job_service import stop_job_workers
+from Services.metrics_service import render_prometheus
 
 app = FastAPI(title="AI PR Review Agent")
 
@@ -18,6 +21,16 @@ app.add_middleware(
 def health_check():
     return {"status": "ok"}
 
+# ✅ Prometheus scrape endpoint (stage latencies, tokens, retries, cache hits)
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+# ✅ Stop background review workers on shutdown
+@app.on_event("shutdown")
+async def shutdown_workers():
+    await stop_job_workers()
+
 # ✅ Include PR Review route
 app.include_router(pr_review.router)
 